@@ -0,0 +1,54 @@
+"""
+Deferred imports of heavy processing backends.
+Machine-learning libraries (torch, tensorflow, kornia, sklearn) take seconds
+to import, so operations never import them at module level. An operation
+registered with backends=("torch",) is offered in the tabs when the library
+is installed, which find_spec() tells without importing it, and calls
+load("torch") in its implementation; the first call imports the module and
+later calls return it from a cache. warm_up() imports backends ahead of
+time, e.g. on a background thread once the window is shown.
+"""
+import importlib
+import importlib.util
+import threading
+import time
+
+_lock = threading.Lock()
+_modules = {}
+
+# Seconds spent importing each backend, for diagnostics
+import_times = {}
+
+
+def installed(name):
+    """True when the backend can be imported, without importing it"""
+    if name in _modules:
+        return True
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def load(name):
+    """The backend module, imported on first use"""
+    module = _modules.get(name)
+    if module is None:
+        with _lock:
+            module = _modules.get(name)
+            if module is None:
+                started = time.perf_counter()
+                module = importlib.import_module(name)
+                import_times[name] = time.perf_counter() - started
+                _modules[name] = module
+    return module
+
+
+def warm_up(names):
+    """Import every installed backend in names; failures are left for first use"""
+    for name in names:
+        if installed(name):
+            try:
+                load(name)
+            except Exception:
+                pass
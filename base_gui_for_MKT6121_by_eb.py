@@ -1,12 +1,98 @@
-import sys, cv2, os
+import sys, cv2, os, time, threading
+from functools import partial
+from itertools import count
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QLabel, 
                            QPushButton, QVBoxLayout, QHBoxLayout, QTabWidget,
                            QFileDialog, QCheckBox, QComboBox, QScrollArea,
                            QGroupBox, QGridLayout, QSpinBox, QDoubleSpinBox,
-                           QStatusBar, QMessageBox)
+                           QStatusBar, QMessageBox, QDialog, QDialogButtonBox,
+                           QFormLayout, QDockWidget, QTableWidget, QTableWidgetItem,
+                           QHeaderView, QInputDialog)
 from PyQt6.QtCore import Qt, QTimer
-from PyQt6.QtGui import QImage, QPixmap, QIcon
-import numpy as np
+from PyQt6.QtGui import QValidator
+from capture import FrameGrabber
+from processing_engine import ProcessingEngine
+from pipeline import Pipeline, get_operation, warm_up_operations
+from history import HistoryStore, MB
+from stage_cache import StageCache
+from display import ImageDisplay
+from tiles import TiledImageView
+from video_export import VideoExportJob
+from image_export import ExportOptions, ImageExportJob
+from image_loader import is_mapped, load_image as read_image
+from profiling import PROFILER
+from pacing import FramePacer, QualityController, source_fps
+from tiling import TILED
+from sources import Source
+from source_grid import SourceGrid
+
+# On video, adaptive lookup tables (equalization, stretching) are rebuilt
+# every N frames instead of on every frame
+VIDEO_LUT_REFRESH_INTERVAL = 5
+
+# On video, SIFT/SURF/ORB detect keypoints at least every N frames and track
+# them with optical flow in between
+FEATURE_KEYFRAME_INTERVAL = 30
+
+# Undo history limits: compressed snapshots in RAM, older ones spill to disk
+HISTORY_BUDGET_MB = 256
+HISTORY_SPILL_MB = 1024
+
+# Memory for intermediate results of still images, so a parameter change
+# only reruns the operations from the changed one onwards
+STAGE_CACHE_MB = 512
+
+# Filters and morphology on large images run in tiles of this many pixels
+# on TILE_WORKERS threads (0 = one per core, 1 = no tiling)
+TILE_SIZE = 512
+TILE_WORKERS = 0
+
+# Captions of the multi-source grid are refreshed this often
+SOURCE_STATS_INTERVAL_MS = 500
+
+# Live Preview on a proxy is replaced by the full-resolution result once
+# the parameters have not changed for this long
+FULL_RENDER_IDLE_MS = 300
+
+# Milliseconds after the window is shown before the unopened method tabs
+# are built and the operation backends imported in the background
+# (None = build tabs on first activation and import backends on first use)
+WARM_UP_DELAY_MS = 250
+
+# Zoom steps of the tiled viewer
+ZOOM_STEP = 1.25
+MAX_ZOOM = 16.0
+
+class OddSpinBox(QSpinBox):
+    """Spin box for odd-only parameters such as kernel sizes"""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setSingleStep(2)
+
+    def validate(self, text, pos):
+        # An even value is incomplete input; fixup() snaps it when editing ends
+        state, text, pos = super().validate(text, pos)
+        if state == QValidator.State.Acceptable and self.valueFromText(text) % 2 == 0:
+            state = QValidator.State.Intermediate
+        return state, text, pos
+
+    def fixup(self, text):
+        try:
+            value = int(text.strip())
+        except ValueError:
+            return text
+        return str(self.snap(value))
+
+    def snap(self, value):
+        """Nearest odd value in range, rounding up unless that leaves the range"""
+        value = min(max(value, self.minimum()), self.maximum())
+        if value % 2 == 0:
+            value = value + 1 if value < self.maximum() else value - 1
+        return value
+
+    def setValue(self, value):
+        super().setValue(self.snap(value))
+
 
 class ImageProcessingGUI(QMainWindow):
     """
@@ -35,17 +121,61 @@ class ImageProcessingGUI(QMainWindow):
         self.create_method_tabs()
         self.create_control_panel()
         self.create_status_bar()
+        self.create_performance_dock()
+        self.create_sources_dock()
         
         # Initialize state variables
         self.current_image = None
         self.processed_image = None
+        self.processed_is_proxy = False
+        # The full-resolution render a save is waiting for, if any
+        self.pending_save = None
         self.video_capture = None
-        self.processing_history = []
+        self.frame_grabber = None
+        self.video_path = None
+        self.frame_pacer = None
+        self.sources = []
+        self.quality_controller = None
+        self.capture_size = None
+        self.preview_scale = 1.0
+        self.last_processing_time = 0.0
+        self.export_job = None
+        self.image_export_job = None
+        self.export_options = ExportOptions()
+        self.processing_history = HistoryStore(HISTORY_BUDGET_MB * MB,
+                                               spill_budget_bytes=HISTORY_SPILL_MB * MB)
+        self.pipeline = Pipeline()
+        self.compiled_pipeline = self.pipeline.compile()
+        self.stage_cache = StageCache(STAGE_CACHE_MB * MB)
+        self.image_token = 0
+        TILED.configure(TILE_SIZE, TILE_WORKERS)
         
         # Setup video/webcam timer
         self.timer = QTimer()
         self.timer.timeout.connect(self.update_frame)
         
+        # Multiple sources share one polling timer and one worker pool
+        self.sources_timer = QTimer()
+        self.sources_timer.timeout.connect(self.update_sources)
+        self.source_stats_timer = QTimer()
+        self.source_stats_timer.timeout.connect(self.update_source_stats)
+        
+        # Polls background exports for progress
+        self.export_timer = QTimer()
+        self.export_timer.timeout.connect(self.update_export_progress)
+        self.image_export_timer = QTimer()
+        self.image_export_timer.timeout.connect(self.update_image_export_progress)
+        
+        # Full-resolution render after proxy previews of a still image
+        self.full_render_timer = QTimer()
+        self.full_render_timer.setSingleShot(True)
+        self.full_render_timer.timeout.connect(self.render_full)
+        
+        # Processing runs on a worker pool, results come back as signals
+        self.processing_engine = ProcessingEngine(parent=self)
+        self.processing_engine.finished.connect(self.on_processing_finished)
+        self.processing_engine.failed.connect(self.on_processing_failed)
+        
     def create_menu_bar(self):
         """Create the menu bar with File, Edit, View, and Help menus"""
         menubar = self.menuBar()
@@ -57,13 +187,21 @@ class ImageProcessingGUI(QMainWindow):
             ("Open Video", self.open_video),
             ("Save Result", self.save_result),
             ("Export History", self.export_history),
+            ("Export Video", self.export_video),
+            ("Export Options", self.edit_export_options),
+            ("Cancel Export", self.cancel_export),
+            ("Save Pipeline", self.save_pipeline),
+            ("Load Pipeline", self.load_pipeline),
             ("Exit", self.close)
         ]
         for text, slot in actions:
             action = file_menu.addAction(text)
             action.triggered.connect(slot)
             
-        # Add other menus (Edit, View, Help) as needed
+        # View menu
+        self.view_menu = menubar.addMenu("View")
+        
+        # Add other menus (Edit, Help) as needed
         
     def create_toolbar(self):
         """Create the toolbar with quick access buttons"""
@@ -77,6 +215,7 @@ class ImageProcessingGUI(QMainWindow):
         toolbar.addSeparator()
         self.add_toolbar_button(toolbar, "Zoom In", self.zoom_in)
         self.add_toolbar_button(toolbar, "Zoom Out", self.zoom_out)
+        self.add_toolbar_button(toolbar, "Fit", self.zoom_fit)
         
     def create_input_section(self):
         """Create the input source selection section"""
@@ -85,7 +224,7 @@ class ImageProcessingGUI(QMainWindow):
         
         # Source selection combo
         self.source_combo = QComboBox()
-        self.source_combo.addItems(["Single Image", "Video File", "Webcam"])
+        self.source_combo.addItems(["Single Image", "Video File", "Webcam", "Multiple Sources"])
         self.source_combo.currentTextChanged.connect(self.change_source)
         
         # Source selection button
@@ -105,6 +244,16 @@ class ImageProcessingGUI(QMainWindow):
         input_layout.addWidget(QLabel("Resolution:"))
         input_layout.addWidget(self.resolution_combo)
         
+        # Adaptive quality for webcams: lower the preview scale, and optionally
+        # the capture resolution, when frames take longer than the frame period
+        self.hold_fps_checkbox = QCheckBox("Hold FPS")
+        self.hold_fps_checkbox.setChecked(True)
+        self.hold_fps_checkbox.setVisible(False)
+        self.lower_resolution_checkbox = QCheckBox("Lower Resolution")
+        self.lower_resolution_checkbox.setVisible(False)
+        input_layout.addWidget(self.hold_fps_checkbox)
+        input_layout.addWidget(self.lower_resolution_checkbox)
+        
         input_group.setLayout(input_layout)
         self.main_layout.addWidget(input_group)
         
@@ -140,26 +289,75 @@ class ImageProcessingGUI(QMainWindow):
         display_layout.addWidget(output_group)
         self.main_layout.addLayout(display_layout)
         
+        # One display pipeline (staging buffer, repaint cache) per label
+        self.image_displays = {
+            self.input_image_label: ImageDisplay(self.input_image_label),
+            self.output_image_label: ImageDisplay(self.output_image_label),
+        }
+        
+        # Zoomed views replace the labels inside the scroll areas
+        self.zoom_factor = None
+        self.zoom_panes = [
+            (self.input_scroll, self.input_image_label, TiledImageView()),
+            (self.output_scroll, self.output_image_label, TiledImageView()),
+        ]
+        self.tiled_views = {label: view for _, label, view in self.zoom_panes}
+        self._syncing_scroll = False
+        for source, target in ((self.input_scroll, self.output_scroll),
+                               (self.output_scroll, self.input_scroll)):
+            source.horizontalScrollBar().valueChanged.connect(
+                partial(self.sync_scroll, source, target))
+            source.verticalScrollBar().valueChanged.connect(
+                partial(self.sync_scroll, source, target))
+        
     def create_method_tabs(self):
         """Create tabs for different processing method categories"""
         self.tab_widget = QTabWidget()
+        self.method_controls = {}
         
-        # Create tabs with scroll areas
+        # Create tabs with scroll areas; their contents are built when a
+        # tab is first activated, which keeps startup short
         tabs_data = [
             ("Classical Methods", self.create_classical_tab),
             ("Geometric Methods", self.create_geometric_tab),
             ("Modern Methods", self.create_modern_tab)
         ]
         
+        self.tab_builders = {}
         for tab_name, create_func in tabs_data:
             scroll = QScrollArea()
-            tab_widget = create_func()
-            scroll.setWidget(tab_widget)
             scroll.setWidgetResizable(True)
-            self.tab_widget.addTab(scroll, tab_name)
+            self.tab_builders[self.tab_widget.addTab(scroll, tab_name)] = create_func
+        self.tab_widget.currentChanged.connect(self.build_tab)
+        self.build_tab(self.tab_widget.currentIndex())
         
         self.main_layout.addWidget(self.tab_widget)
         
+    def build_tab(self, index, chain=False):
+        """
+        Build the contents of a method tab unless it was built already. With
+        chain, the next unbuilt tab follows on a later event loop turn.
+        """
+        create_func = self.tab_builders.pop(index, None)
+        if create_func is not None:
+            self.tab_widget.widget(index).setWidget(create_func())
+        if chain and self.tab_builders:
+            # Input and paint events queued meanwhile run before the next tab
+            QTimer.singleShot(0, partial(self.build_tab, next(iter(self.tab_builders)), True))
+            
+    def build_all_tabs(self):
+        """Build every method tab, e.g. before a pipeline is applied to them"""
+        for index in list(self.tab_builders):
+            self.build_tab(index)
+            
+    def warm_up(self):
+        """Prepare the unopened tabs and the operation backends while idle"""
+        # Operations are imported and run once on a small frame off the GUI
+        # thread; widgets can only be built on it, one tab per event loop turn
+        threading.Thread(target=warm_up_operations, name="warm-up", daemon=True).start()
+        if self.tab_builders:
+            QTimer.singleShot(0, partial(self.build_tab, next(iter(self.tab_builders)), True))
+        
     def create_classical_tab(self):
         """Create the classical methods tab content"""
         widget = QWidget()
@@ -173,16 +371,7 @@ class ImageProcessingGUI(QMainWindow):
         ]
         
         for i, (group_name, methods) in enumerate(groups):
-            group = QGroupBox(group_name)
-            group_layout = QVBoxLayout()
-            
-            for method in methods:
-                checkbox = QCheckBox(method)
-                checkbox.setEnabled(False)  # Initially disabled
-                group_layout.addWidget(checkbox)
-            
-            group.setLayout(group_layout)
-            layout.addWidget(group, i // 2, i % 2)
+            layout.addWidget(self.create_method_group(group_name, methods), i // 2, i % 2)
         
         return widget
         
@@ -199,16 +388,7 @@ class ImageProcessingGUI(QMainWindow):
         ]
         
         for i, (group_name, methods) in enumerate(groups):
-            group = QGroupBox(group_name)
-            group_layout = QVBoxLayout()
-            
-            for method in methods:
-                checkbox = QCheckBox(method)
-                checkbox.setEnabled(False)  # Initially disabled
-                group_layout.addWidget(checkbox)
-            
-            group.setLayout(group_layout)
-            layout.addWidget(group, i // 2, i % 2)
+            layout.addWidget(self.create_method_group(group_name, methods), i // 2, i % 2)
         
         return widget
         
@@ -225,19 +405,126 @@ class ImageProcessingGUI(QMainWindow):
         ]
         
         for i, (group_name, methods) in enumerate(groups):
-            group = QGroupBox(group_name)
-            group_layout = QVBoxLayout()
-            
-            for method in methods:
-                checkbox = QCheckBox(method)
-                checkbox.setEnabled(False)  # Initially disabled
-                group_layout.addWidget(checkbox)
-            
-            group.setLayout(group_layout)
-            layout.addWidget(group, i // 2, i % 2)
+            layout.addWidget(self.create_method_group(group_name, methods), i // 2, i % 2)
         
         return widget
         
+    def create_method_group(self, group_name, methods):
+        """Create a group box with one checkbox and parameter row per method"""
+        group = QGroupBox(group_name)
+        group_layout = QVBoxLayout()
+        
+        for method in methods:
+            row = QHBoxLayout()
+            checkbox = QCheckBox(method)
+            row.addWidget(checkbox)
+            row.addStretch()
+            try:
+                operation = get_operation(method)
+            except ValueError:
+                operation = None
+            if operation is None or not operation.available():
+                checkbox.setEnabled(False)  # Not implemented in this build
+                checkbox.setToolTip("Not available")
+                group_layout.addLayout(row)
+                continue
+            
+            editors = {}
+            for param in operation.params.values():
+                editor = self.create_param_editor(param)
+                row.addWidget(QLabel(param.label))
+                row.addWidget(editor)
+                editors[param.name] = editor
+            checkbox.toggled.connect(partial(self.toggle_method, method, editors))
+            self.method_controls[method] = (checkbox, editors)
+            group_layout.addLayout(row)
+        
+        group.setLayout(group_layout)
+        return group
+        
+    def create_param_editor(self, param):
+        """Create an input widget for a typed operation parameter"""
+        if param.choices is not None:
+            editor = QComboBox()
+            editor.addItems(param.choices)
+            editor.setCurrentText(param.default)
+            editor.value = editor.currentText
+            editor.changed = editor.currentTextChanged
+        elif param.kind is bool:
+            editor = QCheckBox()
+            editor.setChecked(param.default)
+            editor.value = editor.isChecked
+            editor.changed = editor.toggled
+        elif param.kind is int:
+            if param.odd:
+                editor = OddSpinBox()
+            else:
+                editor = QSpinBox()
+                editor.setSingleStep(param.step or 1)
+            editor.setRange(param.minimum, param.maximum)
+            editor.setValue(param.default)
+            editor.changed = editor.valueChanged
+        else:
+            editor = QDoubleSpinBox()
+            editor.setRange(param.minimum, param.maximum)
+            step = param.step or 0.1
+            editor.setSingleStep(step)
+            editor.setDecimals(max(1, len(f"{step:g}".partition(".")[2])))
+            editor.setValue(param.default)
+            editor.changed = editor.valueChanged
+        editor.param = param
+        return editor
+        
+    def toggle_method(self, method, editors, checked):
+        """Add or remove a method from the processing pipeline"""
+        for editor in editors.values():
+            try:
+                editor.changed.disconnect()
+            except TypeError:
+                pass
+        if checked:
+            params = {name: editor.value() for name, editor in editors.items()}
+            try:
+                self.pipeline.add(method, **params)
+            except ValueError as e:
+                checkbox = self.method_controls[method][0]
+                checkbox.blockSignals(True)
+                checkbox.setChecked(False)
+                checkbox.blockSignals(False)
+                self.show_error(f"Invalid parameters for {method}: {str(e)}")
+                return
+            self.bind_method_editors(method, editors)
+        else:
+            self.pipeline.remove(method)
+        self.on_pipeline_changed()
+        
+    def bind_method_editors(self, method, editors):
+        """Forward parameter edits of a selected method to the pipeline"""
+        for name, editor in editors.items():
+            editor.changed.connect(partial(self.change_method_param, method, name, editor))
+        
+    def change_method_param(self, method, name, editor, *_):
+        """Update a parameter of a method in the pipeline"""
+        try:
+            self.pipeline.set_param(method, name, editor.value())
+        except ValueError as e:
+            self.show_error(f"Invalid parameter for {method}: {str(e)}")
+            return
+        self.on_pipeline_changed()
+        
+    def on_pipeline_changed(self):
+        """Compile the pipeline once and refresh the preview"""
+        try:
+            self.compiled_pipeline = self.pipeline.compile()
+        except ValueError as e:
+            self.show_error(f"Invalid pipeline: {str(e)}")
+            return
+        names = self.pipeline.names()
+        self.pipeline_label.setText("Pipeline: " + (" → ".join(names) if names else "(empty)"))
+        if (self.live_preview_checkbox.isChecked() and self.frame_grabber is None
+                and self.current_image is not None):
+            self.process_image(live=True)
+        
     def create_control_panel(self):
         """Create the bottom control panel"""
         control_group = QGroupBox("Processing Controls")
@@ -246,6 +533,12 @@ class ImageProcessingGUI(QMainWindow):
         # Processing options
         self.additive_checkbox = QCheckBox("Additive Operations")
         self.live_preview_checkbox = QCheckBox("Live Preview")
+        self.proxy_preview_checkbox = QCheckBox("Proxy Preview")
+        self.proxy_preview_checkbox.setChecked(True)
+        self.proxy_preview_checkbox.setToolTip(
+            "Run Live Preview on a copy scaled to the output pane; the full "
+            "resolution result is rendered in the background when idle")
+        self.pipeline_label = QLabel("Pipeline: (empty)")
         
         # Control buttons
         self.process_btn = QPushButton("Process")
@@ -258,6 +551,8 @@ class ImageProcessingGUI(QMainWindow):
         # Add widgets to layout
         control_layout.addWidget(self.additive_checkbox)
         control_layout.addWidget(self.live_preview_checkbox)
+        control_layout.addWidget(self.proxy_preview_checkbox)
+        control_layout.addWidget(self.pipeline_label)
         control_layout.addStretch()
         control_layout.addWidget(self.undo_btn)
         control_layout.addWidget(self.process_btn)
@@ -276,6 +571,101 @@ class ImageProcessingGUI(QMainWindow):
         self.image_info_label = QLabel()
         self.status_bar.addPermanentWidget(self.image_info_label)
         
+    def create_performance_dock(self):
+        """Create the dockable panel showing per-stage timings and frame rates"""
+        self.performance_dock = QDockWidget("Performance", self)
+        panel = QWidget()
+        layout = QVBoxLayout(panel)
+        
+        controls = QHBoxLayout()
+        self.profiling_checkbox = QCheckBox("Enable Instrumentation")
+        self.profiling_checkbox.toggled.connect(PROFILER.set_enabled)
+        controls.addWidget(self.profiling_checkbox)
+        for text, slot in [("Reset", self.reset_performance_stats),
+                           ("Export CSV", self.export_performance_csv),
+                           ("Export Trace", self.export_performance_trace)]:
+            button = QPushButton(text)
+            button.clicked.connect(slot)
+            controls.addWidget(button)
+        layout.addLayout(controls)
+        
+        self.performance_label = QLabel()
+        layout.addWidget(self.performance_label)
+        
+        columns = ["Stage", "Count", "Mean ms", "p50 ms", "p95 ms", "p99 ms", "Max ms"]
+        self.performance_table = QTableWidget(0, len(columns))
+        self.performance_table.setHorizontalHeaderLabels(columns)
+        self.performance_table.verticalHeader().setVisible(False)
+        self.performance_table.horizontalHeader().setSectionResizeMode(
+            QHeaderView.ResizeMode.ResizeToContents)
+        layout.addWidget(self.performance_table)
+        
+        self.performance_dock.setWidget(panel)
+        self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, self.performance_dock)
+        self.performance_dock.hide()
+        self.view_menu.addAction(self.performance_dock.toggleViewAction())
+        
+        # The panel is only refreshed while it is visible
+        self.performance_timer = QTimer()
+        self.performance_timer.timeout.connect(self.update_performance_panel)
+        self.performance_dock.visibilityChanged.connect(
+            lambda visible: self.performance_timer.start(500) if visible
+            else self.performance_timer.stop())
+        
+    def create_sources_dock(self):
+        """Create the dockable grid showing one pane per source"""
+        self.sources_dock = QDockWidget("Sources", self)
+        self.source_grid = SourceGrid()
+        self.sources_dock.setWidget(self.source_grid)
+        self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, self.sources_dock)
+        self.sources_dock.hide()
+        self.view_menu.addAction(self.sources_dock.toggleViewAction())
+        
+    def update_performance_panel(self):
+        """Refresh the performance table from the shared profiler"""
+        rates = PROFILER.rates()
+        info = (f"Input: {rates.get('frame.input', 0.0):.1f} FPS | "
+                f"Output: {rates.get('frame.output', 0.0):.1f} FPS")
+        if self.frame_grabber is not None:
+            stats = self.frame_grabber.stats()
+            info += f" | Dropped: {stats['dropped']} | Late: {stats['late']}"
+        engine_stats = self.processing_engine.stats()
+        info += f" | Skipped: {engine_stats['coalesced']} | Stale: {engine_stats['stale']}"
+        self.performance_label.setText(info)
+        
+        stats = sorted(PROFILER.stage_stats().items())
+        self.performance_table.setRowCount(len(stats))
+        for row, (name, values) in enumerate(stats):
+            cells = [name, str(values["count"])] + [
+                f"{values[key]:.2f}" for key in ("mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms")]
+            for column, text in enumerate(cells):
+                self.performance_table.setItem(row, column, QTableWidgetItem(text))
+        
+    def reset_performance_stats(self):
+        """Discard all collected timings"""
+        PROFILER.reset()
+        self.update_performance_panel()
+        
+    def export_performance_csv(self):
+        """Export the recorded spans as CSV"""
+        file_name, _ = QFileDialog.getSaveFileName(self, "Export Timings", "", "CSV (*.csv)")
+        if file_name:
+            try:
+                PROFILER.export_csv(file_name)
+                self.status_bar.showMessage(f"Timings exported to: {os.path.basename(file_name)}")
+            except OSError as e:
+                self.show_error(f"Error exporting timings: {str(e)}")
+                
+    def export_performance_trace(self):
+        """Export the recorded spans as a Chrome trace (chrome://tracing, Perfetto)"""
+        file_name, _ = QFileDialog.getSaveFileName(self, "Export Trace", "", "Trace (*.json)")
+        if file_name:
+            try:
+                PROFILER.export_chrome_trace(file_name)
+                self.status_bar.showMessage(f"Trace exported to: {os.path.basename(file_name)}")
+            except OSError as e:
+                self.show_error(f"Error exporting trace: {str(e)}")
+        
     def add_toolbar_button(self, toolbar, text, slot):
         """Helper method to add buttons to toolbar"""
         button = QPushButton(text)
@@ -292,6 +682,8 @@ class ImageProcessingGUI(QMainWindow):
                 self.open_video()
             elif source_type == "Webcam":
                 self.start_webcam()
+            elif source_type == "Multiple Sources":
+                self.open_sources()
         except Exception as e:
             self.show_error(f"Error selecting source: {str(e)}")
             
@@ -301,7 +693,7 @@ class ImageProcessingGUI(QMainWindow):
             self,
             "Select Image",
             "",
-            "Images (*.png *.jpg *.jpeg *.bmp *.tiff)"
+            "Images (*.png *.jpg *.jpeg *.bmp *.tif *.tiff *.npy *.raw)"
         )
         if file_name:
             try:
@@ -328,6 +720,8 @@ class ImageProcessingGUI(QMainWindow):
     def start_webcam(self):
         """Initialize and start webcam capture"""
         try:
+            self.stop_capture()
+            self.video_path = None
             self.video_capture = cv2.VideoCapture(0)
             if self.video_capture.isOpened():
                 # Set resolution based on combo box
@@ -335,126 +729,430 @@ class ImageProcessingGUI(QMainWindow):
                 width, height = map(int, resolution.split('x'))
                 self.video_capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
                 self.video_capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+                self.capture_size = (width, height)
                 
-                self.timer.start(30)  # 30ms refresh rate
+                self.start_capture(live=True)
+                if self.hold_fps_checkbox.isChecked():
+                    self.quality_controller = QualityController(
+                        source_fps(self.video_capture), self.capture_resolutions(width, height))
                 self.status_bar.showMessage("Webcam started")
             else:
                 raise Exception("Could not open webcam")
         except Exception as e:
             self.show_error(f"Error starting webcam: {str(e)}")
             
+    def start_capture(self, live):
+        """Start the background grabber for the opened video capture"""
+        fps = source_fps(self.video_capture)
+        # A live frame shown more than two frame periods after capture counts
+        # as late; file frames are decoded ahead on purpose
+        late_after = 2.0 / fps if live else None
+        # Files are scheduled against the wall clock at their own frame rate
+        self.frame_pacer = None if live else FramePacer(fps)
+        self.frame_grabber = FrameGrabber(self.video_capture, live=live,
+                                          late_after=late_after, pacer=self.frame_pacer)
+        self.frame_grabber.start()
+        self.invalidate_stage_cache()
+        self.pipeline.set_lut_refresh_interval(VIDEO_LUT_REFRESH_INTERVAL)
+        self.pipeline.set_keyframe_interval(FEATURE_KEYFRAME_INTERVAL)
+        self.compiled_pipeline = self.pipeline.compile()
+        # Poll twice per frame period; paced files reschedule on every frame
+        self.timer.start(max(1, int(500 / fps)))
+
+    def stop_capture(self):
+        """Stop the grabber thread and release the capture device"""
+        self.timer.stop()
+        if self.frame_grabber is not None:
+            self.frame_grabber.stop()
+            self.frame_grabber = None
+        elif self.video_capture is not None:
+            self.video_capture.release()
+        self.video_capture = None
+        self.frame_pacer = None
+        self.quality_controller = None
+        self.preview_scale = 1.0
+        self.last_processing_time = 0.0
+
+    def capture_resolutions(self, width, height):
+        """Capture sizes the quality controller may step through, largest first"""
+        if not self.lower_resolution_checkbox.isChecked():
+            return ()
+        sizes = [tuple(map(int, self.resolution_combo.itemText(i).split('x')))
+                 for i in range(self.resolution_combo.count())]
+        return sorted((size for size in sizes if size[0] * size[1] <= width * height),
+                      key=lambda size: size[0] * size[1], reverse=True)
+
+    def adapt_quality(self, frame_time):
+        """Feed the quality controller and apply the level it picks"""
+        cost = frame_time
+        if self.live_preview_checkbox.isChecked():
+            cost = max(cost, self.last_processing_time)
+        message = self.quality_controller.add_sample(cost)
+        if message is None:
+            return
+        self.preview_scale = self.quality_controller.preview_scale
+        size = self.quality_controller.capture_size
+        if size is not None and size != self.capture_size:
+            self.set_capture_resolution(*size)
+        self.status_bar.showMessage(message)
+
+    def set_capture_resolution(self, width, height):
+        """Restart the webcam grabber at a new capture resolution"""
+        # The capture can only be reconfigured while no thread reads from it
+        self.frame_grabber.stop(release=False)
+        self.video_capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.video_capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        self.capture_size = (width, height)
+        self.start_capture(live=True)
+
     def change_source(self):
         """Handle source type change"""
-        if self.video_capture is not None:
-            self.video_capture.release()
-            self.timer.stop()
+        self.stop_capture()
+        self.stop_sources()
+        # Only a video opened from the new source can be exported
+        self.video_path = None
+        self.sources_dock.setVisible(self.source_combo.currentText() == "Multiple Sources")
         self.reset_processing()
-        self.resolution_combo.setVisible(self.source_combo.currentText() == "Webcam")
+        webcam = self.source_combo.currentText() == "Webcam"
+        self.resolution_combo.setVisible(webcam)
+        self.hold_fps_checkbox.setVisible(webcam)
+        self.lower_resolution_checkbox.setVisible(webcam)
         
     def load_image(self, file_name):
         """Load and display an image file"""
-        self.current_image = cv2.imread(file_name)
-        if self.current_image is None:
-            raise Exception("Could not load image")
+        # Uncompressed TIFF, .npy and .raw files are memory-mapped read-only
+        self.current_image = read_image(file_name)
+        self.video_path = None
         
-        self.processed_image = self.current_image.copy()
+        # Still images always get exact lookup tables and feature detection
+        self.pipeline.set_lut_refresh_interval(1)
+        self.pipeline.set_keyframe_interval(1)
+        self.compiled_pipeline = self.pipeline.compile()
+        self.invalidate_stage_cache()
+        # The pipeline never writes to its input, so no copy is needed
+        self.processed_image = self.current_image
+        self.processed_is_proxy = False
         self.display_image(self.current_image, self.input_image_label)
         self.display_image(self.current_image, self.output_image_label)
         self.update_image_info()
         
     def start_video(self, file_name):
         """Start video playback"""
+        self.stop_capture()
+        self.video_path = None
         self.video_capture = cv2.VideoCapture(file_name)
         if not self.video_capture.isOpened():
             raise Exception("Could not open video file")
-        self.timer.start(30)
+        self.video_path = file_name
+        self.start_capture(live=False)
+        
+    def open_sources(self):
+        """Ask for several sources and play them side by side"""
+        text, ok = QInputDialog.getMultiLineText(
+            self,
+            "Open Sources",
+            "One source per line: webcam index, video file, image folder or pattern (frames/*.png)"
+        )
+        specs = [line.strip() for line in text.splitlines() if line.strip()]
+        if ok and specs:
+            try:
+                self.start_sources(specs)
+                self.status_bar.showMessage(f"Playing {len(specs)} sources")
+            except Exception as e:
+                self.show_error(f"Error opening sources: {str(e)}")
+                
+    def start_sources(self, specs):
+        """Open every source on its own capture thread and show the grid"""
+        self.stop_capture()
+        self.stop_sources()
+        sources = []
+        try:
+            for spec in specs:
+                sources.append(Source(spec))
+        except ValueError:
+            for source in sources:
+                source.stop()
+            raise
+        self.sources = sources
+        self.pipeline.set_lut_refresh_interval(VIDEO_LUT_REFRESH_INTERVAL)
+        self.pipeline.set_keyframe_interval(FEATURE_KEYFRAME_INTERVAL)
+        self.source_grid.set_sources([source.name for source in sources])
+        self.sources_dock.show()
+        for source in sources:
+            source.start()
+        # Poll twice per frame period of the fastest source
+        fastest = max(source.fps for source in sources)
+        self.sources_timer.start(max(1, int(500 / fastest)))
+        self.source_stats_timer.start(SOURCE_STATS_INTERVAL_MS)
+        
+    def stop_sources(self):
+        """Stop every source of the grid"""
+        self.sources_timer.stop()
+        self.source_stats_timer.stop()
+        for source in self.sources:
+            source.stop()
+            self.processing_engine.forget(source)
+        self.sources = []
+        self.source_grid.clear()
         
+    def source_plan(self, source):
+        """Plan for the frames of one source, rebuilt when the pipeline changes"""
+        # Sources don't share plans, so trackers and warm starts see one stream
+        if source.plan is None or source.plan.version != self.pipeline.version:
+            source.plan = self.pipeline.compile(shared=False)
+        return source.plan
+        
+    def update_sources(self):
+        """Show or process the next frame of every source"""
+        live_preview = self.live_preview_checkbox.isChecked()
+        for source, pane in zip(self.sources, self.source_grid.panes):
+            latest = source.latest()
+            if latest is None:
+                if not source.ended and source.exhausted():
+                    source.ended = True
+                    error = source.grabber.error
+                    pane.set_status(f"Error: {error}" if error is not None else "Ended")
+                continue
+            frame, info = latest
+            if live_preview:
+                # Workers get a copy, the grabber reuses its buffers
+                job_func = partial(self.apply_processing, plan=self.source_plan(source))
+                self.processing_engine.submit(job_func, frame.copy(), tag="source",
+                                              source=source)
+            else:
+                pane.show_frame(frame, (id(source), info.index))
+        if all(source.ended for source in self.sources):
+            self.sources_timer.stop()
+            self.source_stats_timer.stop()
+            self.status_bar.showMessage("All sources ended")
+            
+    def update_source_stats(self):
+        """Refresh the frame rates and latency shown under each pane"""
+        live_preview = self.live_preview_checkbox.isChecked()
+        for source, pane in zip(self.sources, self.source_grid.panes):
+            if source.ended:
+                continue
+            stats = source.stats()
+            text = f"In: {stats['input_fps']:.1f} FPS | Dropped: {stats['dropped']}"
+            if live_preview:
+                engine_stats = self.processing_engine.source_stats(source)
+                text += (f" | Out: {engine_stats['fps']:.1f} FPS"
+                         f" | Latency: {engine_stats['latency_ms']:.0f}ms"
+                         f" | Skipped: {engine_stats['coalesced']}")
+            pane.set_status(text)
+            
     def update_frame(self):
         """Update frame for video/webcam display"""
-        ret, frame = self.video_capture.read()
-        if ret:
-            self.current_image = frame
-            self.processed_image = frame.copy()
-            self.display_image(frame, self.input_image_label)
-            if self.live_preview_checkbox.isChecked():
-                self.process_image()
-            else:
-                self.display_image(frame, self.output_image_label)
-            self.update_image_info()
-        else:
-            # Video ended or frame grab failed
+        if self.frame_grabber is None:
             self.timer.stop()
-            if self.video_capture is not None:
-                self.video_capture.release()
-                self.video_capture = None
+            return
+        pacer = self.frame_pacer
+        due = pacer.due_index() if pacer is not None and pacer.started else None
+        latest = self.frame_grabber.latest(due)
+        if latest is not None:
+            frame, info = latest
+            if pacer is not None and not pacer.started:
+                pacer.start(info.index)
+            PROFILER.tick("frame.input")
+            started = time.perf_counter()
+            with PROFILER.span("update_frame"):
+                self.current_image = frame
+                frame_key = (id(self.frame_grabber), info.index)
+                self.display_image(frame, self.input_image_label, frame_key)
+                if self.live_preview_checkbox.isChecked():
+                    # The output pane is refreshed when the worker delivers
+                    self.process_image(live=True)
+                else:
+                    self.processed_image = frame.copy()
+                    self.processed_is_proxy = False
+                    self.display_image(frame, self.output_image_label, frame_key)
+                    PROFILER.tick("frame.output")
+                self.update_image_info()
+            if self.quality_controller is not None:
+                self.adapt_quality(time.perf_counter() - started)
+        elif self.frame_grabber.exhausted():
+            # Video ended or frame grab failed
+            error = self.frame_grabber.error
+            self.stop_capture()
+            if error is not None:
+                self.show_error(f"Error reading frame: {str(error)}")
             self.status_bar.showMessage("Video ended")
+            return
+        if pacer is not None and pacer.started:
+            # Wake up when the next frame is due
+            delay = pacer.delay_until(pacer.due_index() + 1)
+            self.timer.start(max(1, int(delay * 1000)))
 
-    def display_image(self, image, label):
+    def display_image(self, image, label, key=None):
         """Display an image on a QLabel with proper scaling"""
-        if image is not None:
-            height, width = image.shape[:2]
-            label_width = label.width()
-            label_height = label.height()
-            
-            # Calculate aspect ratio preserving scaling
-            aspect_ratio = width / height
-            if label_width / aspect_ratio <= label_height:
-                new_width = label_width
-                new_height = int(label_width / aspect_ratio)
-            else:
-                new_height = label_height
-                new_width = int(label_height * aspect_ratio)
-            
-            # Convert the image to RGB format
-            rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            h, w, ch = rgb_image.shape
-            bytes_per_line = ch * w
-            
-            # Create QImage and QPixmap
-            qt_image = QImage(rgb_image.data, w, h, bytes_per_line, QImage.Format.Format_RGB888)
-            pixmap = QPixmap.fromImage(qt_image)
-            scaled_pixmap = pixmap.scaled(new_width, new_height, 
-                                        Qt.AspectRatioMode.KeepAspectRatio,
-                                        Qt.TransformationMode.SmoothTransformation)
-            label.setPixmap(scaled_pixmap)
-
-    def process_image(self):
+        # Resizing and format handling live in display.ImageDisplay; key lets
+        # it skip the repaint when the same frame is shown again
+        if self.zoom_factor is not None:
+            # The tiled view reads the image when it paints, after the grabber
+            # may have reused the frame's buffer
+            self.tiled_views[label].set_image(image, key, copy=self.frame_grabber is not None)
+        else:
+            self.image_displays[label].show(image, key)
+
+    def process_image(self, live=False):
         """Process the image with selected methods"""
         if self.current_image is None:
             self.show_error("No image loaded")
             return
             
         try:
-            # Make a copy of the input image
-            if not self.additive_checkbox.isChecked():
-                self.processed_image = self.current_image.copy()
-            
-            # Students will implement their processing methods here
-            # This is a placeholder for demonstration
-            self.status_bar.showMessage("Processing image...")
-            
-            # Update the display
-            self.display_image(self.processed_image, self.output_image_label)
-            self.processing_history.append(self.processed_image.copy())
+            # Make a copy of the input image; workers must never see a
+            # capture buffer that the grabber is about to overwrite. Still
+            # images are never written to and share the stage cache
+            scale = self.preview_factor() if live else 1.0
+            still = self.frame_grabber is None
+            cache_key = None
+            with PROFILER.span("process_image.copy"):
+                if scale < 1.0:
+                    # The resized proxy is a fresh array, no copy needed
+                    proxy_key = ("source", self.image_token, scale)
+                    source = self.stage_cache.get(proxy_key) if still else None
+                    if source is None:
+                        source = cv2.resize(self.current_image, None, fx=scale, fy=scale,
+                                            interpolation=cv2.INTER_AREA)
+                        if still:
+                            self.stage_cache.put(proxy_key, source)
+                    if still:
+                        cache_key = ("proxy", self.image_token, scale)
+                elif (live or not self.additive_checkbox.isChecked()
+                        or self.processed_image is None or self.processed_is_proxy):
+                    source = self.current_image if still else self.current_image.copy()
+                    cache_key = ("full", self.image_token) if still else None
+                else:
+                    # Results are never modified in place, and this one
+                    # must not be recycled while the job reads it
+                    source = self.processed_image
+                    self.processing_engine.buffers.keep(source)
             
-            self.status_bar.showMessage("Processing complete")
+            if not live:
+                self.status_bar.showMessage("Processing image...")
+            # Jobs run against the plan compiled when they were submitted;
+            # proxies use a plan with kernel sizes scaled down to match
+            plan = self.pipeline.compile_proxy(scale) if scale < 1.0 else self.compiled_pipeline
+            job_func = partial(self.apply_processing, plan=plan, cache_key=cache_key)
+            self.processing_engine.submit(job_func, source, tag="proxy" if scale < 1.0 else None,
+                                          coalesce=live)
+            if scale < 1.0 and still:
+                self.full_render_timer.start(FULL_RENDER_IDLE_MS)
             
         except Exception as e:
             self.show_error(f"Error processing image: {str(e)}")
 
+    def preview_factor(self):
+        """Scale of the frames processed by Live Preview"""
+        # preview_scale is lowered by the quality controller on slow webcams
+        factor = self.preview_scale
+        if self.proxy_preview_checkbox.isChecked() and self.zoom_factor is None:
+            # The output pane never shows more pixels than it has
+            height, width = self.current_image.shape[:2]
+            label = self.output_image_label
+            factor *= min(1.0, label.width() / width, label.height() / height)
+        # Rounded so that proxies and their cached results can be reused
+        return round(factor, 2)
+
+    def render_full(self, tag="full", context=None):
+        """Replace a proxy preview with the full-resolution result in the background"""
+        if self.current_image is None:
+            return None
+        if self.frame_grabber is None:
+            source, cache_key = self.current_image, ("full", self.image_token)
+        else:
+            source, cache_key = self.current_image.copy(), None
+        job_func = partial(self.apply_processing, plan=self.compiled_pipeline,
+                           cache_key=cache_key)
+        # An idle render is superseded by newer previews; a render for saving is not
+        return self.processing_engine.submit(job_func, source, tag=tag, coalesce=tag == "full",
+                                             context=context)
+
+    def apply_processing(self, image, plan, cache_key=None):
+        """Apply the compiled pipeline to an image (runs on a worker thread)"""
+        # The last stage writes into a recycled buffer owned by the GUI, unless
+        # the result is kept in the stage cache or streamed in strips
+        buffers = self.processing_engine.buffers
+        out = None
+        if cache_key is None and not is_mapped(image):
+            out = buffers.take(image.shape, image.dtype)
+        result = plan.process(image, out=out, cache=self.stage_cache, key=cache_key)
+        if out is not None and result is not out:
+            buffers.give_back(out)
+        return result
+
+    def invalidate_stage_cache(self):
+        """Drop cached intermediate results when the input image changes"""
+        self.image_token += 1
+        self.stage_cache.clear()
+
+    def on_processing_finished(self, result, job):
+        """Show a result delivered by the processing engine"""
+        if job.source is not None:
+            # A frame of one of the grid sources, unless it was closed since
+            if job.source in self.sources:
+                pane = self.source_grid.panes[self.sources.index(job.source)]
+                pane.show_frame(result, ("job", job.id))
+            # The pane keeps a scaled copy
+            self.processing_engine.buffers.give_back(result)
+            return
+        previous = self.processed_image
+        self.processed_image = result
+        self.processed_is_proxy = job.tag == "proxy"
+        self.display_image(self.processed_image, self.output_image_label, ("job", job.id))
+        if previous is not result:
+            # Replaced on screen, the previous result's buffer can be reused
+            self.processing_engine.buffers.give_back(previous)
+        PROFILER.tick("frame.output")
+        if job.coalesce:
+            self.last_processing_time = job.completed - job.started
+        # Submission to display, including queueing and signal delivery
+        PROFILER.record("engine.latency", job.submitted, time.perf_counter())
+        if job.tag == "save":
+            # The job carries its own target; one without is ignored
+            if job is self.pending_save:
+                self.pending_save = None
+            if job.context is not None:
+                self.write_result(*job.context)
+        elif not job.coalesce:
+            # Live Preview frames are previews, only explicit runs are undoable
+            self.processing_history.append(self.processed_image)
+            self.update_image_info()
+            self.status_bar.showMessage("Processing complete")
+
+    def on_processing_failed(self, message, job):
+        """Report an exception raised by a processing job"""
+        if job.source is not None:
+            if job.source in self.sources:
+                pane = self.source_grid.panes[self.sources.index(job.source)]
+                pane.set_status(f"Error: {message}")
+            return
+        if job.tag == "save":
+            if job is self.pending_save:
+                self.pending_save = None
+        elif job.coalesce:
+            # Don't flood the user with one dialog per live frame
+            self.live_preview_checkbox.setChecked(False)
+        self.show_error(f"Error processing image: {message}")
+
     def reset_processing(self):
         """Reset the processed image to the original"""
         if self.current_image is not None:
-            self.processed_image = self.current_image.copy()
+            self.processed_image = self.current_image
+            self.processed_is_proxy = False
             self.display_image(self.processed_image, self.output_image_label)
             self.processing_history.clear()
+            self.invalidate_stage_cache()
             self.status_bar.showMessage("Processing reset")
 
     def undo_last_operation(self):
         """Undo the last processing operation"""
         if len(self.processing_history) > 0:
             self.processed_image = self.processing_history.pop()
+            self.processed_is_proxy = False
             self.display_image(self.processed_image, self.output_image_label)
+            self.update_image_info()
             self.status_bar.showMessage("Undo last operation")
         else:
             self.status_bar.showMessage("Nothing to undo")
@@ -464,35 +1162,251 @@ class ImageProcessingGUI(QMainWindow):
         if self.processed_image is None:
             self.show_error("No processed image to save")
             return
+        if self.image_export_job is not None:
+            self.show_error("An export is already running")
+            return
+        if self.pending_save is not None:
+            self.show_error("The previous save is still rendering")
+            return
             
         file_name, _ = QFileDialog.getSaveFileName(
             self,
             "Save Image",
             "",
-            "Images (*.png *.jpg *.jpeg *.bmp *.tiff)"
+            "Images (*.png *.jpg *.jpeg *.webp *.bmp *.tiff)"
         )
         if file_name:
-            try:
-                cv2.imwrite(file_name, self.processed_image)
-                self.status_bar.showMessage(f"Image saved as: {os.path.basename(file_name)}")
-            except Exception as e:
-                self.show_error(f"Error saving image: {str(e)}")
+            # Format from the extension, compression from the export options
+            options = ExportOptions.for_file(file_name, self.export_options)
+            if self.processed_is_proxy:
+                # Never save the preview proxy, render the full image first
+                self.pending_save = self.render_full(tag="save", context=(file_name, options))
+                self.status_bar.showMessage("Rendering full resolution...")
+            else:
+                self.write_result(file_name, options)
+
+    def write_result(self, file_name, options):
+        """Write the processed image in the background"""
+        # Results are never modified in place, so no copy is needed; the
+        # export thread owns it from now on
+        self.processing_engine.buffers.keep(self.processed_image)
+        self.start_image_export([self.processed_image], [file_name], options,
+                                f"Image saved as: {os.path.basename(file_name)}")
 
     def export_history(self):
         """Export processing history as a series of images"""
         if not self.processing_history:
             self.show_error("No processing history to export")
             return
+        if self.image_export_job is not None:
+            self.show_error("An export is already running")
+            return
+        if not self.edit_export_options():
+            return
             
         directory = QFileDialog.getExistingDirectory(self, "Select Export Directory")
         if directory:
+            # The history store decodes one snapshot at a time as the export
+            # pulls them, so large histories are never materialized at once.
+            # The iterator is taken here, on the GUI thread: it exports the
+            # steps as they are now, even if Undo or Reset change the history
+            # while the export runs
+            options = self.export_options
+            paths = (os.path.join(directory, f"step_{i}{options.extension}") for i in count(1))
+            steps = iter(self.processing_history)
+            self.start_image_export(steps, paths, options,
+                                    f"Processing history exported to: {directory}",
+                                    total=len(self.processing_history))
+
+    def start_image_export(self, images, paths, options, done_message, total=1):
+        """Write images on a background worker pool and report progress"""
+        try:
+            self.image_export_job = ImageExportJob(images, paths, options, total=total)
+            self.image_export_job.done_message = done_message
+            self.image_export_job.start()
+            self.image_export_timer.start(100)
+        except Exception as e:
+            self.image_export_job = None
+            self.show_error(f"Error exporting images: {str(e)}")
+
+    def update_image_export_progress(self):
+        """Show progress of the running image export in the status bar"""
+        job = self.image_export_job
+        if job is None:
+            self.image_export_timer.stop()
+            return
+        written, total, rate = job.progress()
+        if job.finished.is_set():
+            self.image_export_timer.stop()
+            self.image_export_job = None
+            if job.error is not None:
+                self.show_error(f"Error exporting images: {str(job.error)}")
+            elif job.cancelled:
+                self.status_bar.showMessage(f"Export cancelled after {written} image(s)")
+            else:
+                self.status_bar.showMessage(job.done_message)
+            return
+        self.status_bar.showMessage(f"Exporting images: {written}/{total} ({rate:.1f} images/s)")
+
+    def edit_export_options(self):
+        """Choose the format and compression used by Save Result and Export History"""
+        options = self.export_options
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Export Options")
+        form = QFormLayout(dialog)
+        
+        format_combo = QComboBox()
+        format_combo.addItems(ExportOptions.FORMATS)
+        format_combo.setCurrentText(options.fmt)
+        png_level = QSpinBox()
+        png_level.setRange(0, 9)
+        png_level.setValue(options.png_level)
+        jpeg_quality = QSpinBox()
+        jpeg_quality.setRange(1, 100)
+        jpeg_quality.setValue(options.jpeg_quality)
+        webp_lossless = QCheckBox("Lossless")
+        webp_lossless.setChecked(options.webp_lossless)
+        webp_quality = QSpinBox()
+        webp_quality.setRange(1, 100)
+        webp_quality.setValue(options.webp_quality)
+        
+        form.addRow("Format:", format_combo)
+        form.addRow("PNG compression level:", png_level)
+        form.addRow("JPEG quality:", jpeg_quality)
+        form.addRow("WebP:", webp_lossless)
+        form.addRow("WebP quality:", webp_quality)
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok |
+                                   QDialogButtonBox.StandardButton.Cancel)
+        buttons.accepted.connect(dialog.accept)
+        buttons.rejected.connect(dialog.reject)
+        form.addRow(buttons)
+        
+        if dialog.exec() != QDialog.DialogCode.Accepted:
+            return False
+        self.export_options = ExportOptions(format_combo.currentText(), png_level.value(),
+                                            jpeg_quality.value(), webp_lossless.isChecked(),
+                                            webp_quality.value())
+        return True
+
+    def export_video(self):
+        """Run the pipeline over every frame of the opened video into a new file"""
+        if self.video_path is None:
+            self.show_error("Open a video file first")
+            return
+        if self.export_job is not None:
+            self.show_error("An export is already running")
+            return
+            
+        file_name, _ = QFileDialog.getSaveFileName(
+            self,
+            "Export Video",
+            "",
+            "Videos (*.mp4 *.avi *.mov *.mkv)"
+        )
+        if file_name:
+            try:
+                # A plan of its own, so temporal stages don't mix the exported
+                # stream with the one Live Preview plays
+                plan = self.pipeline.compile(shared=False)
+                self.export_job = VideoExportJob(self.video_path, file_name, plan)
+                self.export_job.start()
+                self.export_timer.start(250)
+                self.status_bar.showMessage("Exporting video...")
+            except Exception as e:
+                self.export_job = None
+                self.show_error(f"Error exporting video: {str(e)}")
+
+    def cancel_export(self):
+        """Cancel the running video or image export"""
+        for job in (self.export_job, self.image_export_job):
+            if job is not None:
+                job.cancel()
+                self.status_bar.showMessage("Cancelling export...")
+
+    def update_export_progress(self):
+        """Show progress and ETA of the running export in the status bar"""
+        job = self.export_job
+        if job is None:
+            self.export_timer.stop()
+            return
+        done, total, rate, eta = job.progress()
+        if job.finished.is_set():
+            self.export_timer.stop()
+            self.export_job = None
+            if job.error is not None:
+                self.show_error(f"Error exporting video: {str(job.error)}")
+            elif job.cancelled:
+                self.status_bar.showMessage("Video export cancelled")
+            else:
+                self.status_bar.showMessage(
+                    f"Video exported: {os.path.basename(job.output_path)} ({done} frames)")
+            return
+        percent = f" ({100 * done / total:.0f}%)" if total else ""
+        remaining = f", ETA {eta:.0f}s" if eta is not None else ""
+        self.status_bar.showMessage(
+            f"Exporting video: {done}/{total or '?'} frames{percent}, {rate:.1f} fps{remaining}")
+
+    def save_pipeline(self):
+        """Save the selected methods and parameters as JSON (used by batch.py)"""
+        file_name, _ = QFileDialog.getSaveFileName(
+            self,
+            "Save Pipeline",
+            "",
+            "Pipelines (*.json)"
+        )
+        if file_name:
             try:
-                for i, image in enumerate(self.processing_history):
-                    filename = os.path.join(directory, f"step_{i+1}.png")
-                    cv2.imwrite(filename, image)
-                self.status_bar.showMessage(f"Processing history exported to: {directory}")
+                self.pipeline.save(file_name)
+                self.status_bar.showMessage(f"Pipeline saved as: {os.path.basename(file_name)}")
             except Exception as e:
-                self.show_error(f"Error exporting history: {str(e)}")
+                self.show_error(f"Error saving pipeline: {str(e)}")
+
+    def load_pipeline(self):
+        """Load a saved pipeline and reflect it in the method tabs"""
+        file_name, _ = QFileDialog.getOpenFileName(
+            self,
+            "Load Pipeline",
+            "",
+            "Pipelines (*.json)"
+        )
+        if not file_name:
+            return
+        try:
+            pipeline = Pipeline.load(file_name)
+            self.build_all_tabs()
+            missing = [name for name in pipeline.names() if name not in self.method_controls]
+            if missing or len(set(pipeline.names())) != len(pipeline):
+                raise Exception("Pipeline uses methods not available in the tabs")
+        except Exception as e:
+            self.show_error(f"Error loading pipeline: {str(e)}")
+            return
+        
+        pipeline.set_lut_refresh_interval(self.pipeline.lut_refresh_interval)
+        pipeline.set_keyframe_interval(self.pipeline.keyframe_interval)
+        self.pipeline = pipeline
+        steps = {step.name: step.params for step in pipeline}
+        for method, (checkbox, editors) in self.method_controls.items():
+            for editor in editors.values():
+                try:
+                    editor.changed.disconnect()
+                except TypeError:
+                    pass
+            params = steps.get(method, {})
+            for name, editor in editors.items():
+                value = params.get(name, editor.param.default)
+                if isinstance(editor, QComboBox):
+                    editor.setCurrentText(value)
+                elif isinstance(editor, QCheckBox):
+                    editor.setChecked(value)
+                else:
+                    editor.setValue(value)
+            checkbox.blockSignals(True)
+            checkbox.setChecked(method in steps)
+            checkbox.blockSignals(False)
+            if method in steps:
+                self.bind_method_editors(method, editors)
+        self.on_pipeline_changed()
+        self.status_bar.showMessage(f"Pipeline loaded: {os.path.basename(file_name)}")
 
     def update_image_info(self):
         """Update image information in status bar"""
@@ -500,19 +1414,117 @@ class ImageProcessingGUI(QMainWindow):
             height, width = self.current_image.shape[:2]
             channels = self.current_image.shape[2] if len(self.current_image.shape) > 2 else 1
             size_mb = self.current_image.nbytes / (1024 * 1024)
-            self.image_info_label.setText(
-                f"Size: {width}x{height} | Channels: {channels} | Memory: {size_mb:.1f}MB"
-            )
+            info = f"Size: {width}x{height} | Channels: {channels} | Memory: {size_mb:.1f}MB"
+            if is_mapped(self.current_image):
+                info += " (mapped)"
+            if self.frame_grabber is not None:
+                stats = self.frame_grabber.stats()
+                info += f" | Dropped: {stats['dropped']} | Late: {stats['late']}"
+                if self.frame_pacer is not None:
+                    info += (f" | Pacing: {self.frame_pacer.fps:.0f} FPS, "
+                             f"{stats['skipped']} grab-skipped")
+                elif self.quality_controller is not None:
+                    info += (f" | Pacing: {self.quality_controller.target_fps:.0f} FPS, "
+                             f"{self.quality_controller.describe()}")
+            if self.processing_history:
+                ram, disk = self.processing_history.usage()
+                info += (f" | History: {len(self.processing_history)} steps, "
+                         f"{ram / MB:.1f}MB RAM, {disk / MB:.1f}MB disk")
+            if len(self.stage_cache):
+                info += f" | Cache: {self.stage_cache.usage() / MB:.0f}MB"
+            if self.live_preview_checkbox.isChecked():
+                stats = self.processing_engine.stats()
+                info += f" | Latency: {stats['latency_ms']:.0f}ms | Skipped: {stats['coalesced']}"
+            self.image_info_label.setText(info)
 
     def zoom_in(self):
         """Zoom in on the images"""
-        # Implement zoom functionality
-        pass
+        self.set_zoom(self.current_zoom() * ZOOM_STEP)
 
     def zoom_out(self):
         """Zoom out of the images"""
-        # Implement zoom functionality
-        pass
+        self.set_zoom(self.current_zoom() / ZOOM_STEP)
+
+    def zoom_fit(self):
+        """Scale the images to fit the panes again"""
+        self.set_zoom(0.0)
+
+    def fit_zoom(self):
+        """Zoom factor at which the input image fits its pane"""
+        if self.current_image is None:
+            return 1.0
+        height, width = self.current_image.shape[:2]
+        viewport = self.input_scroll.viewport().size()
+        return min(viewport.width() / width, viewport.height() / height)
+
+    def current_zoom(self):
+        return self.zoom_factor if self.zoom_factor is not None else self.fit_zoom()
+
+    def set_zoom(self, zoom):
+        """Switch both panes to the tiled viewer at the given zoom, or back to fit"""
+        if self.current_image is None:
+            return
+        output_image = self.processed_image if self.processed_image is not None else self.current_image
+        images = [self.current_image, output_image]
+        if zoom <= self.fit_zoom() * 1.001:
+            if self.zoom_factor is not None:
+                for scroll, label, view in self.zoom_panes:
+                    scroll.takeWidget()
+                    scroll.setWidgetResizable(True)
+                    scroll.setWidget(label)
+                self.zoom_factor = None
+                for (_, label, _), image in zip(self.zoom_panes, images):
+                    self.display_image(image, label)
+            self.status_bar.showMessage("Zoom: fit")
+            return
+        
+        zoom = min(zoom, MAX_ZOOM)
+        centers = [self.scroll_center(scroll) for scroll, _, _ in self.zoom_panes]
+        if self.zoom_factor is None:
+            for (scroll, label, view), image in zip(self.zoom_panes, images):
+                scroll.takeWidget()
+                scroll.setWidgetResizable(False)
+                view.set_image(image)
+                scroll.setWidget(view)
+            centers = [(0.5, 0.5)] * len(self.zoom_panes)
+        self.zoom_factor = zoom
+        for (scroll, _, view), center in zip(self.zoom_panes, centers):
+            view.set_zoom(zoom)
+            self.set_scroll_center(scroll, center)
+        self.status_bar.showMessage(f"Zoom: {zoom * 100:.0f}%")
+
+    def scroll_center(self, scroll):
+        """Centre of the visible area as a fraction of the content size"""
+        viewport = scroll.viewport().size()
+        widget = scroll.widget()
+        fractions = []
+        for bar, visible, total in ((scroll.horizontalScrollBar(), viewport.width(), widget.width()),
+                                    (scroll.verticalScrollBar(), viewport.height(), widget.height())):
+            fractions.append((bar.value() + visible / 2) / max(total, 1))
+        return tuple(fractions)
+
+    def set_scroll_center(self, scroll, center):
+        """Scroll so that the given content fraction is centred"""
+        viewport = scroll.viewport().size()
+        widget = scroll.widget()
+        scroll.horizontalScrollBar().setValue(round(center[0] * widget.width() - viewport.width() / 2))
+        scroll.verticalScrollBar().setValue(round(center[1] * widget.height() - viewport.height() / 2))
+
+    def sync_scroll(self, source, target, *_):
+        """Keep the input and output panes looking at the same region"""
+        if self._syncing_scroll or self.zoom_factor is None:
+            return
+        self._syncing_scroll = True
+        try:
+            for src_bar, dst_bar in ((source.horizontalScrollBar(), target.horizontalScrollBar()),
+                                     (source.verticalScrollBar(), target.verticalScrollBar())):
+                if src_bar.maximum() == dst_bar.maximum():
+                    dst_bar.setValue(src_bar.value())
+                elif src_bar.maximum() > 0:
+                    # Different sizes (e.g. after Resize): keep the relative position
+                    dst_bar.setValue(round(src_bar.value() / src_bar.maximum() * dst_bar.maximum()))
+        finally:
+            self._syncing_scroll = False
 
     def show_error(self, message):
         """Show error message in a dialog box"""
@@ -520,9 +1532,13 @@ class ImageProcessingGUI(QMainWindow):
 
     def closeEvent(self, event):
         """Handle application closing"""
-        if self.video_capture is not None:
-            self.video_capture.release()
-            self.timer.stop()
+        self.stop_capture()
+        self.stop_sources()
+        self.processing_engine.shutdown()
+        for job in (self.export_job, self.image_export_job):
+            if job is not None:
+                job.cancel()
+        TILED.shutdown()
         event.accept()
 
 def main():
@@ -530,7 +1546,9 @@ def main():
     app = QApplication(sys.argv)
     window = ImageProcessingGUI()
     window.show()
+    if WARM_UP_DELAY_MS is not None:
+        QTimer.singleShot(WARM_UP_DELAY_MS, window.warm_up)
     sys.exit(app.exec())
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -0,0 +1,215 @@
+"""
+Headless batch processing.
+Applies a pipeline saved from the GUI (File > Save Pipeline) to a directory
+or glob of images on a process pool, without importing Qt:
+
+    python batch.py pipeline.json "images/*.png" -o results -j 8
+
+Results keep their paths below the deepest directory holding every input.
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import cv2
+import numpy as np
+
+from image_loader import MAPPED_EXTENSIONS, is_mapped, load_image
+from pipeline import Pipeline
+from tiling import TILED
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp") + MAPPED_EXTENSIONS
+
+_plan = None
+
+
+def collect_inputs(patterns):
+    """Expand directories and glob patterns into a sorted list of image files"""
+    files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            candidates = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+        else:
+            candidates = glob.glob(pattern, recursive=True)
+        files.extend(path for path in candidates
+                     if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS))
+    return sorted(set(files))
+
+
+def input_root(files):
+    """Deepest directory containing every file, None if there is none (other drives)"""
+    try:
+        return os.path.commonpath([os.path.dirname(os.path.abspath(f)) for f in files])
+    except ValueError:
+        return None
+
+
+def output_path(file_name, output_dir, extension=None, root=None):
+    """Output file of file_name, at its path relative to root when given"""
+    if root is None:
+        relative = os.path.basename(file_name)
+    else:
+        relative = os.path.relpath(os.path.abspath(file_name), root)
+    stem, ext = os.path.splitext(relative)
+    return os.path.join(output_dir, stem + (extension or ext))
+
+
+def output_paths(files, output_dir, extension=None):
+    """
+    Output file of every input, mirroring the directories below their common
+    root. Raises ValueError when two inputs would be written to the same file,
+    e.g. img.tif and img.png with --ext .png.
+    """
+    root = input_root(files)
+    outputs, sources = {}, {}
+    for file_name in files:
+        out_name = outputs[file_name] = output_path(file_name, output_dir, extension, root)
+        key = os.path.normcase(out_name)
+        if key in sources:
+            raise ValueError(f"{sources[key]} and {file_name} would both be written to {out_name}")
+        sources[key] = file_name
+    return outputs
+
+
+def init_worker(pipeline_dict, single_threaded):
+    """Compile the pipeline once per worker process"""
+    global _plan
+    if single_threaded:
+        # Parallelism comes from the process pool, avoid oversubscription
+        cv2.setNumThreads(1)
+        TILED.configure(workers=1)
+    _plan = Pipeline.from_dict(pipeline_dict).compile()
+
+
+def write_image(file_name, image):
+    """Write image with cv2.imwrite, or as .npy / headerless .raw data"""
+    ext = os.path.splitext(file_name)[1].lower()
+    if ext == ".npy":
+        np.save(file_name, image)
+    elif ext == ".raw":
+        image.tofile(file_name)
+    elif not cv2.imwrite(file_name, image):
+        raise ValueError(f"Could not write image: {file_name}")
+
+
+def process_file(file_name, out_name):
+    """Read, process and write one image; returns per-stage timings in seconds"""
+    t0 = time.perf_counter()
+    image = load_image(file_name)
+    t1 = time.perf_counter()
+    written = False
+    if (is_mapped(image) and _plan.reach() is not None and len(_plan)
+            and out_name.lower().endswith(".npy")):
+        # Mapped inputs stream in strips straight to a mapped .npy output,
+        # so neither image is ever held in RAM as a whole
+        result = _plan.run_strips(image, out=lambda shape, dtype: np.lib.format.open_memmap(
+            out_name, "w+", dtype, shape))
+        result.flush()
+        written = True
+    else:
+        # Same processing as the GUI, see CompiledPipeline.process()
+        result = _plan.process(image)
+    t2 = time.perf_counter()
+    if not written:
+        write_image(out_name, result)
+    t3 = time.perf_counter()
+    return {"read": t1 - t0, "process": t2 - t1, "write": t3 - t2,
+            "total": t3 - t0, "pixels": image.shape[0] * image.shape[1]}
+
+
+def run_batch(pipeline, files, output_dir, jobs=None, max_in_flight=None,
+              extension=None, report=print):
+    """
+    Process files on a pool of `jobs` processes with at most `max_in_flight`
+    images submitted at once. Returns (timings per file, failures, wall time).
+    Raises ValueError before starting when two outputs would collide.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    max_in_flight = max_in_flight or 2 * jobs
+    outputs = output_paths(files, output_dir, extension)
+    for directory in sorted({os.path.dirname(out_name) for out_name in outputs.values()}):
+        os.makedirs(directory, exist_ok=True)
+    pending = iter(files)
+    in_flight = {}
+    timings, failures = {}, {}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(jobs, initializer=init_worker,
+                             initargs=(pipeline.to_dict(), jobs > 1)) as pool:
+        while True:
+            while len(in_flight) < max_in_flight:
+                file_name = next(pending, None)
+                if file_name is None:
+                    break
+                future = pool.submit(process_file, file_name, outputs[file_name])
+                in_flight[future] = file_name
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                file_name = in_flight.pop(future)
+                try:
+                    timing = timings[file_name] = future.result()
+                    report(f"{file_name}: read {timing['read'] * 1000:.1f} ms, "
+                           f"process {timing['process'] * 1000:.1f} ms, "
+                           f"write {timing['write'] * 1000:.1f} ms")
+                except Exception as e:
+                    failures[file_name] = str(e)
+                    report(f"{file_name}: FAILED ({e})")
+    return timings, failures, time.perf_counter() - start
+
+
+def summarize(timings, failures, wall_time):
+    """Throughput summary of a batch run"""
+    lines = [f"Processed {len(timings)} image(s), {len(failures)} failed, in {wall_time:.2f} s"]
+    if timings:
+        totals = np.array([t["total"] for t in timings.values()]) * 1000
+        processing = np.array([t["process"] for t in timings.values()]) * 1000
+        megapixels = sum(t["pixels"] for t in timings.values()) / 1e6
+        lines.append(f"Throughput: {len(timings) / wall_time:.2f} images/s, "
+                     f"{megapixels / wall_time:.1f} MP/s")
+        lines.append(f"Per image: p50 {np.percentile(totals, 50):.1f} ms, "
+                     f"p95 {np.percentile(totals, 95):.1f} ms, "
+                     f"processing mean {processing.mean():.1f} ms")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Apply a saved pipeline to many images")
+    parser.add_argument("pipeline", help="pipeline JSON saved from the GUI")
+    parser.add_argument("inputs", nargs="+", help="image files, directories or glob patterns")
+    parser.add_argument("-o", "--output-dir", default="batch_output")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="worker processes (default: CPU count)")
+    parser.add_argument("--max-in-flight", type=int, default=None,
+                        help="images submitted at once (default: 2 x jobs)")
+    parser.add_argument("--ext", default=None, help="output extension, e.g. .png")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only print the summary")
+    args = parser.parse_args(argv)
+
+    try:
+        pipeline = Pipeline.load(args.pipeline)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error loading pipeline: {e}", file=sys.stderr)
+        return 2
+    files = collect_inputs(args.inputs)
+    if not files:
+        print("No input images found", file=sys.stderr)
+        return 2
+
+    report = (lambda message: None) if args.quiet else print
+    try:
+        timings, failures, wall_time = run_batch(pipeline, files, args.output_dir, args.jobs,
+                                                 args.max_in_flight, args.ext, report)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    print(summarize(timings, failures, wall_time))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
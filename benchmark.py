@@ -0,0 +1,550 @@
+"""
+Benchmark suite for the frame hot path.
+Times every registered operation, representative operation chains, the
+feature detectors with keyframe tracking on a panning sequence and the GUI
+paths (display_image, update_frame, process_image) on synthetic frames
+at the capture resolutions and a large still, using the offscreen Qt
+platform. Results are written as JSON; --baseline compares them against an
+earlier run and exits with status 1 when a case got slower:
+
+    python benchmark.py -o baseline.json
+    python benchmark.py -o current.json --baseline baseline.json
+
+--scaling times the tiled neighbourhood filters with 1, 2, 4, ... worker
+threads up to the core count and checks that every tiled result is
+identical to the untiled one. --kmeans compares the K-means operation with
+cv2.kmeans over every pixel: speed, clustering error and, on a panning
+sequence, how many pixels change colour from one frame to the next.
+--startup launches the GUI in fresh processes and times the imports, the
+window construction and the first paint:
+
+    python benchmark.py --startup -o startup.json --baseline startup-baseline.json
+"""
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import cv2
+import numpy as np
+
+from capture import FrameInfo
+from pipeline import OPERATIONS, Pipeline, get_operation
+from tiling import DEFAULT_TILE_SIZE, TILED
+
+# The resolutions offered by the webcam source plus a large still image
+SIZES = {
+    "640x480": (640, 480),
+    "1280x720": (1280, 720),
+    "1920x1080": (1920, 1080),
+    "still": (4000, 3000),
+}
+
+CHAINS = {
+    "denoise+edges": [("Gaussian Blur", {}), ("Canny", {})],
+    "enhance+threshold": [("Histogram Equalization", {}), ("Contrast Stretching", {}),
+                          ("Threshold", {})],
+    "morphology": [("Opening", {}), ("Closing", {})],
+    "geometric": [("Rotate", {}), ("Perspective", {})],
+    "features": [("Median Filter", {}), ("ORB", {})],
+}
+
+# Operations with a halo at a heavier setting than their defaults
+SCALING_CASES = {
+    "Gaussian Blur": {"ksize": 15},
+    "Median Filter": {"ksize": 7},
+    "Bilateral Filter": {},
+    "Erosion": {"ksize": 7},
+    "Closing": {"ksize": 7},
+}
+
+# Feature detectors timed on a panning sequence with keyframe tracking
+TRACKING_OPS = ("SIFT", "SURF", "ORB")
+TRACKING_KEYFRAME_INTERVAL = 30
+
+KMEANS_K = 4
+KMEANS_ITERATIONS = 10
+# Colour differences up to this are centre drift, not a change of cluster
+FLICKER_TOLERANCE = 12
+
+GUI_CASES = ("gui/display_image", "gui/display_image_unchanged", "gui/update_frame",
+             "gui/process_image")
+
+RESULT_FORMAT = 1
+
+# Run in a fresh interpreter by --startup; prints the phases in ms as JSON
+STARTUP_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import base_gui_for_MKT6121_by_eb as gui
+imported = time.perf_counter()
+from PyQt6.QtCore import QEvent, QObject, QTimer
+from PyQt6.QtWidgets import QApplication
+app = QApplication(sys.argv)
+window = gui.ImageProcessingGUI()
+built = time.perf_counter()
+painted = []
+
+def done():
+    painted.append(time.perf_counter())
+    app.quit()
+
+class FirstPaint(QObject):
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Type.Paint and not painted:
+            # Every widget of the first frame is painted in this loop turn
+            painted.append(None)
+            QTimer.singleShot(0, done)
+        return False
+
+first_paint = FirstPaint()
+app.installEventFilter(first_paint)
+QTimer.singleShot(10000, app.quit)
+window.show()
+app.exec()
+# A Python filter left installed crashes the interpreter at exit
+app.removeEventFilter(first_paint)
+ms = lambda t: (t - started) * 1000.0
+print(json.dumps({"startup/import": ms(imported), "startup/window": ms(built),
+                  "startup/first_paint": ms(painted[-1]) if painted[-1:] != [None] else None}))
+"""
+
+
+def synthetic_frame(width, height, seed=0):
+    """Deterministic BGR frame with smooth gradients, edges and noise"""
+    rng = np.random.default_rng(seed)
+    coarse = rng.integers(0, 256, (max(2, height // 32), max(2, width // 32), 3), dtype=np.uint8)
+    frame = cv2.resize(coarse, (width, height), interpolation=cv2.INTER_CUBIC)
+    for _ in range(12):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        radius = int(rng.integers(min(width, height) // 40, min(width, height) // 6))
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        cv2.circle(frame, center, radius, color, -1)
+    noise = rng.integers(-12, 13, frame.shape, dtype=np.int16)
+    return np.clip(frame.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+def measure(func, min_time=0.3, min_runs=3, max_runs=100):
+    """Run func after one warm-up call until min_time elapsed; times in ms"""
+    func()
+    samples = []
+    start = time.perf_counter()
+    while len(samples) < max_runs and (len(samples) < min_runs
+                                       or time.perf_counter() - start < min_time):
+        t0 = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    return summarize(samples)
+
+
+def summarize(samples):
+    """Statistics of a list of times in ms"""
+    samples = np.array(samples)
+    return {"median_ms": float(np.median(samples)), "p95_ms": float(np.percentile(samples, 95)),
+            "mean_ms": float(samples.mean()), "min_ms": float(samples.min()),
+            "runs": int(samples.size)}
+
+
+def panning_frames(width, height, count=60, seed=0):
+    """Frames of a camera panning across a larger synthetic scene"""
+    scene = synthetic_frame(width + 2 * count, height + count, seed)
+    return [np.ascontiguousarray(scene[i // 2:i // 2 + height, i:i + width])
+            for i in range(count)]
+
+
+def run_plan(plan, frame):
+    """Process a frame the way the GUI and the batch CLI do"""
+    return plan.process(frame)
+
+
+def operation_cases():
+    get_operation("Gaussian Blur")  # loads the built-in operations
+    for name, operation in sorted(OPERATIONS.items()):
+        if operation.available():
+            yield f"op/{name}", Pipeline([(name, {})])
+
+
+def chain_cases():
+    for name, steps in CHAINS.items():
+        yield f"chain/{name}", Pipeline(steps)
+
+
+def tracking_cases():
+    for name in TRACKING_OPS:
+        if get_operation(name).available():
+            pipeline = Pipeline([(name, {})])
+            pipeline.set_keyframe_interval(TRACKING_KEYFRAME_INTERVAL)
+            yield f"track/{name}", pipeline
+
+
+def frame_cycle(plan, frames):
+    """Callable running plan on the next frame of the sequence on each call"""
+    position = [0]
+
+    def step():
+        run_plan(plan, frames[position[0] % len(frames)])
+        position[0] += 1
+    return step
+
+
+class SyntheticGrabber:
+    """Stands in for capture.FrameGrabber, delivering a new frame on every call"""
+    def __init__(self, frames):
+        self.frames = frames
+        self.index = 0
+        self.error = None
+
+    def latest(self, due_index=None):
+        frame = self.frames[self.index % len(self.frames)]
+        self.index += 1
+        return frame, FrameInfo(self.index, time.perf_counter())
+
+    def exhausted(self):
+        return False
+
+    def stats(self):
+        return {"dropped": 0, "late": 0, "skipped": 0}
+
+    def stop(self):
+        pass
+
+
+class GuiBench:
+    """Drives the GUI hot paths of an offscreen ImageProcessingGUI"""
+    def __init__(self):
+        from PyQt6.QtCore import QEventLoop
+        from PyQt6.QtWidgets import QApplication
+        import base_gui_for_MKT6121_by_eb as gui
+
+        self.app = QApplication.instance() or QApplication(sys.argv)
+        self.window = gui.ImageProcessingGUI()
+        self.window.show_error = lambda message: print(f"error: {message}", file=sys.stderr)
+        self.window.show()
+        self.app.processEvents()
+        self._loop = QEventLoop()
+        self._error = None
+        engine = self.window.processing_engine
+        engine.finished.connect(lambda *_: self._loop.quit())
+        engine.failed.connect(self._on_failed)
+
+    def _on_failed(self, message, job):
+        # A failed job never emits finished, the wait must end here too
+        self._error = message
+        self._loop.quit()
+
+    def cases(self, frames):
+        window = self.window
+        label = window.input_image_label
+        frame = frames[0]
+
+        def display():
+            window.display_image(frame, label)
+
+        def display_unchanged():
+            window.display_image(frame, label, ("bench", 0))
+
+        def update_frame():
+            window.update_frame()
+            self.app.processEvents()
+
+        def process_image():
+            window.process_image(live=True)
+            self._loop.exec()
+            if self._error is not None:
+                message, self._error = self._error, None
+                raise RuntimeError(f"gui/process_image failed: {message}")
+
+        yield "gui/display_image", display
+        yield "gui/display_image_unchanged", display_unchanged
+        yield "gui/update_frame", update_frame
+        yield "gui/process_image", process_image
+
+    def run(self, size_name, frames, chain, timing, selected):
+        """Time the selected GUI cases; process_image runs the given chain"""
+        window = self.window
+        results = {}
+        window.frame_grabber = SyntheticGrabber(frames)
+        window.current_image = frames[0]
+        window.pipeline = Pipeline(chain)
+        window.compiled_pipeline = window.pipeline.compile()
+        try:
+            for name, func in self.cases(frames):
+                key = f"{name}/{size_name}"
+                if selected(key):
+                    results[key] = measure(func, **timing)
+        finally:
+            window.frame_grabber = None
+        return results
+
+
+def environment():
+    return {"python": platform.python_version(), "numpy": np.__version__,
+            "opencv": cv2.__version__, "platform": platform.platform(),
+            "machine": platform.machine(), "cpu_count": os.cpu_count(),
+            "opencv_threads": cv2.getNumThreads()}
+
+
+def run_suite(sizes, patterns=None, timing=None, gui=True, report=print):
+    """Run every case matching patterns at the given sizes; returns the result dict"""
+    timing = timing or {}
+    cv2.setRNGSeed(0)
+    results = {}
+
+    def selected(key):
+        return not patterns or any(fnmatch.fnmatch(key, p) for p in patterns)
+
+    def record(key, stats):
+        results[key] = stats
+        report(f"{key:<55} median {stats['median_ms']:9.2f} ms  "
+               f"p95 {stats['p95_ms']:9.2f} ms  ({stats['runs']} runs)")
+
+    gui_bench = None
+    for size_name in sizes:
+        width, height = SIZES[size_name]
+        frames = [synthetic_frame(width, height, seed) for seed in range(2)]
+        for name, pipeline in list(operation_cases()) + list(chain_cases()):
+            key = f"{name}/{size_name}"
+            if selected(key):
+                plan = pipeline.compile()
+                record(key, measure(lambda: run_plan(plan, frames[0]), **timing))
+        tracking = [(f"{name}/{size_name}", pipeline) for name, pipeline in tracking_cases()]
+        if any(selected(key) for key, _ in tracking):
+            # Per-frame cost averaged over keyframes and tracked frames
+            sequence = panning_frames(width, height)
+            for key, pipeline in tracking:
+                if selected(key):
+                    record(key, measure(frame_cycle(pipeline.compile(), sequence), **timing))
+        if gui and any(selected(f"{name}/{size_name}") for name in GUI_CASES):
+            if gui_bench is None:
+                gui_bench = GuiBench()
+            for key, stats in gui_bench.run(size_name, frames, CHAINS["denoise+edges"],
+                                            timing, selected).items():
+                record(key, stats)
+    return {"format": RESULT_FORMAT, "environment": environment(), "results": results}
+
+
+def worker_counts(limit=None):
+    """1, 2, 4, ... up to the core count (or limit), always including it"""
+    limit = limit or os.cpu_count() or 1
+    counts = [1]
+    while counts[-1] * 2 < limit:
+        counts.append(counts[-1] * 2)
+    if limit > 1:
+        counts.append(limit)
+    return counts
+
+
+def run_scaling(sizes, patterns=None, timing=None, tile_size=DEFAULT_TILE_SIZE,
+                workers=None, report=print):
+    """
+    Time SCALING_CASES tiled over each worker count; returns the result dict.
+    Every entry records its speedup over one worker and whether the output
+    matched the untiled result exactly.
+    """
+    timing = timing or {}
+    results = {}
+    get_operation("Gaussian Blur")
+    for size_name in sizes:
+        width, height = SIZES[size_name]
+        frame = synthetic_frame(width, height)
+        for name, params in SCALING_CASES.items():
+            plan = Pipeline([(name, params)]).compile()
+            TILED.configure(tile_size, 1)
+            reference = run_plan(plan, frame)
+            base = None
+            for count in worker_counts(workers):
+                key = f"tiled/{name}/{size_name}/w{count}"
+                if patterns and not any(fnmatch.fnmatch(key, p) for p in patterns):
+                    continue
+                TILED.configure(workers=count, min_pixels=0)
+                stats = measure(lambda: run_plan(plan, frame), **timing)
+                stats["identical"] = bool(np.array_equal(run_plan(plan, frame), reference))
+                base = base or stats["median_ms"]
+                stats["speedup"] = base / stats["median_ms"]
+                results[key] = stats
+                report(f"{key:<55} median {stats['median_ms']:9.2f} ms  "
+                       f"x{stats['speedup']:5.2f}  identical={stats['identical']}")
+    TILED.configure(DEFAULT_TILE_SIZE, 0)
+    return {"format": RESULT_FORMAT, "environment": environment(), "results": results}
+
+
+def cv2_kmeans(frame, k=KMEANS_K, iterations=KMEANS_ITERATIONS):
+    """The previous K-means operation: cv2.kmeans over every pixel"""
+    samples = frame.reshape(-1, frame.shape[2] if frame.ndim == 3 else 1).astype(np.float32)
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, iterations, 1.0)
+    cv2.setRNGSeed(0)
+    _, labels, centers = cv2.kmeans(samples, k, None, criteria, 1, cv2.KMEANS_PP_CENTERS)
+    palette = np.clip(np.round(centers), 0, 255).astype(np.uint8)
+    return palette[labels.ravel()].reshape(frame.shape)
+
+
+def squared_error(frame, segmented):
+    """Sum of squared colour distances between pixels and their cluster colour"""
+    difference = frame.astype(np.float32) - segmented.astype(np.float32)
+    return float((difference * difference).sum())
+
+
+def flicker(outputs):
+    """
+    Share of scene points that change cluster between consecutive frames of
+    panning_frames(); the overlap of each pair is compared.
+    """
+    changed = total = 0
+    for i in range(len(outputs) - 1):
+        dy, dx = (i + 1) // 2 - i // 2, 1
+        current, following = outputs[i][dy:, dx:], outputs[i + 1]
+        height, width = current.shape[:2]
+        difference = cv2.absdiff(np.ascontiguousarray(current), following[:height, :width])
+        if difference.ndim == 3:
+            difference = difference.max(axis=2)
+        changed += np.count_nonzero(difference > FLICKER_TOLERANCE)
+        total += height * width
+    return changed / total
+
+
+def run_kmeans(sizes, timing=None, report=print):
+    """Time K-means against cv2.kmeans and measure quality; returns the result dict"""
+    timing = timing or {}
+    results = {}
+    steps = [("K-means", {"k": KMEANS_K, "iterations": KMEANS_ITERATIONS})]
+
+    def record(key, stats, extra):
+        stats.update(extra)
+        results[key] = stats
+        details = "  ".join(f"{name} {value:.4g}" for name, value in extra.items())
+        report(f"{key:<40} median {stats['median_ms']:9.2f} ms  {details}")
+
+    for size_name in sizes:
+        width, height = SIZES[size_name]
+        frame = synthetic_frame(width, height)
+        still = Pipeline(steps).compile()
+        video = Pipeline(steps)
+        video.set_keyframe_interval(TRACKING_KEYFRAME_INTERVAL)
+        warm = video.compile()
+        # Stills get a fresh fit per frame, video warm-starts from the last one
+        sequence = panning_frames(width, height, count=8)
+        cv2_flicker = flicker([cv2_kmeans(f) for f in sequence])
+
+        baseline = squared_error(frame, cv2_kmeans(frame))
+        reference = measure(lambda: cv2_kmeans(frame), **timing)
+        fast = measure(lambda: run_plan(still, frame), **timing)
+        record(f"kmeans/cv2/{size_name}", reference, {"error_ratio": 1.0, "flicker": cv2_flicker})
+        record(f"kmeans/fast/{size_name}", fast, {
+            "error_ratio": squared_error(frame, run_plan(still, frame)) / baseline,
+            "speedup": reference["median_ms"] / fast["median_ms"],
+            "flicker": flicker([run_plan(still, f).copy() for f in sequence])})
+        outputs = [run_plan(warm, f).copy() for f in sequence]
+        record(f"kmeans/warm/{size_name}", measure(frame_cycle(warm, sequence), **timing),
+               {"flicker": flicker(outputs)})
+    return {"format": RESULT_FORMAT, "environment": environment(), "results": results}
+
+
+def run_startup(runs=5, report=print):
+    """Time the startup phases of the GUI over several fresh processes"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    samples = {}
+    # The first launch only warms the disk cache, like the warm-up call of measure()
+    for run in range(runs + 1):
+        completed = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], cwd=here,
+                                   capture_output=True, text=True, check=True)
+        phases = json.loads(completed.stdout.strip().splitlines()[-1])
+        if phases["startup/first_paint"] is None:
+            raise RuntimeError("The window was never painted")
+        if run:
+            for key, value in phases.items():
+                samples.setdefault(key, []).append(value)
+    results = {}
+    for key, values in samples.items():
+        results[key] = summarize(values)
+        report(f"{key:<40} median {results[key]['median_ms']:9.2f} ms  "
+               f"p95 {results[key]['p95_ms']:9.2f} ms  ({runs} runs)")
+    return {"format": RESULT_FORMAT, "environment": environment(), "results": results}
+
+
+def compare(current, baseline, threshold=0.15, min_delta_ms=0.05):
+    """
+    Compare the median of every case present in both runs.
+    Returns (rows, regressions) where a row is (case, baseline ms, current ms,
+    ratio) and regressions are the rows slower by more than threshold and by
+    at least min_delta_ms, so timer noise on microsecond cases is ignored.
+    """
+    rows = []
+    for key, stats in sorted(current["results"].items()):
+        base = baseline["results"].get(key)
+        if base is None or base["median_ms"] <= 0:
+            continue
+        ratio = stats["median_ms"] / base["median_ms"]
+        rows.append((key, base["median_ms"], stats["median_ms"], ratio))
+    regressions = [row for row in rows
+                   if row[3] > 1.0 + threshold and row[2] - row[1] >= min_delta_ms]
+    return rows, regressions
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Benchmark the frame hot path")
+    parser.add_argument("-o", "--output", default="benchmark.json", help="result JSON file")
+    parser.add_argument("--baseline", help="earlier result JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="relative slowdown reported as a regression (default: 0.15)")
+    parser.add_argument("--min-delta", type=float, default=0.05,
+                        help="ignore slowdowns smaller than this many ms (default: 0.05)")
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=list(SIZES))
+    parser.add_argument("-k", "--filter", nargs="+", default=None,
+                        help="only run cases matching these glob patterns, e.g. 'op/*'")
+    parser.add_argument("--min-time", type=float, default=0.3,
+                        help="seconds spent timing each case (default: 0.3)")
+    parser.add_argument("--threads", type=int, default=None, help="OpenCV thread count")
+    parser.add_argument("--no-gui", action="store_true", help="skip the GUI paths")
+    parser.add_argument("--scaling", action="store_true",
+                        help="time the tiled filters across worker counts instead")
+    parser.add_argument("--kmeans", action="store_true",
+                        help="compare K-means with cv2.kmeans instead")
+    parser.add_argument("--startup", action="store_true",
+                        help="time the GUI startup (import, window, first paint) instead")
+    parser.add_argument("--runs", type=int, default=5,
+                        help="processes launched by --startup (default: 5)")
+    parser.add_argument("--tile-size", type=int, default=DEFAULT_TILE_SIZE,
+                        help=f"tile size for --scaling (default: {DEFAULT_TILE_SIZE})")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="highest worker count for --scaling (default: core count)")
+    args = parser.parse_args(argv)
+
+    if args.threads is not None:
+        cv2.setNumThreads(args.threads)
+    timing = {"min_time": args.min_time}
+    if args.startup:
+        data = run_startup(args.runs)
+    elif args.kmeans:
+        data = run_kmeans(args.sizes, timing)
+    elif args.scaling:
+        data = run_scaling(args.sizes, args.filter, timing, args.tile_size, args.workers)
+    else:
+        # Tile on every core, like the GUI
+        TILED.configure(DEFAULT_TILE_SIZE, 0)
+        data = run_suite(args.sizes, args.filter, timing, not args.no_gui)
+    with open(args.output, "w") as f:
+        json.dump(data, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows, regressions = compare(data, baseline, args.threshold, args.min_delta)
+        for row in rows:
+            key, base, current, ratio = row
+            flag = "  REGRESSION" if row in regressions else ""
+            print(f"{key:<55} {base:9.2f} -> {current:9.2f} ms  x{ratio:5.2f}{flag}")
+        print(f"{len(regressions)} regression(s) above {args.threshold:.0%}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
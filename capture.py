@@ -0,0 +1,262 @@
+"""
+Threaded frame capture for video files and webcams.
+The grabber decodes frames on its own thread into a preallocated ring of
+buffers so the GUI thread never blocks on cv2.VideoCapture.read().
+"""
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from profiling import PROFILER
+
+
+class FrameInfo:
+    """Metadata describing a frame stored in a FrameRing slot"""
+    __slots__ = ("index", "timestamp")
+
+    def __init__(self, index=0, timestamp=0.0):
+        self.index = index
+        self.timestamp = timestamp
+
+
+class FrameRing:
+    """
+    Fixed-size ring of preallocated frame buffers shared by one producer
+    (the grabber thread) and one consumer (the GUI).
+
+    live=True  -> latest-frame-wins: the producer overwrites the oldest
+                  unread frame when the ring is full and counts it as dropped.
+    live=False -> back-pressure: the producer waits for a free slot so that
+                  no frame of a video file is lost.
+    """
+    def __init__(self, capacity=4, live=True):
+        if capacity < 2:
+            raise ValueError("FrameRing needs at least two slots")
+        self.capacity = capacity
+        self.live = live
+        self.buffers = [None] * capacity
+        self.infos = [FrameInfo() for _ in range(capacity)]
+        self._free = deque(range(capacity))
+        self._ready = deque()
+        self._held = None
+        self._closed = False
+        self._cond = threading.Condition()
+
+        # Counters exposed through stats()
+        self.written = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.late = 0
+
+    def allocate(self, shape, dtype=np.uint8):
+        """Preallocate every slot for frames of the given shape"""
+        with self._cond:
+            for i in range(self.capacity):
+                buf = self.buffers[i]
+                if buf is None or buf.shape != tuple(shape) or buf.dtype != dtype:
+                    self.buffers[i] = np.empty(shape, dtype)
+
+    def acquire_write(self, timeout=None):
+        """Return a writable slot index, or None if the ring was closed"""
+        with self._cond:
+            while not self._free:
+                if self._closed:
+                    return None
+                if self.live and self._ready:
+                    # Latest wins: recycle the oldest unread frame
+                    self.dropped += 1
+                    return self._ready.popleft()
+                if not self._cond.wait(timeout):
+                    return None
+            if self._closed:
+                return None
+            return self._free.popleft()
+
+    def commit(self, slot, index, timestamp=None):
+        """Publish a slot filled by the producer"""
+        with self._cond:
+            info = self.infos[slot]
+            info.index = index
+            info.timestamp = time.perf_counter() if timestamp is None else timestamp
+            self._ready.append(slot)
+            self.written += 1
+            self._cond.notify_all()
+
+    def abort(self, slot):
+        """Return a slot acquired for writing without publishing it"""
+        with self._cond:
+            self._free.append(slot)
+            self._cond.notify_all()
+
+    def take(self, late_after=None, due_index=None):
+        """
+        Hand the next frame to the consumer as (buffer, FrameInfo), or None.
+        Live rings return the newest frame and drop older unread ones; file
+        rings return frames in order. With due_index, frames of a file ring
+        past that index are held back and overdue ones with a successor
+        ready are dropped. The returned buffer stays valid until the next
+        call to take() or release().
+        """
+        with self._cond:
+            if not self._ready:
+                return None
+            if self.live:
+                while len(self._ready) > 1:
+                    self._free.append(self._ready.popleft())
+                    self.dropped += 1
+            elif due_index is not None:
+                if self.infos[self._ready[0]].index > due_index:
+                    return None
+                while len(self._ready) > 1 and self.infos[self._ready[1]].index <= due_index:
+                    self._free.append(self._ready.popleft())
+                    self.dropped += 1
+            slot = self._ready.popleft()
+            if self._held is not None:
+                self._free.append(self._held)
+            self._held = slot
+            self.delivered += 1
+            info = self.infos[slot]
+            if late_after is not None and time.perf_counter() - info.timestamp > late_after:
+                self.late += 1
+            self._cond.notify_all()
+            return self.buffers[slot], info
+
+    def release(self):
+        """Give the slot held by the consumer back to the producer"""
+        with self._cond:
+            if self._held is not None:
+                self._free.append(self._held)
+                self._held = None
+                self._cond.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def pending(self):
+        """Number of frames waiting to be taken"""
+        with self._cond:
+            return len(self._ready)
+
+    def close(self):
+        """Wake up and stop a producer blocked on a full ring"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class FrameGrabber(threading.Thread):
+    """
+    Decode frames from an opened cv2.VideoCapture on a background thread.
+    Frames are read directly into the FrameRing buffers, so after the first
+    frame the capture loop does not allocate. A file grabber given a started
+    FramePacer discards frames with grab() instead of decoding them while
+    playback is more than a frame behind the wall clock.
+    """
+    def __init__(self, capture, live=True, capacity=4, late_after=None, pacer=None):
+        super().__init__(daemon=True)
+        self.capture = capture
+        self.ring = FrameRing(capacity, live=live)
+        self.live = live
+        self.late_after = late_after
+        self.pacer = pacer
+        self.skipped = 0
+        self.finished = threading.Event()
+        self.error = None
+        self._stop_event = threading.Event()
+        self._frame_index = 0
+        self.read_failures = 0
+
+    def run(self):
+        try:
+            self._loop()
+        except Exception as e:  # surfaced to the GUI through self.error
+            self.error = e
+        finally:
+            self.finished.set()
+
+    def _loop(self):
+        ring = self.ring
+        while not self._stop_event.is_set():
+            slot = ring.acquire_write(timeout=0.1)
+            if slot is None:
+                if ring.closed:
+                    break
+                continue
+            if self.pacer is not None and self.pacer.started and not self._skip_overdue():
+                ring.abort(slot)
+                break
+            with PROFILER.span("capture.read"):
+                ok = self._read_into(slot)
+            if self._stop_event.is_set():
+                ring.abort(slot)
+                break
+            if not ok:
+                ring.abort(slot)
+                if self.live:
+                    # USB cameras occasionally fail a single grab; keep trying
+                    self.read_failures += 1
+                    if self.read_failures > 50:
+                        break
+                    time.sleep(0.01)
+                    continue
+                break
+            self.read_failures = 0
+            ring.commit(slot, self._frame_index)
+            self._frame_index += 1
+
+    def _skip_overdue(self):
+        """Grab without decoding frames the pacer says are already overdue"""
+        due = self.pacer.due_index()
+        while self._frame_index < due - 1 and not self._stop_event.is_set():
+            if not self.capture.grab():
+                return False
+            self._frame_index += 1
+            self.skipped += 1
+        return True
+
+    def _read_into(self, slot):
+        """Decode the next frame into the ring slot, reusing its buffer"""
+        buf = self.ring.buffers[slot]
+        if buf is None:
+            ret, frame = self.capture.read()
+            if ret:
+                self.ring.allocate(frame.shape, frame.dtype)
+                np.copyto(self.ring.buffers[slot], frame)
+            return ret
+        ret, frame = self.capture.read(buf)
+        if ret and frame is not buf:
+            # Resolution changed mid-stream: the decoder allocated a new array
+            self.ring.buffers[slot] = frame
+        return ret
+
+    def latest(self, due_index=None):
+        """Return (frame, FrameInfo) for the next frame to show, or None"""
+        return self.ring.take(self.late_after, due_index)
+
+    def exhausted(self):
+        """True when the source ended and every decoded frame was consumed"""
+        return self.finished.is_set() and self.ring.pending() == 0
+
+    def stats(self):
+        """Capture counters for display in the status bar"""
+        ring = self.ring
+        return {
+            "captured": ring.written,
+            "delivered": ring.delivered,
+            "dropped": ring.dropped,
+            "late": ring.late,
+            "skipped": self.skipped,
+        }
+
+    def stop(self, timeout=1.0, release=True):
+        """Stop the capture thread and, unless release=False, the capture device"""
+        self._stop_event.set()
+        self.ring.close()
+        if self.is_alive():
+            self.join(timeout)
+        self.ring.release()
+        if release:
+            self.capture.release()
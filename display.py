@@ -0,0 +1,104 @@
+"""
+Fast path from OpenCV frames to QLabel pixmaps.
+Frames are resized to the label size before they are wrapped in a QImage
+(an integer-factor cv2.INTER_AREA decimation, which OpenCV runs on a fast
+path, followed by a small bilinear step). BGR data is handed to Qt as
+Format_BGR888 so no colour conversion is needed, and repaints are skipped
+when neither the frame nor the label geometry changed.
+"""
+import cv2
+import numpy as np
+from PyQt6.QtGui import QImage, QPixmap
+
+from profiling import PROFILER
+
+QIMAGE_FORMATS = {
+    1: QImage.Format.Format_Grayscale8,
+    3: QImage.Format.Format_BGR888,
+    4: QImage.Format.Format_ARGB32,  # BGRA byte order on little-endian hosts
+}
+
+
+def fit_size(width, height, max_width, max_height):
+    """Largest size with the image aspect ratio that fits in max_width x max_height"""
+    aspect_ratio = width / height
+    if max_width / aspect_ratio <= max_height:
+        return max(1, max_width), max(1, int(max_width / aspect_ratio))
+    return max(1, int(max_height * aspect_ratio)), max(1, max_height)
+
+
+def to_uint8(image):
+    """8-bit view of image for display (16-bit and float data are rescaled)"""
+    if image.dtype == np.uint8:
+        return image
+    if image.dtype == np.uint16:
+        return cv2.convertScaleAbs(image, alpha=255.0 / 65535.0)
+    return cv2.normalize(image, None, 0, 255, cv2.NORM_MINMAX, cv2.CV_8U)
+
+
+class ImageDisplay:
+    """Renders frames into one QLabel, reusing its staging buffer"""
+    def __init__(self, label):
+        self.label = label
+        self.staging = None
+        self.decimated = None
+        self.last_key = None
+        self.repaints = 0
+        self.skipped = 0
+
+    def show(self, image, key=None):
+        """
+        Display image scaled to the label. key identifies the frame content
+        (e.g. a frame index); when it and the label size match the previous
+        call the repaint is skipped. key=None always repaints.
+        """
+        if image is None:
+            return
+        height, width = image.shape[:2]
+        label_width, label_height = self.label.width(), self.label.height()
+        new_width, new_height = fit_size(width, height, label_width, label_height)
+
+        cache_key = None if key is None else (key, new_width, new_height, image.shape)
+        if cache_key is not None and cache_key == self.last_key:
+            self.skipped += 1
+            return
+        self.last_key = cache_key
+
+        with PROFILER.span("display.scale"):
+            scaled = self._scale(image, new_width, new_height)
+        with PROFILER.span("display.paint"):
+            channels = 1 if scaled.ndim == 2 else scaled.shape[2]
+            qt_image = QImage(scaled.data, new_width, new_height, scaled.strides[0],
+                              QIMAGE_FORMATS[channels])
+            # fromImage copies the pixels, so the staging buffer can be reused
+            self.label.setPixmap(QPixmap.fromImage(qt_image))
+        self.repaints += 1
+
+    def _scale(self, image, width, height):
+        if image.dtype != np.uint8:
+            if image.shape[1] > width and image.dtype in (np.uint16, np.float32):
+                # Shrink before converting so no full-size 8-bit copy is made
+                image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+            with PROFILER.span("display.convert"):
+                image = to_uint8(image)
+        if image.ndim == 3 and image.shape[2] == 1:
+            image = image[:, :, 0]
+        if (width, height) == (image.shape[1], image.shape[0]):
+            return np.ascontiguousarray(image)
+        src_height, src_width = image.shape[:2]
+        factor = min(src_width // width, src_height // height)
+        if factor > 1:
+            # Exact integer ratios take OpenCV's fast INTER_AREA path; the
+            # cropped remainder is at most factor - 1 pixels
+            shape = (src_height // factor, src_width // factor) + image.shape[2:]
+            if self.decimated is None or self.decimated.shape != shape:
+                self.decimated = np.empty(shape, np.uint8)
+            cropped = image[:shape[0] * factor, :shape[1] * factor]
+            image = cv2.resize(cropped, (shape[1], shape[0]), dst=self.decimated,
+                               interpolation=cv2.INTER_AREA)
+            if (width, height) == (shape[1], shape[0]):
+                return image
+        shape = (height, width) + image.shape[2:]
+        if self.staging is None or self.staging.shape != shape:
+            self.staging = np.empty(shape, np.uint8)
+        return cv2.resize(image, (width, height), dst=self.staging, interpolation=cv2.INTER_LINEAR)
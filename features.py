@@ -0,0 +1,196 @@
+"""
+Keypoint tracking for feature detection on video.
+Running SIFT/SURF/ORB on every frame is far too slow for live video, so a
+FeatureTracker detects keypoints and descriptors only on keyframes and
+follows them with pyramidal Lucas-Kanade optical flow in between. A track
+is kept only if flowing it back lands where it started; when too few tracks
+survive, or after keyframe_interval frames, the next frame is a keyframe
+again. Detectors that turn out cheaper than the optical flow (ORB on a fast
+machine) simply detect on every frame instead, trying tracking again every
+keyframe_interval frames in case the costs have changed. The descriptors of the first
+keyframe go into a DescriptorIndex (FLANN, with LSH for binary descriptors),
+against which every later keyframe is matched, so the share of keypoints
+still recognised is known. A tracker is not thread-safe; pipelines keep one
+per plan and feed it the frames one at a time, in order.
+"""
+import time
+
+import cv2
+import numpy as np
+
+from profiling import PROFILER
+
+LK_WINDOW = (15, 15)
+LK_LEVELS = 2
+LK_CRITERIA = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03)
+
+# cv2.flann index algorithms
+FLANN_INDEX_KDTREE = 1
+FLANN_INDEX_LSH = 6
+
+
+def smooth(average, sample, weight=0.2):
+    """Exponential moving average of timings, started by the first sample"""
+    return sample if average is None else (1.0 - weight) * average + weight * sample
+
+
+class DescriptorIndex:
+    """
+    FLANN index of reference descriptors.
+    Binary descriptors (ORB) use locality-sensitive hashing, float ones
+    (SIFT, SURF) randomised kd-trees.
+    """
+    def __init__(self, binary, checks=32):
+        if binary:
+            index_params = dict(algorithm=FLANN_INDEX_LSH, table_number=6, key_size=12,
+                                multi_probe_level=1)
+        else:
+            index_params = dict(algorithm=FLANN_INDEX_KDTREE, trees=4)
+        self.matcher = cv2.FlannBasedMatcher(index_params, dict(checks=checks))
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, descriptors):
+        """Index another set of reference descriptors"""
+        if descriptors is None or len(descriptors) == 0:
+            return
+        self.matcher.add([descriptors])
+        self.matcher.train()
+        self.size += len(descriptors)
+
+    def clear(self):
+        self.matcher.clear()
+        self.size = 0
+
+    def match(self, descriptors, ratio=0.75):
+        """Nearest reference of every descriptor that passes Lowe's ratio test"""
+        if not self.size or descriptors is None or len(descriptors) == 0:
+            return []
+        good = []
+        for pair in self.matcher.knnMatch(descriptors, k=2):
+            if len(pair) == 1 or (len(pair) == 2 and pair[0].distance < ratio * pair[1].distance):
+                good.append(pair[0])
+        return good
+
+
+class FeatureTracker:
+    """
+    Keypoints of a frame sequence, detected on keyframes and tracked with
+    optical flow in between. update() is fed consecutive gray frames.
+    """
+    def __init__(self, detector, keyframe_interval=30, min_survival=0.6, max_error=1.0):
+        self.detector = detector
+        self.keyframe_interval = keyframe_interval
+        self.min_survival = min_survival
+        self.max_error = max_error
+        self.index = None
+        self.keypoints = []
+        self.descriptors = None
+        # Whether each keypoint matched the reference keyframe
+        self.matched = np.zeros(0, bool)
+        # Previous frame; the caller's buffer is reused for the next one
+        self._previous = None
+        self._detected = 0
+        self._age = 0
+        # Running averages of the seconds for a plain detect() and per
+        # tracked frame
+        self._detect_cost = None
+        self._track_cost = None
+
+        # Counters exposed through stats()
+        self.keyframes = 0
+        self.tracked_frames = 0
+        self.match_ratio = 1.0
+
+    def update(self, gray):
+        """Keypoints of the next frame"""
+        if not self._tracking_pays():
+            started = time.perf_counter()
+            with PROFILER.span("features.detect"):
+                self.keypoints = self.detector.detect(gray, None)
+            self._detect_cost = smooth(self._detect_cost, time.perf_counter() - started)
+            self.matched = np.ones(len(self.keypoints), bool)
+            self._age += 1
+            if self._age >= self.keyframe_interval:
+                # Measure tracking again from a fresh keyframe on the next frame
+                self._track_cost = None
+                self._previous = None
+            return self.keypoints
+        previous = self._previous
+        if (previous is None or previous.shape != gray.shape
+                or self._age + 1 >= self.keyframe_interval or not self._track(previous, gray)):
+            self._detect(gray)
+        if self.keyframe_interval > 1:
+            if previous is None or previous.shape != gray.shape:
+                previous = self._previous = np.empty_like(gray)
+            np.copyto(previous, gray)
+        return self.keypoints
+
+    def _tracking_pays(self):
+        return self._track_cost is None or self._track_cost < self._detect_cost
+
+    def _detect(self, gray):
+        with PROFILER.span("features.detect"):
+            if self._detect_cost is None:
+                # Time the detector alone once, it is what tracking competes with
+                started = time.perf_counter()
+                keypoints = self.detector.detect(gray, None)
+                self._detect_cost = time.perf_counter() - started
+                keypoints, descriptors = self.detector.compute(gray, keypoints)
+            else:
+                keypoints, descriptors = self.detector.detectAndCompute(gray, None)
+        self.keypoints = list(keypoints)
+        self.descriptors = descriptors
+        self.matched = np.zeros(len(self.keypoints), bool)
+        self._detected = len(self.keypoints)
+        self._age = 0
+        self.keyframes += 1
+        if descriptors is None:
+            return
+        if self.index is None:
+            # The first keyframe is the reference later keyframes are matched to
+            self.index = DescriptorIndex(descriptors.dtype == np.uint8)
+            self.index.add(descriptors)
+            self.matched[:] = True
+        else:
+            with PROFILER.span("features.match"):
+                for match in self.index.match(descriptors):
+                    self.matched[match.queryIdx] = True
+        self.match_ratio = float(self.matched.mean()) if len(self.matched) else 0.0
+
+    def _track(self, previous, gray):
+        """Move the keypoints to the new frame; False when too few survive"""
+        if not self.keypoints:
+            return False
+        started = time.perf_counter()
+        with PROFILER.span("features.track"):
+            points = cv2.KeyPoint_convert(self.keypoints).reshape(-1, 1, 2)
+            moved, status, _ = cv2.calcOpticalFlowPyrLK(
+                previous, gray, points, None, winSize=LK_WINDOW, maxLevel=LK_LEVELS,
+                criteria=LK_CRITERIA)
+            back, back_status, _ = cv2.calcOpticalFlowPyrLK(
+                gray, previous, moved, None, winSize=LK_WINDOW, maxLevel=LK_LEVELS,
+                criteria=LK_CRITERIA)
+        self._track_cost = smooth(self._track_cost, time.perf_counter() - started)
+        error = np.linalg.norm((points - back).reshape(-1, 2), axis=1)
+        keep = (status.ravel() == 1) & (back_status.ravel() == 1) & (error < self.max_error)
+        if keep.sum() < self.min_survival * self._detected:
+            return False
+        moved = moved.reshape(-1, 2)
+        self.keypoints = [cv2.KeyPoint(float(x), float(y), kp.size, kp.angle, kp.response,
+                                       kp.octave, kp.class_id)
+                          for kp, (x, y), ok in zip(self.keypoints, moved, keep) if ok]
+        if self.descriptors is not None:
+            self.descriptors = self.descriptors[keep]
+        self.matched = self.matched[keep]
+        self._age += 1
+        self.tracked_frames += 1
+        return True
+
+    def stats(self):
+        """Tracking counters for display"""
+        return {"keyframes": self.keyframes, "tracked": self.tracked_frames,
+                "points": len(self.keypoints), "match_ratio": self.match_ratio,
+                "tracking": self._tracking_pays()}
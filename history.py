@@ -0,0 +1,269 @@
+"""
+Memory-budgeted processing history.
+Snapshots are stored zlib-compressed, either as keyframes or as deltas
+against the previous snapshot, and the oldest entries are spilled to a
+temporary file or evicted once the byte budget is exceeded.
+
+Concurrent use: one thread may change the history while others iterate over
+it (e.g. an export). An iterator yields the snapshots present when iter()
+was called, whatever is appended, popped, cleared or evicted afterwards;
+spill files replaced in the meantime stay open until every iterator has
+been exhausted or closed.
+"""
+import tempfile
+import threading
+import zlib
+
+import numpy as np
+
+MB = 1024 * 1024
+
+
+class _Snapshot:
+    """One compressed history entry"""
+    __slots__ = ("key", "shape", "dtype", "data", "file", "offset", "length")
+
+    def __init__(self, key, shape, dtype, data):
+        self.key = key
+        self.shape = shape
+        self.dtype = dtype
+        self.data = data
+        self.file = None
+        self.offset = None
+        self.length = len(data)
+
+    @property
+    def spilled(self):
+        return self.data is None
+
+
+class _HistoryIterator:
+    """The snapshots of a HistoryStore at the time the iterator was created"""
+    def __init__(self, store, entries):
+        self._store = store
+        self._entries = entries
+        self._index = 0
+        self._image = None
+        store._open_reader()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._entries is None:
+            raise StopIteration
+        if self._index >= len(self._entries):
+            self.close()
+            raise StopIteration
+        entry = self._entries[self._index]
+        self._index += 1
+        with self._store._lock:
+            self._image = self._store._decode(entry, self._image)
+        return self._image.copy()
+
+    def close(self):
+        """Release the store's old spill files early when not exhausted"""
+        if self._entries is not None:
+            self._entries = None
+            self._image = None
+            self._store._close_reader()
+
+    def __del__(self):
+        self.close()
+
+
+class HistoryStore:
+    """
+    List-like undo history with a byte budget.
+    Supports append(), pop(), clear(), len() and iteration from the oldest to
+    the newest image; images are decoded lazily while iterating.
+    """
+    def __init__(self, budget_bytes=256 * MB, keyframe_interval=8,
+                 spill_budget_bytes=0, compression_level=1):
+        self.budget_bytes = budget_bytes
+        self.keyframe_interval = keyframe_interval
+        self.spill_budget_bytes = spill_budget_bytes
+        self.compression_level = compression_level
+        self._entries = []
+        self._tip = None
+        self._spill_file = None
+        # Open iterators, and spill files they may still read from
+        self._readers = 0
+        self._retired = []
+        self._lock = threading.RLock()
+
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+        self.raw_bytes = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __bool__(self):
+        return bool(self._entries)
+
+    def __iter__(self):
+        """Iterate over the current snapshots, oldest first, decoding one image at a time"""
+        with self._lock:
+            return _HistoryIterator(self, list(self._entries))
+
+    def _open_reader(self):
+        with self._lock:
+            self._readers += 1
+
+    def _close_reader(self):
+        with self._lock:
+            self._readers -= 1
+            if self._readers == 0:
+                for f in self._retired:
+                    f.close()
+                self._retired.clear()
+
+    def _retire(self, f):
+        """Close a spill file no longer used by the history, once no iterator needs it"""
+        if self._readers:
+            self._retired.append(f)
+        else:
+            f.close()
+
+    def append(self, image):
+        """Add a snapshot of image to the history"""
+        with self._lock:
+            prev = self._tip
+            since_key = self._since_keyframe()
+            if (prev is None or prev.shape != image.shape or prev.dtype != image.dtype
+                    or since_key + 1 >= self.keyframe_interval):
+                entry = self._encode(True, image)
+            else:
+                # uint arithmetic wraps, so the delta is exactly invertible
+                entry = self._encode(False, np.subtract(image, prev, dtype=image.dtype))
+            self._entries.append(entry)
+            self.memory_bytes += entry.length
+            self.raw_bytes += image.nbytes
+            self._tip = image.copy()
+            self._enforce_budget()
+
+    def pop(self):
+        """Remove and return the newest snapshot"""
+        with self._lock:
+            if not self._entries:
+                raise IndexError("pop from empty history")
+            image = self._tip
+            entry = self._entries.pop()
+            self._forget(entry)
+            self.raw_bytes -= image.nbytes
+            self._tip = self._decode_index(len(self._entries) - 1) if self._entries else None
+            return image
+
+    def clear(self):
+        """Drop every snapshot"""
+        with self._lock:
+            self._entries.clear()
+            self._tip = None
+            self.memory_bytes = self.disk_bytes = self.raw_bytes = 0
+            if self._spill_file is not None:
+                self._retire(self._spill_file)
+                self._spill_file = None
+
+    def usage(self):
+        """Bytes held in RAM (including the decoded newest image) and on disk"""
+        tip = self._tip.nbytes if self._tip is not None else 0
+        return self.memory_bytes + tip, self.disk_bytes
+
+    def _since_keyframe(self):
+        count = 0
+        for entry in reversed(self._entries):
+            if entry.key:
+                return count
+            count += 1
+        return count
+
+    def _encode(self, key, array):
+        data = zlib.compress(np.ascontiguousarray(array).data, self.compression_level)
+        return _Snapshot(key, array.shape, array.dtype, data)
+
+    def _payload(self, entry):
+        if entry.spilled:
+            entry.file.seek(entry.offset)
+            data = entry.file.read(entry.length)
+        else:
+            data = entry.data
+        return np.frombuffer(zlib.decompress(data), entry.dtype).reshape(entry.shape)
+
+    def _decode(self, entry, prev):
+        payload = self._payload(entry)
+        if entry.key:
+            return payload.copy()
+        return np.add(prev, payload, dtype=entry.dtype)
+
+    def _decode_index(self, index):
+        start = index
+        while not self._entries[start].key:
+            start -= 1
+        image = None
+        for entry in self._entries[start:index + 1]:
+            image = self._decode(entry, image)
+        return image
+
+    def _forget(self, entry):
+        if entry.spilled:
+            self.disk_bytes -= entry.length
+        else:
+            self.memory_bytes -= entry.length
+
+    def _enforce_budget(self):
+        tip = self._tip.nbytes if self._tip is not None else 0
+        while self.memory_bytes + tip > self.budget_bytes and len(self._entries) > 1:
+            # The newest entry always stays in RAM, older ones go to disk
+            # first while the spill budget allows it, then they are evicted
+            resident = next((e for e in self._entries[:-1] if not e.spilled), None)
+            if resident is None:
+                break
+            if self.disk_bytes + resident.length <= self.spill_budget_bytes:
+                self._spill(resident)
+            else:
+                self._evict_oldest()
+
+    def _spill(self, entry):
+        if self._spill_file is None:
+            self._spill_file = tempfile.TemporaryFile(prefix="history_")
+        self._spill_file.seek(0, 2)
+        if self._spill_file.tell() > 2 * self.spill_budget_bytes:
+            self._compact_spill_file()
+            self._spill_file.seek(0, 2)
+        entry.file = self._spill_file
+        entry.offset = self._spill_file.tell()
+        self._spill_file.write(entry.data)
+        entry.data = None
+        self.memory_bytes -= entry.length
+        self.disk_bytes += entry.length
+
+    def _compact_spill_file(self):
+        """Rewrite the spill file without the space of evicted entries"""
+        old = self._spill_file
+        self._spill_file = tempfile.TemporaryFile(prefix="history_")
+        for entry in self._entries:
+            if entry.spilled:
+                old.seek(entry.offset)
+                data = old.read(entry.length)
+                entry.file = self._spill_file
+                entry.offset = self._spill_file.tell()
+                self._spill_file.write(data)
+        # Entries evicted since may still be read by an iterator
+        self._retire(old)
+
+    def _evict_oldest(self):
+        oldest = self._entries[0]
+        if len(self._entries) > 1 and not self._entries[1].key:
+            # The next entry is a delta against the evicted one: rebase it
+            # into a keyframe so it stays decodable
+            image = self._decode(self._entries[1], self._decode(oldest, None))
+            rebased = self._encode(True, image)
+            self._forget(self._entries[1])
+            self._entries[1] = rebased
+            self.memory_bytes += rebased.length
+        self._entries.pop(0)
+        self._forget(oldest)
+        self.raw_bytes -= int(np.prod(oldest.shape)) * np.dtype(oldest.dtype).itemsize
+        self.evicted += 1
@@ -0,0 +1,133 @@
+"""
+Background image export.
+Encodes and writes images on a worker pool (cv2.imwrite releases the GIL)
+while pulling them lazily from any iterable, such as the HistoryStore, with
+a bounded number of images in flight.
+"""
+import copy
+import os
+import threading
+import time
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import cv2
+
+
+class ExportOptions:
+    """File format and compression settings for exported images"""
+    FORMATS = {
+        "PNG": ".png",
+        "JPEG": ".jpg",
+        "WebP": ".webp",
+        "TIFF": ".tiff",
+        "BMP": ".bmp",
+    }
+    FORMAT_BY_EXTENSION = {".png": "PNG", ".jpg": "JPEG", ".jpeg": "JPEG", ".webp": "WebP",
+                           ".tif": "TIFF", ".tiff": "TIFF", ".bmp": "BMP"}
+
+    def __init__(self, fmt="PNG", png_level=3, jpeg_quality=95, webp_lossless=True,
+                 webp_quality=90):
+        if fmt not in self.FORMATS:
+            raise ValueError(f"Unsupported export format: {fmt}")
+        self.fmt = fmt
+        self.png_level = png_level
+        self.jpeg_quality = jpeg_quality
+        self.webp_lossless = webp_lossless
+        self.webp_quality = webp_quality
+
+    @classmethod
+    def for_file(cls, file_name, template=None):
+        """Options matching the extension of file_name, other settings from template"""
+        ext = os.path.splitext(file_name)[1].lower()
+        options = cls() if template is None else copy.copy(template)
+        options.fmt = cls.FORMAT_BY_EXTENSION.get(ext, "PNG")
+        return options
+
+    @property
+    def extension(self):
+        return self.FORMATS[self.fmt]
+
+    def imwrite_params(self):
+        """Parameter list for cv2.imwrite"""
+        if self.fmt == "PNG":
+            return [cv2.IMWRITE_PNG_COMPRESSION, self.png_level]
+        if self.fmt == "JPEG":
+            return [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality]
+        if self.fmt == "WebP":
+            # Quality above 100 selects lossless WebP
+            return [cv2.IMWRITE_WEBP_QUALITY, 101 if self.webp_lossless else self.webp_quality]
+        return []
+
+
+class ImageExportJob:
+    """
+    Write images to disk in the background.
+    images is any iterable of arrays and paths a matching iterable of file
+    names; at most max_in_flight images are decoded and held at once.
+    """
+    def __init__(self, images, paths, options, total=None, workers=None, max_in_flight=None):
+        self.images = images
+        self.paths = paths
+        self.options = options
+        self.total = total
+        self.workers = workers or max(1, os.cpu_count() or 1)
+        self.max_in_flight = max_in_flight or 2 * self.workers
+        self.written = 0
+        self.error = None
+        self.finished = threading.Event()
+        self._cancel = threading.Event()
+        self._started = None
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def start(self):
+        self._started = time.perf_counter()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def wait(self, timeout=None):
+        return self.finished.wait(timeout)
+
+    def progress(self):
+        """(images written, total or None, images per second)"""
+        elapsed = time.perf_counter() - self._started if self._started else 0.0
+        rate = self.written / elapsed if elapsed > 0 else 0.0
+        return self.written, self.total, rate
+
+    def _write(self, file_name, image):
+        if not cv2.imwrite(file_name, image, self.options.imwrite_params()):
+            raise ValueError(f"Could not write image: {file_name}")
+
+    def _run(self):
+        in_flight = set()
+        try:
+            with ThreadPoolExecutor(self.workers, thread_name_prefix="image-export") as pool:
+                # zip pulls (and decodes) the next image only when it is needed
+                for file_name, image in zip(self.paths, self.images):
+                    if self._cancel.is_set():
+                        break
+                    in_flight.add(pool.submit(self._write, file_name, image))
+                    if len(in_flight) >= self.max_in_flight:
+                        in_flight = self._collect(in_flight, FIRST_COMPLETED)
+                self._collect(in_flight)
+        except Exception as e:
+            self.error = e
+            self._cancel.set()
+        finally:
+            # Lets a history iterator release its spill files when cancelled
+            close = getattr(self.images, "close", None)
+            if close is not None:
+                close()
+            self.finished.set()
+
+    def _collect(self, futures, return_when=ALL_COMPLETED):
+        """Wait for written images, re-raising the first write error"""
+        done, pending = wait(futures, return_when=return_when)
+        for future in done:
+            future.result()
+            self.written += 1
+        return pending
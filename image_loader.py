@@ -0,0 +1,248 @@
+"""
+Memory-mapped loading of very large images.
+Uncompressed data is mapped instead of decoded into RAM: .npy files,
+headerless .raw files named <name>_<W>x<H>[x<C>].raw (8 or 16 bit, BGR or
+gray) and uncompressed striped or tiled TIFFs. Like cv2.imread, loading
+always returns 8-bit BGR, which is what every operation expects. 8-bit BGR
+data is mapped in place; anything else (gray, 16-bit or BGRA samples, RGB,
+tiles, scattered strips, big-endian samples) is converted into an 8-bit BGR
+raster in an anonymous temporary file one strip or tile at a time, so RAM
+use stays bounded either way. Mapped images are read-only: the pipeline
+writes its results to new buffers, and an accidental write raises instead
+of altering the file. Everything else is decoded with cv2.imread.
+"""
+import os
+import re
+import struct
+import tempfile
+import weakref
+
+import cv2
+import numpy as np
+
+MAPPED_EXTENSIONS = (".npy", ".raw", ".tif", ".tiff")
+
+RAW_NAME = re.compile(r"_(\d+)x(\d+)(?:x(\d+))?$")
+
+# TIFF field types read by the parser: BYTE, SHORT, LONG, LONG8
+TIFF_TYPES = {1: "B", 3: "H", 4: "I", 16: "Q"}
+
+TAG_WIDTH, TAG_HEIGHT, TAG_BITS, TAG_COMPRESSION = 256, 257, 258, 259
+TAG_PHOTOMETRIC, TAG_STRIP_OFFSETS, TAG_SAMPLES, TAG_ROWS_PER_STRIP = 262, 273, 277, 278
+TAG_STRIP_COUNTS, TAG_PLANAR, TAG_TILE_WIDTH, TAG_TILE_HEIGHT = 279, 284, 322, 323
+TAG_TILE_OFFSETS, TAG_SAMPLE_FORMAT = 324, 339
+
+# Rows converted at a time when mapped data is not 8-bit BGR
+CONVERT_ROWS = 256
+
+
+def is_mapped(image):
+    """True when image is backed by a file rather than RAM"""
+    return isinstance(image, np.memmap)
+
+
+def load_image(file_name):
+    """
+    Load an image as a BGR or gray array, memory-mapped when the format
+    allows it. Raises ValueError when the file cannot be read.
+    """
+    ext = os.path.splitext(file_name)[1].lower()
+    image = None
+    if ext == ".npy":
+        image = map_npy(file_name)
+    elif ext == ".raw":
+        image = map_raw(file_name)
+    elif ext in (".tif", ".tiff"):
+        image = map_tiff(file_name)
+    if image is not None:
+        return as_bgr8(image)
+    image = cv2.imread(file_name)
+    if image is None:
+        raise ValueError(f"Could not load image: {file_name}")
+    return image
+
+
+def to_bgr8(block):
+    """8-bit BGR version of a gray, BGR or BGRA block of 8 or 16-bit samples"""
+    if block.dtype != np.uint8:
+        # Same scaling as display.to_uint8
+        block = cv2.convertScaleAbs(block, alpha=255.0 / 65535.0)
+    if block.ndim == 2:
+        return cv2.cvtColor(block, cv2.COLOR_GRAY2BGR)
+    if block.shape[2] == 4:
+        return cv2.cvtColor(block, cv2.COLOR_BGRA2BGR)
+    return block
+
+
+def as_bgr8(image):
+    """image when it is 8-bit BGR, else a converted copy backed by a temporary file"""
+    if image.dtype == np.uint8 and image.ndim == 3 and image.shape[2] == 3:
+        return image
+    out = _temporary_raster(image.shape[:2])
+    for y0 in range(0, image.shape[0], CONVERT_ROWS):
+        out[y0:y0 + CONVERT_ROWS] = to_bgr8(np.ascontiguousarray(image[y0:y0 + CONVERT_ROWS]))
+    return _seal(out)
+
+
+def _temporary_raster(size):
+    backing = tempfile.TemporaryFile()
+    try:
+        image = np.memmap(backing, np.uint8, "w+", shape=tuple(size) + (3,))
+    except BaseException:
+        backing.close()
+        raise
+    # The file stays open as long as the mapping (views keep it alive through
+    # their base) and is deleted when it is closed
+    weakref.finalize(image, backing.close)
+    return image
+
+
+def _seal(image):
+    image.flush()
+    image.flags.writeable = False
+    return image
+
+
+def _check_shape(image, file_name):
+    if image.ndim == 3 and image.shape[2] == 1:
+        image = image[:, :, 0]
+    if image.ndim not in (2, 3) or (image.ndim == 3 and image.shape[2] not in (3, 4)):
+        raise ValueError(f"Unsupported image shape {image.shape}: {file_name}")
+    return image
+
+
+def map_npy(file_name):
+    """Read-only mapping of an array saved with numpy.save"""
+    image = np.load(file_name, mmap_mode="r")
+    if image.dtype not in (np.uint8, np.uint16):
+        raise ValueError(f"Unsupported data type {image.dtype}, expected 8 or 16-bit "
+                         f"unsigned samples: {file_name}")
+    return _check_shape(image, file_name)
+
+
+def map_raw(file_name):
+    """
+    Read-only mapping of headerless pixel data. The size comes from the file
+    name (<name>_<W>x<H>[x<C>].raw); the sample size from the file length.
+    """
+    match = RAW_NAME.search(os.path.splitext(os.path.basename(file_name))[0])
+    if match is None:
+        raise ValueError(f"Raw file name must end in _<width>x<height>[x<channels>]: {file_name}")
+    width, height = int(match.group(1)), int(match.group(2))
+    pixels = width * height
+    size = os.path.getsize(file_name)
+    channel_options = [int(match.group(3))] if match.group(3) else [3, 1]
+    for channels in channel_options:
+        for dtype in (np.uint8, np.uint16):
+            if size == pixels * channels * np.dtype(dtype).itemsize:
+                shape = (height, width) if channels == 1 else (height, width, channels)
+                return _check_shape(np.memmap(file_name, dtype, "r", shape=shape), file_name)
+    raise ValueError(f"File size does not match {width}x{height} pixels: {file_name}")
+
+
+def read_tiff_tags(f):
+    """
+    Byte order and tags of the first image in a classic or BigTIFF file, or
+    None when f is not a TIFF. Tags map to tuples of integer values.
+    """
+    head = f.read(16)
+    if head[:2] not in (b"II", b"MM"):
+        return None
+    order = "<" if head[:2] == b"II" else ">"
+    magic = struct.unpack(order + "H", head[2:4])[0]
+    if magic == 42:
+        offset = struct.unpack(order + "I", head[4:8])[0]
+        count_format, entry_format, pointer = "H", "HHI", "I"
+    elif magic == 43:
+        offset = struct.unpack(order + "Q", head[8:16])[0]
+        count_format, entry_format, pointer = "Q", "HHQ", "Q"
+    else:
+        return None
+    inline = struct.calcsize(pointer)
+    header = struct.calcsize(order + entry_format)
+    f.seek(offset)
+    count_size = struct.calcsize(order + count_format)
+    (count,) = struct.unpack(order + count_format, f.read(count_size))
+    data = f.read(count * (header + inline))
+
+    tags = {}
+    for i in range(count):
+        entry = data[i * (header + inline):(i + 1) * (header + inline)]
+        tag, field_type, values = struct.unpack(order + entry_format, entry[:header])
+        fmt = TIFF_TYPES.get(field_type)
+        if fmt is None:
+            continue
+        size = struct.calcsize(fmt) * values
+        if size <= inline:
+            raw = entry[header:header + size]
+        else:
+            f.seek(struct.unpack(order + pointer, entry[header:])[0])
+            raw = f.read(size)
+        tags[tag] = struct.unpack(order + fmt * values, raw)
+    return order, tags
+
+
+def map_tiff(file_name):
+    """
+    Mapping of an uncompressed 8/16-bit gray or RGB TIFF, or None when the
+    file needs decoding (compression, palettes, planar or float data).
+    """
+    with open(file_name, "rb") as f:
+        parsed = read_tiff_tags(f)
+    if parsed is None:
+        return None
+    order, tags = parsed
+
+    def tag(code, default=None):
+        return tags.get(code, (default,))[0]
+
+    bits = set(tags.get(TAG_BITS, (1,)))
+    samples = tag(TAG_SAMPLES, 1)
+    if (tag(TAG_COMPRESSION, 1) != 1 or tag(TAG_SAMPLE_FORMAT, 1) != 1
+            or len(bits) != 1 or bits - {8, 16}
+            or (samples, tag(TAG_PHOTOMETRIC)) not in ((1, 1), (3, 2))
+            or (samples > 1 and tag(TAG_PLANAR, 1) != 1)):
+        return None
+    width, height = tag(TAG_WIDTH), tag(TAG_HEIGHT)
+    dtype = np.dtype(order + ("u1" if bits == {8} else "u2"))
+    shape = (height, width) if samples == 1 else (height, width, samples)
+
+    if TAG_TILE_WIDTH in tags:
+        tile_width, tile_height = tag(TAG_TILE_WIDTH), tag(TAG_TILE_HEIGHT)
+        blocks = []
+        across = -(-width // tile_width)
+        for i, offset in enumerate(tags[TAG_TILE_OFFSETS]):
+            y0, x0 = (i // across) * tile_height, (i % across) * tile_width
+            blocks.append((offset, (tile_height, tile_width), y0, x0))
+    else:
+        rows = min(tag(TAG_ROWS_PER_STRIP, height), height)
+        offsets, counts = tags[TAG_STRIP_OFFSETS], tags[TAG_STRIP_COUNTS]
+        expected = height * width * samples * dtype.itemsize
+        contiguous = (sum(counts) == expected and all(
+            offsets[i] + counts[i] == offsets[i + 1] for i in range(len(offsets) - 1)))
+        if contiguous and samples == 1 and dtype.isnative:
+            return np.memmap(file_name, dtype, "r", offset=offsets[0], shape=shape)
+        blocks = [(offset, (min(rows, height - i * rows), width), i * rows, 0)
+                  for i, offset in enumerate(offsets)]
+    return _rearrange(file_name, blocks, shape, dtype)
+
+
+def _rearrange(file_name, blocks, shape, dtype):
+    """Convert strips or tiles into an 8-bit BGR raster backed by a temporary file"""
+    samples = 1 if len(shape) == 2 else shape[2]
+    source = np.memmap(file_name, np.uint8, "r")
+    image = _temporary_raster(shape[:2])
+    height, width = shape[:2]
+    for offset, (block_height, block_width), y0, x0 in blocks:
+        if y0 >= height or x0 >= width:
+            continue
+        nbytes = block_height * block_width * samples * dtype.itemsize
+        block = source[offset:offset + nbytes].view(dtype)
+        block = block.reshape(block_height, block_width, samples)
+        block = block[:height - y0, :width - x0]
+        if samples == 3:
+            block = block[:, :, ::-1]
+        block = np.ascontiguousarray(block[:, :, 0] if samples == 1 else block,
+                                     dtype.newbyteorder("="))
+        image[y0:y0 + block.shape[0], x0:x0 + block.shape[1]] = to_bgr8(block)
+    return _seal(image)
@@ -0,0 +1,483 @@
+"""
+Built-in image processing operations.
+Every function is registered in the pipeline operation registry under the
+name of its checkbox in the method tabs.
+"""
+import cv2
+import numpy as np
+
+from features import FeatureTracker
+from pipeline import Param, register_operation
+from segmentation import segment
+
+CLASSICAL = "Classical Methods"
+GEOMETRIC = "Geometric Methods"
+MODERN = "Modern Methods"
+
+MORPH_SHAPES = {"rect": cv2.MORPH_RECT, "ellipse": cv2.MORPH_ELLIPSE, "cross": cv2.MORPH_CROSS}
+INTERPOLATIONS = {"area": cv2.INTER_AREA, "linear": cv2.INTER_LINEAR,
+                  "cubic": cv2.INTER_CUBIC, "nearest": cv2.INTER_NEAREST}
+THRESHOLD_TYPES = {"binary": cv2.THRESH_BINARY, "binary inverse": cv2.THRESH_BINARY_INV,
+                   "truncate": cv2.THRESH_TRUNC, "to zero": cv2.THRESH_TOZERO,
+                   "otsu": cv2.THRESH_BINARY | cv2.THRESH_OTSU}
+
+
+def kernel_halo(ksize, **_):
+    """Reach of a filter with a ksize x ksize kernel"""
+    return ksize // 2
+
+
+def aperture_halo(ksize, **_):
+    """Reach of a derivative filter; ksize 1 still uses a 3-pixel aperture"""
+    return max(1, ksize // 2)
+
+
+def bilateral_halo(diameter, **_):
+    """Reach of cv2.bilateralFilter, which uses a radius of at least 1"""
+    return max(1, diameter // 2)
+
+
+def morph_halo(ksize, iterations, **_):
+    """Reach of repeated erosion or dilation"""
+    return (ksize // 2) * iterations
+
+
+def compound_morph_halo(ksize, iterations, **_):
+    """Reach of opening and closing: an erosion followed by a dilation"""
+    return 2 * morph_halo(ksize, iterations)
+
+
+def to_gray(src, ctx):
+    """Single-channel view of src, converted into a scratch buffer if needed"""
+    if src.ndim == 2:
+        return src
+    gray = ctx.scratch("gray", src.shape[:2])
+    return cv2.cvtColor(src, cv2.COLOR_BGR2GRAY, dst=gray)
+
+
+def copy_for_drawing(src, ctx):
+    """Copy src into the stage output so annotations can be drawn over it"""
+    dst = ctx.output(src.shape, src.dtype)
+    np.copyto(dst, src)
+    return dst
+
+
+def draw_color(image, bgr):
+    """Colour usable with cv2 drawing functions on image"""
+    return bgr if image.ndim == 3 else (max(bgr),)
+
+
+# --- Classical Methods -------------------------------------------------------
+
+@register_operation("Gaussian Blur", "Filtering", CLASSICAL, halo=kernel_halo, params=[
+    Param("ksize", int, 5, 1, 99, odd=True, label="Kernel", spatial=True),
+    Param("sigma", float, 0.0, 0.0, 50.0, step=0.5, label="Sigma", spatial=True),
+])
+def gaussian_blur(src, ctx, ksize, sigma):
+    return cv2.GaussianBlur(src, (ksize, ksize), sigma, dst=ctx.dst)
+
+
+@register_operation("Median Filter", "Filtering", CLASSICAL, halo=kernel_halo, params=[
+    Param("ksize", int, 5, 1, 31, odd=True, label="Kernel", spatial=True),
+])
+def median_filter(src, ctx, ksize):
+    return cv2.medianBlur(src, ksize, dst=ctx.dst)
+
+
+@register_operation("Bilateral Filter", "Filtering", CLASSICAL,
+                    halo=bilateral_halo, params=[
+    Param("diameter", int, 9, 1, 25, label="Diameter", spatial=True),
+    Param("sigma_color", float, 75.0, 1.0, 250.0, step=5.0, label="Sigma color"),
+    Param("sigma_space", float, 75.0, 1.0, 250.0, step=5.0, label="Sigma space",
+          spatial=True),
+])
+def bilateral_filter(src, ctx, diameter, sigma_color, sigma_space):
+    return cv2.bilateralFilter(src, diameter, sigma_color, sigma_space, dst=ctx.dst)
+
+
+@register_operation("Sobel", "Edge Detection", CLASSICAL, halo=aperture_halo, params=[
+    Param("ksize", int, 3, 1, 7, odd=True, label="Kernel"),
+])
+def sobel(src, ctx, ksize):
+    gray = to_gray(src, ctx)
+    grad = ctx.scratch("grad", gray.shape, np.int16)
+    abs_x = ctx.scratch("abs_x", gray.shape)
+    abs_y = ctx.scratch("abs_y", gray.shape)
+    cv2.Sobel(gray, cv2.CV_16S, 1, 0, dst=grad, ksize=ksize)
+    cv2.convertScaleAbs(grad, dst=abs_x)
+    cv2.Sobel(gray, cv2.CV_16S, 0, 1, dst=grad, ksize=ksize)
+    cv2.convertScaleAbs(grad, dst=abs_y)
+    return cv2.addWeighted(abs_x, 0.5, abs_y, 0.5, 0, dst=ctx.output(gray.shape))
+
+
+@register_operation("Canny", "Edge Detection", CLASSICAL, params=[
+    Param("threshold1", int, 100, 0, 1000, label="Low"),
+    Param("threshold2", int, 200, 0, 1000, label="High"),
+    Param("aperture", int, 3, 3, 7, odd=True, label="Aperture"),
+])
+def canny(src, ctx, threshold1, threshold2, aperture):
+    gray = to_gray(src, ctx)
+    return cv2.Canny(gray, threshold1, threshold2, edges=ctx.output(gray.shape),
+                     apertureSize=aperture)
+
+
+@register_operation("Laplacian", "Edge Detection", CLASSICAL, halo=aperture_halo, params=[
+    Param("ksize", int, 3, 1, 31, odd=True, label="Kernel"),
+])
+def laplacian(src, ctx, ksize):
+    gray = to_gray(src, ctx)
+    lap = ctx.scratch("lap", gray.shape, np.int16)
+    cv2.Laplacian(gray, cv2.CV_16S, dst=lap, ksize=ksize)
+    return cv2.convertScaleAbs(lap, dst=ctx.output(gray.shape))
+
+
+MORPH_PARAMS = [
+    Param("ksize", int, 5, 1, 51, label="Kernel", spatial=True),
+    Param("shape", str, "rect", choices=MORPH_SHAPES, label="Shape"),
+    Param("iterations", int, 1, 1, 10, label="Iterations"),
+]
+
+
+def morph_kernel(ctx, shape, ksize):
+    """Structuring element cached in the stage state"""
+    key = ("kernel", shape, ksize)
+    kernel = ctx.state.get(key)
+    if kernel is None:
+        kernel = ctx.state[key] = cv2.getStructuringElement(MORPH_SHAPES[shape], (ksize, ksize))
+    return kernel
+
+
+@register_operation("Erosion", "Morphological", CLASSICAL, params=MORPH_PARAMS,
+                    halo=morph_halo)
+def erosion(src, ctx, ksize, shape, iterations):
+    return cv2.erode(src, morph_kernel(ctx, shape, ksize), dst=ctx.dst, iterations=iterations)
+
+
+@register_operation("Dilation", "Morphological", CLASSICAL, params=MORPH_PARAMS,
+                    halo=morph_halo)
+def dilation(src, ctx, ksize, shape, iterations):
+    return cv2.dilate(src, morph_kernel(ctx, shape, ksize), dst=ctx.dst, iterations=iterations)
+
+
+@register_operation("Opening", "Morphological", CLASSICAL, params=MORPH_PARAMS,
+                    halo=compound_morph_halo)
+def opening(src, ctx, ksize, shape, iterations):
+    return cv2.morphologyEx(src, cv2.MORPH_OPEN, morph_kernel(ctx, shape, ksize),
+                            dst=ctx.dst, iterations=iterations)
+
+
+@register_operation("Closing", "Morphological", CLASSICAL, params=MORPH_PARAMS,
+                    halo=compound_morph_halo)
+def closing(src, ctx, ksize, shape, iterations):
+    return cv2.morphologyEx(src, cv2.MORPH_CLOSE, morph_kernel(ctx, shape, ksize),
+                            dst=ctx.dst, iterations=iterations)
+
+
+# --- Geometric Methods -------------------------------------------------------
+
+@register_operation("Resize", "Basic Transforms", GEOMETRIC, params=[
+    Param("scale", float, 0.5, 0.1, 4.0, step=0.1, label="Scale"),
+    Param("interpolation", str, "area", choices=INTERPOLATIONS, label="Interpolation"),
+])
+def resize(src, ctx, scale, interpolation):
+    height, width = src.shape[:2]
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    dst = ctx.output((size[1], size[0]) + src.shape[2:], src.dtype)
+    return cv2.resize(src, size, dst=dst, interpolation=INTERPOLATIONS[interpolation])
+
+
+@register_operation("Rotate", "Basic Transforms", GEOMETRIC, params=[
+    Param("angle", float, 15.0, -180.0, 180.0, step=1.0, label="Angle"),
+])
+def rotate(src, ctx, angle):
+    height, width = src.shape[:2]
+    key = ("matrix", width, height, angle)
+    matrix = ctx.state.get(key)
+    if matrix is None:
+        ctx.state.clear()
+        matrix = ctx.state[key] = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    return cv2.warpAffine(src, matrix, (width, height), dst=ctx.dst)
+
+
+@register_operation("Flip", "Basic Transforms", GEOMETRIC, params=[
+    Param("mode", str, "horizontal", choices=("horizontal", "vertical", "both"), label="Mode"),
+])
+def flip(src, ctx, mode):
+    code = {"horizontal": 1, "vertical": 0, "both": -1}[mode]
+    return cv2.flip(src, code, dst=ctx.dst)
+
+
+@register_operation("Affine", "Advanced Transforms", GEOMETRIC, params=[
+    Param("shear", float, 0.2, -1.0, 1.0, step=0.05, label="Shear"),
+])
+def affine(src, ctx, shear):
+    height, width = src.shape[:2]
+    # Horizontal shear about the image centre
+    matrix = np.float32([[1, shear, -shear * height / 2], [0, 1, 0]])
+    return cv2.warpAffine(src, matrix, (width, height), dst=ctx.dst)
+
+
+@register_operation("Perspective", "Advanced Transforms", GEOMETRIC, params=[
+    Param("tilt", float, 0.2, 0.0, 0.45, step=0.05, label="Tilt"),
+])
+def perspective(src, ctx, tilt):
+    height, width = src.shape[:2]
+    key = ("matrix", width, height, tilt)
+    matrix = ctx.state.get(key)
+    if matrix is None:
+        # Keystone: the top edge is pulled inwards by tilt * width
+        corners = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+        inset = tilt * width
+        target = np.float32([[inset, 0], [width - inset, 0], [width, height], [0, height]])
+        ctx.state.clear()
+        matrix = ctx.state[key] = cv2.getPerspectiveTransform(corners, target)
+    return cv2.warpPerspective(src, matrix, (width, height), dst=ctx.dst)
+
+
+@register_operation("Warp", "Advanced Transforms", GEOMETRIC, params=[
+    Param("amplitude", float, 10.0, 0.0, 50.0, step=1.0, label="Amplitude", spatial=True),
+    Param("wavelength", float, 120.0, 10.0, 500.0, step=10.0, label="Wavelength",
+          spatial=True),
+])
+def warp(src, ctx, amplitude, wavelength):
+    height, width = src.shape[:2]
+    key = ("maps", width, height, amplitude, wavelength)
+    maps = ctx.state.get(key)
+    if maps is None:
+        # Sinusoidal wave displacement, the remap tables are built once
+        ys, xs = np.indices((height, width), dtype=np.float32)
+        map_x = xs + amplitude * np.sin(2 * np.pi * ys / wavelength)
+        map_y = ys + amplitude * np.sin(2 * np.pi * xs / wavelength)
+        ctx.state.clear()
+        maps = ctx.state[key] = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+    return cv2.remap(src, maps[0], maps[1], cv2.INTER_LINEAR, dst=ctx.dst)
+
+
+@register_operation("Corner Detection", "Features", GEOMETRIC, params=[
+    Param("max_corners", int, 200, 1, 5000, label="Max corners"),
+    Param("quality", float, 0.01, 0.001, 1.0, step=0.005, label="Quality"),
+    Param("min_distance", float, 10.0, 1.0, 200.0, step=1.0, label="Min distance",
+          spatial=True),
+])
+def corner_detection(src, ctx, max_corners, quality, min_distance):
+    corners = cv2.goodFeaturesToTrack(to_gray(src, ctx), max_corners, quality, min_distance)
+    dst = copy_for_drawing(src, ctx)
+    color = draw_color(dst, (0, 0, 255))
+    if corners is not None:
+        for x, y in corners.reshape(-1, 2):
+            cv2.circle(dst, (int(x), int(y)), 4, color, 1, cv2.LINE_AA)
+    return dst
+
+
+@register_operation("Line Detection", "Features", GEOMETRIC, params=[
+    Param("threshold", int, 80, 1, 1000, label="Votes"),
+    Param("min_length", float, 50.0, 1.0, 2000.0, step=5.0, label="Min length",
+          spatial=True),
+    Param("max_gap", float, 10.0, 0.0, 500.0, step=1.0, label="Max gap", spatial=True),
+])
+def line_detection(src, ctx, threshold, min_length, max_gap):
+    gray = to_gray(src, ctx)
+    edges = cv2.Canny(gray, 50, 150, edges=ctx.scratch("edges", gray.shape))
+    lines = cv2.HoughLinesP(edges, 1, np.pi / 180, threshold,
+                            minLineLength=min_length, maxLineGap=max_gap)
+    dst = copy_for_drawing(src, ctx)
+    color = draw_color(dst, (0, 255, 0))
+    if lines is not None:
+        for x1, y1, x2, y2 in lines.reshape(-1, 4):
+            cv2.line(dst, (int(x1), int(y1)), (int(x2), int(y2)), color, 2, cv2.LINE_AA)
+    return dst
+
+
+@register_operation("Contours", "Features", GEOMETRIC, params=[
+    Param("threshold", int, 127, 0, 255, label="Threshold"),
+])
+def contours(src, ctx, threshold):
+    gray = to_gray(src, ctx)
+    binary = ctx.scratch("binary", gray.shape)
+    cv2.threshold(gray, threshold, 255, cv2.THRESH_BINARY, dst=binary)
+    found, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    dst = copy_for_drawing(src, ctx)
+    cv2.drawContours(dst, found, -1, draw_color(dst, (0, 255, 0)), 2)
+    return dst
+
+
+# --- Modern Methods ----------------------------------------------------------
+
+def intensity_histogram(src, ctx):
+    """256-bin histogram of the intensity of src"""
+    return cv2.calcHist([to_gray(src, ctx)], [0], None, [256], [0, 256]).ravel()
+
+
+def equalization_lut(hist):
+    """Histogram equalization table, same mapping as cv2.equalizeHist"""
+    cdf = hist.cumsum()
+    nonzero = cdf[cdf > 0]
+    lo = nonzero[0] if nonzero.size else 0
+    if cdf[-1] - lo <= 0:
+        # A single level (or an empty image) is kept as it is
+        return np.arange(256, dtype=np.uint8)
+    return np.clip(np.round((cdf - lo) * 255.0 / (cdf[-1] - lo)), 0, 255).astype(np.uint8)
+
+
+def stretch_lut(hist, low_percentile, high_percentile):
+    """Linear stretch of the [low, high] percentile range to [0, 255]"""
+    cdf = hist.cumsum()
+    total = cdf[-1]
+    lo = int(np.searchsorted(cdf, total * low_percentile / 100.0))
+    hi = int(np.searchsorted(cdf, total * high_percentile / 100.0))
+    hi = max(hi, lo + 1)
+    levels = np.arange(256, dtype=np.float32)
+    return np.clip((levels - lo) * 255.0 / (hi - lo), 0, 255).astype(np.uint8)
+
+
+def threshold_lut(hist, threshold, method):
+    """cv2.threshold as a table; None for Otsu, which depends on the image"""
+    levels = np.arange(256)
+    above = levels > threshold
+    if method == "binary":
+        table = np.where(above, 255, 0)
+    elif method == "binary inverse":
+        table = np.where(above, 0, 255)
+    elif method == "truncate":
+        table = np.where(above, threshold, levels)
+    elif method == "to zero":
+        table = np.where(above, levels, 0)
+    else:
+        return None
+    return table.astype(np.uint8)
+
+
+@register_operation("Histogram Equalization", "Enhancement", MODERN,
+                    lut=equalization_lut, adaptive=True)
+def histogram_equalization(src, ctx):
+    # Equalize intensity and apply the same mapping to every channel
+    lut = equalization_lut(intensity_histogram(src, ctx))
+    return cv2.LUT(src, lut, dst=ctx.dst)
+
+
+@register_operation("Contrast Stretching", "Enhancement", MODERN, params=[
+    Param("low_percentile", float, 2.0, 0.0, 49.0, step=0.5, label="Low %"),
+    Param("high_percentile", float, 98.0, 51.0, 100.0, step=0.5, label="High %"),
+], lut=stretch_lut, adaptive=True)
+def contrast_stretching(src, ctx, low_percentile, high_percentile):
+    lut = stretch_lut(intensity_histogram(src, ctx), low_percentile, high_percentile)
+    return cv2.LUT(src, lut, dst=ctx.dst)
+
+
+@register_operation("Threshold", "Segmentation", MODERN, params=[
+    Param("threshold", int, 127, 0, 255, label="Threshold"),
+    Param("method", str, "binary", choices=THRESHOLD_TYPES, label="Method"),
+], lut=threshold_lut)
+def threshold(src, ctx, threshold, method):
+    if method == "otsu":
+        # Otsu needs a single-channel histogram
+        src = to_gray(src, ctx)
+    _, dst = cv2.threshold(src, threshold, 255, THRESHOLD_TYPES[method], dst=ctx.dst)
+    return dst
+
+
+@register_operation("K-means", "Segmentation", MODERN, temporal=True, params=[
+    Param("k", int, 4, 2, 16, label="Clusters"),
+    Param("iterations", int, 10, 1, 100, label="Iterations"),
+])
+def kmeans(src, ctx, k, iterations, keyframe_interval):
+    # Stills get a fresh, seeded fit; video warm-starts from the last frame.
+    # ctx.state of a temporal stage belongs to the plan, so the centres are
+    # those of the previous frame whichever worker ran it
+    previous = ctx.state.get("centres") if keyframe_interval > 1 else None
+    labels = ctx.scratch("labels", src.shape[:2])
+    labels, centres, _ = segment(src, k, iterations, labels, previous)
+    ctx.state["centres"] = centres
+    palette = np.clip(np.round(centres), 0, 255).astype(np.uint8)
+    dst = ctx.output(src.shape, src.dtype)
+    channels = src.shape[2] if src.ndim == 3 else 1
+    np.take(palette, labels.ravel(), axis=0, out=dst.reshape(-1, channels))
+    return dst
+
+
+@register_operation("Watershed", "Segmentation", MODERN, params=[
+    Param("foreground", float, 0.5, 0.05, 0.95, step=0.05, label="Foreground"),
+])
+def watershed(src, ctx, foreground):
+    gray = to_gray(src, ctx)
+    binary = ctx.scratch("binary", gray.shape)
+    cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU, dst=binary)
+    kernel = np.ones((3, 3), np.uint8)
+    cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel, dst=binary, iterations=2)
+    background = cv2.dilate(binary, kernel, iterations=3)
+    distance = cv2.distanceTransform(binary, cv2.DIST_L2, 5)
+    _, sure_fg = cv2.threshold(distance, foreground * distance.max(), 255, cv2.THRESH_BINARY)
+    sure_fg = sure_fg.astype(np.uint8)
+    unknown = cv2.subtract(background, sure_fg)
+    _, markers = cv2.connectedComponents(sure_fg)
+    markers += 1
+    markers[unknown == 255] = 0
+
+    dst = ctx.output(gray.shape + (3,))
+    if src.ndim == 2:
+        cv2.cvtColor(src, cv2.COLOR_GRAY2BGR, dst=dst)
+    else:
+        np.copyto(dst, src)
+    markers = cv2.watershed(dst, markers)
+    dst[markers == -1] = (0, 0, 255)
+    return dst
+
+
+def _surf_available():
+    try:
+        cv2.xfeatures2d.SURF_create()
+    except (AttributeError, cv2.error):
+        return False
+    return True
+
+
+def draw_features(src, ctx, create, keyframe_interval):
+    """
+    Detect keypoints with a cached detector and draw them over src. On video
+    they are tracked between keyframes; tracks that no longer match the
+    first keyframe are drawn in orange.
+    """
+    gray = to_gray(src, ctx)
+    dst = ctx.output(src.shape[:2] + (3,))
+    if src.ndim == 2:
+        cv2.cvtColor(src, cv2.COLOR_GRAY2BGR, dst=dst)
+    else:
+        np.copyto(dst, src)
+    flags = cv2.DRAW_MATCHES_FLAGS_DRAW_OVER_OUTIMG
+    if keyframe_interval == 1:
+        detector = ctx.state.get("detector")
+        if detector is None:
+            detector = ctx.state["detector"] = create()
+        return cv2.drawKeypoints(dst, detector.detect(gray, None), dst, (0, 255, 0), flags)
+
+    tracker = ctx.state.get("tracker")
+    if tracker is None:
+        tracker = ctx.state["tracker"] = FeatureTracker(create(), keyframe_interval)
+    keypoints = tracker.update(gray)
+    matched = [kp for kp, ok in zip(keypoints, tracker.matched) if ok]
+    unmatched = [kp for kp, ok in zip(keypoints, tracker.matched) if not ok]
+    cv2.drawKeypoints(dst, matched, dst, (0, 255, 0), flags)
+    return cv2.drawKeypoints(dst, unmatched, dst, (0, 160, 255), flags)
+
+
+@register_operation("SIFT", "Feature Extraction", MODERN, temporal=True, params=[
+    Param("n_features", int, 500, 0, 10000, label="Features"),
+])
+def sift(src, ctx, n_features, keyframe_interval):
+    return draw_features(src, ctx, lambda: cv2.SIFT_create(n_features), keyframe_interval)
+
+
+@register_operation("SURF", "Feature Extraction", MODERN, requires=_surf_available,
+                    temporal=True, params=[
+    Param("hessian", float, 400.0, 50.0, 5000.0, step=50.0, label="Hessian"),
+])
+def surf(src, ctx, hessian, keyframe_interval):
+    return draw_features(src, ctx, lambda: cv2.xfeatures2d.SURF_create(hessian),
+                         keyframe_interval)
+
+
+@register_operation("ORB", "Feature Extraction", MODERN, temporal=True, params=[
+    Param("n_features", int, 500, 10, 10000, label="Features"),
+])
+def orb(src, ctx, n_features, keyframe_interval):
+    return draw_features(src, ctx, lambda: cv2.ORB_create(n_features), keyframe_interval)
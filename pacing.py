@@ -0,0 +1,127 @@
+"""
+Frame pacing for video files and webcams.
+A FramePacer maps wall-clock time to the frame index that should be on
+screen, so files play at their own frame rate and fall back to skipping
+frames when processing overruns. A QualityController keeps a live source at
+its target frame rate by stepping the capture resolution and the preview
+scale down when frames take too long, and back up when there is headroom.
+"""
+import math
+import time
+from collections import deque
+
+import cv2
+
+DEFAULT_FPS = 30.0
+MAX_FPS = 240.0
+
+# Scale of the frames sent to Live Preview processing, coarsest last
+PREVIEW_SCALES = (1.0, 0.75, 0.5, 0.35, 0.25)
+
+
+def source_fps(capture, default=DEFAULT_FPS):
+    """Frame rate reported by a cv2.VideoCapture, or default when it is bogus"""
+    fps = capture.get(cv2.CAP_PROP_FPS)
+    if not fps or math.isnan(fps) or fps < 1.0 or fps > MAX_FPS:
+        return default
+    return fps
+
+
+class FramePacer:
+    """Wall-clock schedule of a source running at fps frames per second"""
+    def __init__(self, fps):
+        self.fps = fps
+        self.period = 1.0 / fps
+        self.origin = None
+
+    @property
+    def started(self):
+        return self.origin is not None
+
+    def start(self, index=0, now=None):
+        """Anchor the schedule so that frame `index` is due now"""
+        now = time.perf_counter() if now is None else now
+        self.origin = now - index * self.period
+
+    def due_index(self, now=None):
+        """Index of the frame that should be on screen now"""
+        if self.origin is None:
+            return 0
+        now = time.perf_counter() if now is None else now
+        return int((now - self.origin) * self.fps)
+
+    def delay_until(self, index, now=None):
+        """Seconds until frame `index` is due (negative when overdue)"""
+        if self.origin is None:
+            return 0.0
+        now = time.perf_counter() if now is None else now
+        return self.origin + index * self.period - now
+
+
+class QualityController:
+    """
+    Trades resolution for frame rate on a live source.
+    Each level is (capture size or None, preview scale). The capture
+    resolutions given (current one first) are tried before the preview scale
+    is lowered, because a smaller capture also saves decoding and display.
+    add_sample() is fed the time spent on each frame; it returns a message
+    describing the change whenever the level changes.
+    """
+    def __init__(self, target_fps, resolutions=(), scales=PREVIEW_SCALES,
+                 headroom=0.85, window=15, cooldown=2.0):
+        self.target_fps = target_fps
+        self.budget = 1.0 / target_fps
+        self.headroom = headroom
+        self.cooldown = cooldown
+        resolutions = list(resolutions) or [None]
+        self.levels = [(size, scales[0]) for size in resolutions]
+        self.levels += [(resolutions[-1], scale) for scale in scales[1:]]
+        self.level = 0
+        self._samples = deque(maxlen=window)
+        self._last_change = None
+
+    @property
+    def capture_size(self):
+        return self.levels[self.level][0]
+
+    @property
+    def preview_scale(self):
+        return self.levels[self.level][1]
+
+    def _pixels(self, level):
+        size, scale = self.levels[level]
+        base = self.levels[0][0]
+        ratio = 1.0 if size is None or base is None else (size[0] * size[1]) / (base[0] * base[1])
+        return ratio * scale * scale
+
+    def add_sample(self, seconds, now=None):
+        """Record the cost of one frame; returns a message when the level changes"""
+        now = time.perf_counter() if now is None else now
+        self._samples.append(seconds)
+        if self._last_change is None:
+            self._last_change = now
+        if len(self._samples) < self._samples.maxlen or now - self._last_change < self.cooldown:
+            return None
+        cost = sorted(self._samples)[len(self._samples) // 2]
+        if cost > self.headroom * self.budget and self.level < len(self.levels) - 1:
+            return self._set_level(self.level + 1, now, "Lowered")
+        if self.level > 0:
+            # Cost scales with the pixel count; only step up if the finer
+            # level is predicted to fit comfortably
+            predicted = cost * self._pixels(self.level - 1) / self._pixels(self.level)
+            if predicted < 0.7 * self.headroom * self.budget:
+                return self._set_level(self.level - 1, now, "Raised")
+        return None
+
+    def _set_level(self, level, now, verb):
+        self.level = level
+        self._samples.clear()
+        self._last_change = now
+        return f"{verb} quality to {self.describe()} to hold {self.target_fps:.0f} FPS"
+
+    def describe(self):
+        size, scale = self.levels[self.level]
+        text = f"preview {scale:.0%}"
+        if size is not None:
+            text = f"{size[0]}x{size[1]}, " + text
+        return text
@@ -0,0 +1,733 @@
+"""
+Operation registry and processing pipeline.
+
+An Operation is a registered image function with typed parameters. A Pipeline
+is the ordered list of operations selected in the method tabs. Whenever the
+pipeline changes it is validated and compiled once into a CompiledPipeline,
+whose run() executes the stages with preallocated output buffers (dst=) so the
+per-frame hot path does not allocate.
+
+Operation functions have the signature  func(src, ctx, **params) -> ndarray
+where ctx is the StageContext of the stage: ctx.dst is the buffer the result
+should be written into and ctx.scratch()/ctx.state hold per-stage workspace.
+
+Pointwise 8-bit operations can also register a lookup table builder,
+lut(hist, **params) -> uint8[256]. Consecutive pointwise stages are fused at
+compile time into a single cv2.LUT pass. Adaptive tables (equalization,
+stretching) are built from the intensity histogram of their input and, on
+video, are only rebuilt every lut_refresh_interval frames from a pixel sample.
+
+Temporal operations receive an extra keyframe_interval argument: 1 for still
+images, larger on video, where they may carry results over from the previous
+frames they saw (feature tracking between keyframes). Their ctx.state belongs
+to the plan rather than to a worker thread, and the runs of a plan pass a
+temporal stage one at a time in ticket order (see CompiledPipeline.ticket()),
+so its state sees the frames of the stream in sequence.
+
+Operations built on heavy libraries (torch, sklearn, ...) list them as
+backends and import them with backends.load() inside the function, so the
+libraries are only imported when the operation first runs.
+"""
+import json
+import math
+import numbers
+import threading
+
+import cv2
+import numpy as np
+
+from backends import installed, warm_up as warm_up_backends
+from image_loader import is_mapped
+from profiling import PROFILER
+from tiling import DEFAULT_STRIP_ROWS, TILED, strips
+
+# On video, fused adaptive tables estimate colour histograms from at most
+# this many pixels; stills use every pixel
+LUT_SAMPLE_PIXELS = 1 << 18
+
+
+class Param:
+    """
+    Typed parameter of an operation.
+    spatial marks sizes measured in pixels (kernel sizes, distances) that
+    must shrink with the image when a pipeline runs on a reduced proxy.
+    """
+    def __init__(self, name, kind, default, minimum=None, maximum=None,
+                 step=None, choices=None, odd=False, label=None, spatial=False):
+        if kind not in (int, float, bool, str):
+            raise ValueError(f"Unsupported parameter type: {kind}")
+        self.name = name
+        self.kind = kind
+        self.minimum = minimum
+        self.maximum = maximum
+        self.step = step
+        self.choices = tuple(choices) if choices else None
+        self.odd = odd
+        self.spatial = spatial
+        self.label = label or name.replace("_", " ").capitalize()
+        self.default = self.validate(default)
+
+    def validate(self, value):
+        """
+        Check value against the parameter type and range. Only lossless
+        conversions are made (3 or 3.0 for a float, 3.0 for an int); 5.7 for
+        an int or "False" for a bool are rejected rather than coerced.
+        """
+        kind = self.kind
+        if kind is bool:
+            valid = isinstance(value, (bool, np.bool_))
+        elif kind is str:
+            valid = isinstance(value, str)
+        elif isinstance(value, (bool, np.bool_)) or not isinstance(value, numbers.Real):
+            valid = False
+        elif kind is int:
+            valid = isinstance(value, numbers.Integral) or float(value).is_integer()
+        else:
+            valid = math.isfinite(value)
+        if not valid:
+            raise ValueError(f"{self.name}: expected {kind.__name__}, got {value!r}")
+        value = kind(value)
+        if self.choices is not None and value not in self.choices:
+            raise ValueError(f"{self.name}: {value!r} is not one of {self.choices}")
+        if self.minimum is not None and value < self.minimum:
+            raise ValueError(f"{self.name}: {value} is below the minimum {self.minimum}")
+        if self.maximum is not None and value > self.maximum:
+            raise ValueError(f"{self.name}: {value} is above the maximum {self.maximum}")
+        if self.odd and value % 2 == 0:
+            raise ValueError(f"{self.name}: must be odd, got {value}")
+        return value
+
+    def scale(self, value, factor):
+        """Value for an image resized by factor; only spatial parameters change"""
+        if not self.spatial or factor == 1.0:
+            return value
+        value = value * factor
+        if self.kind is int:
+            # Nearest odd integer for odd parameters
+            value = 2 * round((value - 1) / 2) + 1 if self.odd else round(value)
+        if self.minimum is not None:
+            value = max(self.minimum, value)
+        if self.maximum is not None:
+            value = min(self.maximum, value)
+        return self.kind(value)
+
+
+class Operation:
+    """A registered image processing operation"""
+    def __init__(self, name, group, tab, func, params=(), requires=None,
+                 lut=None, adaptive=False, halo=None, temporal=False, backends=()):
+        self.name = name
+        self.group = group
+        self.tab = tab
+        self.func = func
+        self.params = {p.name: p for p in params}
+        self.requires = requires
+        self.lut = lut
+        self.adaptive = adaptive
+        # halo(**params): reach in pixels of a neighbourhood filter, which
+        # lets it run tile by tile on the TILED executor
+        self.halo = halo
+        self.temporal = temporal
+        # Modules the function imports lazily through backends.load()
+        self.backends = tuple(backends)
+
+    def defaults(self):
+        """Default value of every parameter"""
+        return {name: p.default for name, p in self.params.items()}
+
+    def available(self):
+        """True when the backend needed by this operation is installed"""
+        if not all(installed(name) for name in self.backends):
+            return False
+        return self.requires is None or bool(self.requires())
+
+    def resolve_params(self, params):
+        """Validate params and fill in defaults"""
+        unknown = set(params) - set(self.params)
+        if unknown:
+            raise ValueError(f"{self.name}: unknown parameter(s) {', '.join(sorted(unknown))}")
+        resolved = self.defaults()
+        for name, value in params.items():
+            resolved[name] = self.params[name].validate(value)
+        return resolved
+
+    def scale_params(self, params, factor):
+        """Resolved params adjusted for an image resized by factor"""
+        return {name: self.params[name].scale(value, factor) for name, value in params.items()}
+
+    def is_pointwise(self, params):
+        """True when the operation can run as a lookup table with these params"""
+        if self.lut is None:
+            return False
+        return self.adaptive or self.lut(None, **params) is not None
+
+
+OPERATIONS = {}
+
+
+def register_operation(name, group, tab, params=(), requires=None, lut=None, adaptive=False,
+                       halo=None, temporal=False, backends=()):
+    """Decorator adding an operation function to the registry"""
+    def decorator(func):
+        if name in OPERATIONS:
+            raise ValueError(f"Operation already registered: {name}")
+        OPERATIONS[name] = Operation(name, group, tab, func, params, requires, lut, adaptive,
+                                     halo, temporal, backends)
+        return func
+    return decorator
+
+
+def get_operation(name):
+    """Look up a registered operation by name"""
+    _load_builtin_operations()
+    try:
+        return OPERATIONS[name]
+    except KeyError:
+        raise ValueError(f"Unknown operation: {name}") from None
+
+
+def _load_builtin_operations():
+    import operations  # noqa: F401  (registers the built-in operations)
+
+
+def warm_up_operations(size=64):
+    """
+    Import the backends of every operation and run each available one once
+    on a small frame, so the first real run does not pay for imports and
+    lazy initialisation. Meant for a background thread after startup.
+    """
+    _load_builtin_operations()
+    operations = list(OPERATIONS.values())
+    warm_up_backends({name for op in operations for name in op.backends})
+    frame = np.random.default_rng(0).integers(0, 256, (size, size, 3), dtype=np.uint8)
+    for op in operations:
+        try:
+            if op.available():
+                # The stage function is called directly, not through run(), so
+                # warm-up runs never show up in the profile
+                stage = CompiledPipeline([(op, op.defaults())]).stages[0]
+                stage.func(frame, StageContext(), **stage.params)
+        except Exception:
+            # The error is reported when the operation is actually used
+            pass
+
+
+class PipelineStep:
+    """One operation of a pipeline together with its parameter values"""
+    def __init__(self, name, params=None):
+        self.name = name
+        self.params = dict(params or {})
+
+    def to_dict(self):
+        return {"op": self.name, "params": dict(self.params)}
+
+
+class Pipeline:
+    """Ordered list of operations selected by the user"""
+    def __init__(self, steps=()):
+        self.steps = [s if isinstance(s, PipelineStep) else PipelineStep(*s) for s in steps]
+        self.version = 0
+        self.lut_refresh_interval = 1
+        self.keyframe_interval = 1
+        self._compiled = None
+        self._proxy = None
+
+    def __len__(self):
+        return len(self.steps)
+
+    def __iter__(self):
+        return iter(self.steps)
+
+    def names(self):
+        return [step.name for step in self.steps]
+
+    def index(self, name):
+        """Position of the first step running the named operation, or -1"""
+        for i, step in enumerate(self.steps):
+            if step.name == name:
+                return i
+        return -1
+
+    def add(self, name, **params):
+        """Append an operation, validating its parameters"""
+        get_operation(name).resolve_params(params)
+        self.steps.append(PipelineStep(name, params))
+        self._changed()
+
+    def remove(self, name):
+        """Remove the first step running the named operation"""
+        i = self.index(name)
+        if i >= 0:
+            del self.steps[i]
+            self._changed()
+
+    def move(self, old_index, new_index):
+        """Reorder a step"""
+        self.steps.insert(new_index, self.steps.pop(old_index))
+        self._changed()
+
+    def set_param(self, name, param, value):
+        """Change a parameter of the first step running the named operation"""
+        i = self.index(name)
+        if i < 0:
+            raise ValueError(f"Operation not in pipeline: {name}")
+        value = get_operation(name).params[param].validate(value)
+        self.steps[i].params[param] = value
+        self._changed()
+
+    def clear(self):
+        self.steps.clear()
+        self._changed()
+
+    def set_lut_refresh_interval(self, frames):
+        """Rebuild adaptive lookup tables every `frames` runs (1 = every run)"""
+        frames = max(1, int(frames))
+        if frames != self.lut_refresh_interval:
+            self.lut_refresh_interval = frames
+            self._changed()
+
+    def set_keyframe_interval(self, frames):
+        """Let temporal operations reuse work for up to `frames` runs (1 = never)"""
+        frames = max(1, int(frames))
+        if frames != self.keyframe_interval:
+            self.keyframe_interval = frames
+            self._changed()
+
+    def _changed(self):
+        self.version += 1
+        self._compiled = None
+        self._proxy = None
+
+    def validate(self):
+        """Check every step and return the resolved (operation, params) list"""
+        resolved = []
+        for step in self.steps:
+            op = get_operation(step.name)
+            if not op.available():
+                raise ValueError(f"{op.name} is not available in this OpenCV build")
+            resolved.append((op, op.resolve_params(step.params)))
+        return resolved
+
+    def compile(self, shared=True):
+        """
+        Return the CompiledPipeline for the current steps (cached until
+        changed). shared=False builds a separate plan whose stages keep their
+        own state, e.g. one per video source.
+        """
+        if self._compiled is None or not shared:
+            plan = CompiledPipeline(self.validate(), self.version,
+                                    self.lut_refresh_interval, self.keyframe_interval)
+            if not shared:
+                return plan
+            self._compiled = plan
+        return self._compiled
+
+    def compile_proxy(self, factor):
+        """
+        CompiledPipeline for images downscaled by factor, with spatial
+        parameters scaled to match (the last one is cached until changed).
+        """
+        factor = round(factor, 2)
+        if factor >= 1.0:
+            return self.compile()
+        if self._proxy is None or self._proxy[0] != factor:
+            resolved = [(op, op.scale_params(params, factor)) for op, params in self.validate()]
+            self._proxy = (factor, CompiledPipeline(resolved, self.version,
+                                                    self.lut_refresh_interval,
+                                                    self.keyframe_interval))
+        return self._proxy[1]
+
+    def to_dict(self):
+        return {"format": 1, "steps": [step.to_dict() for step in self.steps]}
+
+    @classmethod
+    def from_dict(cls, data):
+        pipeline = cls(PipelineStep(s["op"], s.get("params")) for s in data.get("steps", []))
+        pipeline.validate()
+        return pipeline
+
+    def save(self, file_name):
+        """Write the pipeline as JSON"""
+        with open(file_name, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, file_name):
+        """Read a pipeline saved with save()"""
+        with open(file_name) as f:
+            return cls.from_dict(json.load(f))
+
+
+class StageContext:
+    """Per-thread output buffer, scratch buffers and state of one stage"""
+    __slots__ = ("dst", "buffers", "state")
+
+    def __init__(self, state=None):
+        self.dst = None
+        self.buffers = {}
+        self.state = {} if state is None else state
+
+    def output(self, shape, dtype=np.uint8):
+        """Return ctx.dst if it matches shape/dtype, else a new buffer"""
+        dst = self.dst
+        if dst is None or dst.shape != tuple(shape) or dst.dtype != dtype:
+            dst = np.empty(shape, dtype)
+        return dst
+
+    def scratch(self, key, shape, dtype=np.uint8):
+        """Persistent scratch buffer reused between frames"""
+        buf = self.buffers.get(key)
+        if buf is None or buf.shape != tuple(shape) or buf.dtype != dtype:
+            buf = self.buffers[key] = np.empty(shape, dtype)
+        return buf
+
+
+class CompiledStage:
+    """An operation bound to its validated parameters"""
+    __slots__ = ("operation", "params", "func", "signature", "state", "turn")
+
+    def __init__(self, operation, params):
+        self.operation = operation
+        self.params = params
+        self.func = operation.func
+        # Identifies the stage output for a given input in a StageCache
+        self.signature = (operation.name, tuple(sorted(params.items())))
+        # Temporal stages keep one state for the whole plan; turn is their
+        # position among the plan's temporal stages, set by the plan
+        self.state = {} if operation.temporal else None
+        self.turn = None
+
+    @property
+    def name(self):
+        return self.operation.name
+
+    def reach(self):
+        """Pixels of context the stage reads around each output pixel, None if unbounded"""
+        operation = self.operation
+        if operation.lut is not None and not operation.adaptive and operation.is_pointwise(self.params):
+            return 0
+        if operation.halo is not None:
+            return operation.halo(**self.params)
+        return None
+
+
+class FusedLutStage:
+    """
+    Run of consecutive pointwise stages executed as a single cv2.LUT pass.
+    The composed table is cached in the stage context; it is rebuilt every
+    refresh_interval frames when one of the stages is adaptive.
+    """
+    __slots__ = ("stages", "adaptive", "refresh_interval", "params", "signature")
+
+    def __init__(self, stages, refresh_interval=1):
+        self.stages = stages
+        self.adaptive = any(stage.operation.adaptive for stage in stages)
+        self.refresh_interval = refresh_interval
+        self.params = {}
+        self.signature = ("LUT",) + tuple(stage.signature for stage in stages)
+
+    @property
+    def name(self):
+        return "LUT(" + " + ".join(stage.name for stage in self.stages) + ")"
+
+    def reach(self):
+        # Adaptive tables depend on the histogram of the whole image
+        return None if self.adaptive else 0
+
+    def func(self, src, ctx):
+        if src.dtype != np.uint8:
+            return self._run_unfused(src, ctx)
+        state = ctx.state
+        table = state.get("table")
+        frame = state.get("frame", 0)
+        state["frame"] = frame + 1
+        if (table is None or state.get("channels") != src.ndim
+                or (self.adaptive and frame % self.refresh_interval == 0)):
+            table = state["table"] = self._build_table(src, ctx)
+            state["channels"] = src.ndim
+        return cv2.LUT(src, table, dst=ctx.dst)
+
+    def _build_table(self, src, ctx):
+        table = np.arange(256, dtype=np.uint8)
+        if not self.adaptive:
+            for stage in self.stages:
+                table = stage.operation.lut(None, **stage.params)[table]
+            return table
+
+        if src.ndim == 2:
+            # The histogram of a remapped gray image follows from the input one
+            base = cv2.calcHist([src], [0], None, [256], [0, 256]).ravel()
+            sample = None
+        else:
+            # Colour intensity is not a function of one channel, so the
+            # intermediate histograms are computed on remapped pixels: all of
+            # them for stills, whose result must match the unfused stages, a
+            # strided sample on video
+            step = 1
+            if self.refresh_interval > 1:
+                step = max(1, math.ceil(math.sqrt(src.shape[0] * src.shape[1] / LUT_SAMPLE_PIXELS)))
+            sample = src if step == 1 else np.ascontiguousarray(src[::step, ::step])
+            gray = ctx.scratch("sample_gray", sample.shape[:2])
+            remapped = ctx.scratch("sample", sample.shape)
+
+        first = True
+        for stage in self.stages:
+            op = stage.operation
+            if op.adaptive:
+                if sample is None:
+                    hist = np.bincount(table, weights=base, minlength=256)
+                else:
+                    current = sample if first else cv2.LUT(sample, table, dst=remapped)
+                    cv2.cvtColor(current, cv2.COLOR_BGR2GRAY, dst=gray)
+                    hist = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel()
+                table = op.lut(hist, **stage.params)[table]
+            else:
+                table = op.lut(None, **stage.params)[table]
+            first = False
+        return table
+
+    def _run_unfused(self, src, ctx):
+        contexts = ctx.state.get("contexts")
+        if contexts is None:
+            contexts = ctx.state["contexts"] = [StageContext() for _ in self.stages]
+        result = src
+        for stage, stage_ctx in zip(self.stages, contexts):
+            out = stage.func(result, stage_ctx, **stage.params)
+            if out is not result:
+                stage_ctx.dst = out
+            result = out
+        return result
+
+
+def fuse_pointwise(stages, refresh_interval=1):
+    """
+    Replace runs of two or more pointwise stages by FusedLutStages. On video
+    (refresh_interval > 1) a lone adaptive stage is wrapped as well, so its
+    table is only rebuilt every refresh_interval frames.
+    """
+    fused, run = [], []
+    for stage in stages + [None]:
+        if stage is not None and stage.operation.is_pointwise(stage.params):
+            run.append(stage)
+            continue
+        if len(run) > 1 or (run and run[0].operation.adaptive and refresh_interval > 1):
+            fused.append(FusedLutStage(run, refresh_interval))
+        else:
+            fused.extend(run)
+        run = []
+        if stage is not None:
+            fused.append(stage)
+    return fused
+
+
+class CompiledPipeline:
+    """
+    Immutable execution plan of a Pipeline.
+    Each thread that runs the plan gets its own set of stage contexts, so the
+    same plan can be shared by all processing workers. Only the state of
+    temporal stages is shared; runs pass such a stage one at a time, in the
+    order of their tickets.
+    """
+    def __init__(self, resolved, version=0, lut_refresh_interval=1, keyframe_interval=1):
+        stages = [CompiledStage(op, dict(params, keyframe_interval=keyframe_interval)
+                                if op.temporal else params)
+                  for op, params in resolved]
+        self.stages = fuse_pointwise(stages, lut_refresh_interval)
+        self.version = version
+        self._local = threading.local()
+        temporal = [stage for stage in self.stages if getattr(stage, "state", None) is not None]
+        for turn, stage in enumerate(temporal):
+            stage.turn = turn
+        self.temporal = bool(temporal)
+        # Tickets not yet released, mapped to the number of temporal stages
+        # their run has passed
+        self._order = threading.Condition()
+        self._tickets = {}
+        self._next_ticket = 0
+
+    def __len__(self):
+        return len(self.stages)
+
+    def names(self):
+        return [stage.name for stage in self.stages]
+
+    def ticket(self):
+        """
+        Reserve the next place in the order in which runs pass the temporal
+        stages, or None when the plan has none. Take tickets in frame order
+        and hand each one to run(), or to release() if the frame is dropped;
+        a run waits at each temporal stage for the runs of all earlier
+        tickets. run() without a ticket takes one when it starts.
+        """
+        if not self.temporal:
+            return None
+        with self._order:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            self._tickets[ticket] = 0
+            return ticket
+
+    def release(self, ticket):
+        """Let later runs past the temporal stages this ticket has not reached"""
+        if ticket is None:
+            return
+        with self._order:
+            if self._tickets.pop(ticket, None) is not None:
+                self._order.notify_all()
+
+    def _contexts(self):
+        contexts = getattr(self._local, "contexts", None)
+        if contexts is None:
+            contexts = self._local.contexts = [StageContext(getattr(stage, "state", None))
+                                               for stage in self.stages]
+        return contexts
+
+    def run(self, image, out=None, cache=None, key=None, ticket=None):
+        """
+        Run every stage on image and return the result.
+        Intermediate results live in per-stage buffers that are reused on the
+        next call. The last stage writes into out when given; otherwise the
+        returned array is only valid until the next run() on this thread.
+        With a StageCache and a key identifying the content of image, the
+        run resumes after the longest prefix of stages already cached.
+        ticket orders the run at temporal stages (see ticket()) and is
+        released when the run ends.
+        """
+        if not self.stages:
+            if out is None or out is image:
+                return image
+            np.copyto(out, image)
+            return out
+        if ticket is None:
+            ticket = self.ticket()
+        try:
+            if cache is not None and key is not None:
+                return self._run_cached(image, out, cache, key, ticket)
+            return self._run(image, out, ticket)
+        finally:
+            self.release(ticket)
+
+    def _run(self, image, out, ticket):
+        contexts = self._contexts()
+        last = len(self.stages) - 1
+        result = image
+        for i, (stage, ctx) in enumerate(zip(self.stages, contexts)):
+            src = result
+            with PROFILER.span(stage.name):
+                if i == last and out is not None and out is not src:
+                    keep = ctx.dst
+                    ctx.dst = out
+                    result = self._apply(stage, src, ctx, ticket)
+                    ctx.dst = keep
+                else:
+                    result = self._apply(stage, src, ctx, ticket)
+                    if result is not src:
+                        # Never adopt the caller's image or another stage's buffer
+                        ctx.dst = result
+        return result
+
+    def process(self, image, out=None, cache=None, key=None):
+        """
+        Process one whole image; the GUI, the batch CLI and the benchmarks all
+        go through here. Mapped images stream through the plan in strips when
+        it allows. With a StageCache and key, the run resumes from cached
+        stages and its result gets a buffer of its own, since the cache keeps
+        it. Otherwise the last stage writes into out (allocated when None).
+        """
+        if not self.stages:
+            return image
+        if is_mapped(image) and self.reach() is not None:
+            return self.run_strips(image)
+        if cache is not None and key is not None:
+            return self.run(image, out=np.empty_like(image), cache=cache, key=key)
+        return self.run(image, out=np.empty_like(image) if out is None else out)
+
+    def reach(self):
+        """
+        Pixels of context the whole plan needs around each output pixel, or
+        None when a stage depends on the entire image (adaptive tables,
+        geometric transforms, feature detection).
+        """
+        total = 0
+        for stage in self.stages:
+            reach = stage.reach()
+            if reach is None:
+                return None
+            total += reach
+        return total
+
+    def run_strips(self, image, out=None, rows=DEFAULT_STRIP_ROWS):
+        """
+        Run the plan on horizontal strips of image, each extended by reach()
+        rows, so intermediate buffers only ever hold one strip. The result is
+        identical to run(). out is an array or a function (shape, dtype) ->
+        array, e.g. a writable np.memmap; by default the result is allocated.
+        """
+        reach = self.reach()
+        if reach is None:
+            raise ValueError("Pipeline contains operations that need the whole image")
+        height = image.shape[0]
+        rows = max(rows, 2 * reach + 1)
+        for (y0, y1), (r0, r1) in strips(height, rows, reach):
+            result = self.run(image[r0:r1])
+            if out is None or callable(out):
+                shape = (height,) + result.shape[1:]
+                out = np.empty(shape, result.dtype) if out is None else out(shape, result.dtype)
+            out[y0:y1] = result[y0 - r0:y1 - r0]
+        return out
+
+    def _apply(self, stage, src, ctx, ticket):
+        """Run one stage, split into tiles when it is a large neighbourhood filter"""
+        operation = getattr(stage, "operation", None)
+        if operation is not None and operation.halo is not None and TILED.enabled:
+            halo = operation.halo(**stage.params)
+            if TILED.accepts(src, halo):
+                # Every tile gets its own context, they run concurrently
+                return TILED.run(lambda tile: stage.func(tile, StageContext(), **stage.params),
+                                 src, ctx.output, halo)
+        if operation is not None and operation.temporal:
+            turn = stage.turn
+            with self._order:
+                # Wait until every earlier ticket has passed this stage; later
+                # ones wait for this one, so the stage runs one frame at a time
+                self._order.wait_for(lambda: all(
+                    passed > turn for earlier, passed in self._tickets.items()
+                    if earlier < ticket))
+            result = stage.func(src, ctx, **stage.params)
+            with self._order:
+                self._tickets[ticket] = turn + 1
+                self._order.notify_all()
+            return result
+        return stage.func(src, ctx, **stage.params)
+
+    def _run_cached(self, image, out, cache, key, ticket):
+        contexts = self._contexts()
+        prefixes = []
+        prefix = (key,)
+        for stage in self.stages:
+            prefix += (stage.signature,)
+            prefixes.append(prefix)
+
+        start, result = 0, image
+        for i in range(len(prefixes) - 1, -1, -1):
+            cached = cache.get(prefixes[i])
+            if cached is not None:
+                start, result = i + 1, cached
+                break
+
+        last = len(self.stages) - 1
+        for i in range(start, len(self.stages)):
+            stage, ctx = self.stages[i], contexts[i]
+            src = result
+            with PROFILER.span(stage.name):
+                # Cached outputs must not live in buffers reused by later runs,
+                # so every stage allocates (or writes into out) this time
+                keep = ctx.dst
+                ctx.dst = out if i == last and out is not None and out is not src else None
+                result = self._apply(stage, src, ctx, ticket)
+                ctx.dst = keep
+            if isinstance(stage, FusedLutStage) and src.dtype != np.uint8:
+                # The unfused fallback returns a buffer of its inner stages
+                result = result.copy()
+            cache.put(prefixes[i], result)
+        return result
@@ -0,0 +1,343 @@
+"""
+Asynchronous processing engine.
+Runs image processing jobs on a worker pool and delivers the results to the
+GUI thread through Qt signals. Live frames are scheduled latest-wins: when
+every worker is busy a new frame replaces the pending one instead of queueing.
+Jobs may name the source they come from (e.g. one of several cameras). Each
+source then has its own pending slot. The workers are shared evenly between
+the sources that have a frame waiting, the remainder going to the ones
+served least recently, and a worker that frees up takes the frame of the
+source served least recently. A fast source cannot starve a slow one, and
+no worker idles while frames are waiting.
+Result arrays can be recycled through the engine's OutputBuffers, so video
+frames are processed into a few reused buffers instead of new allocations.
+"""
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from profiling import PROFILER
+
+# Free result buffers an engine keeps for reuse
+OUTPUT_BUFFERS = 3
+
+
+class ProcessingJob:
+    """A single unit of work submitted to the ProcessingEngine"""
+    __slots__ = ("id", "func", "image", "tag", "coalesce", "source", "context",
+                 "submitted", "started", "completed")
+
+    def __init__(self, job_id, func, image, tag, coalesce, source=None, context=None):
+        self.id = job_id
+        self.func = func
+        self.image = image
+        self.tag = tag
+        self.coalesce = coalesce
+        self.source = source
+        # Caller data handed back with the result, e.g. where to save it
+        self.context = context
+        self.submitted = time.perf_counter()
+        self.started = None
+        self.completed = None
+
+    @property
+    def latency(self):
+        """Seconds from submission to completion"""
+        if self.completed is None:
+            return None
+        return self.completed - self.submitted
+
+
+class SourceCounters:
+    """Delivery counters of the jobs of one source"""
+    def __init__(self, window=64):
+        self.completed = 0
+        self.coalesced = 0
+        self.stale = 0
+        self.last_latency = 0.0
+        # (completion time, latency) of the latest deliveries
+        self._recent = deque(maxlen=window)
+
+    def delivered(self, job):
+        self.completed += 1
+        self.last_latency = job.latency
+        self._recent.append((job.completed, job.latency))
+
+    def stats(self, horizon=2.0):
+        """Delivered frames per second and mean latency over the last `horizon` seconds"""
+        since = time.perf_counter() - horizon
+        recent = [latency for completed, latency in self._recent if completed >= since]
+        return {
+            "completed": self.completed,
+            "coalesced": self.coalesced,
+            "stale": self.stale,
+            "fps": len(recent) / horizon,
+            "latency_ms": 1000.0 * sum(recent) / len(recent) if recent else 0.0,
+        }
+
+
+class OutputBuffers:
+    """
+    Small pool of result arrays shared by the workers of an engine.
+    take() returns a free array of the requested shape and type, or a new
+    one. The owner gives an array back once nothing reads it any more (the
+    result was displayed, then replaced), or detaches it with keep() when it
+    is handed on, e.g. to an export thread. Arrays that are simply dropped
+    are freed as usual.
+    """
+    def __init__(self, size=OUTPUT_BUFFERS):
+        self.size = size
+        self._lock = threading.Lock()
+        self._free = deque()
+        # id -> array handed out by take(); the entry goes away with the array
+        self._taken = weakref.WeakValueDictionary()
+        self.allocated = 0
+        self.reused = 0
+
+    def take(self, shape, dtype=np.uint8):
+        """An array of shape and dtype that nothing else uses"""
+        shape, dtype = tuple(shape), np.dtype(dtype)
+        with self._lock:
+            for i, buffer in enumerate(self._free):
+                if buffer.shape == shape and buffer.dtype == dtype:
+                    del self._free[i]
+                    self.reused += 1
+                    break
+            else:
+                buffer = np.empty(shape, dtype)
+                self.allocated += 1
+            self._taken[id(buffer)] = buffer
+        return buffer
+
+    def give_back(self, buffer):
+        """Make an array from take() free for reuse; other arrays are ignored"""
+        if buffer is None:
+            return
+        with self._lock:
+            if self._taken.get(id(buffer)) is not buffer:
+                return
+            del self._taken[id(buffer)]
+            self._free.append(buffer)
+            if len(self._free) > self.size:
+                self._free.popleft()
+
+    def keep(self, buffer):
+        """Never reuse an array from take(); it now belongs to the caller"""
+        if buffer is None:
+            return
+        with self._lock:
+            if self._taken.get(id(buffer)) is buffer:
+                del self._taken[id(buffer)]
+
+    def clear(self):
+        with self._lock:
+            self._free.clear()
+
+
+class ProcessingEngine(QObject):
+    """
+    Worker pool for process_image.
+    Emits finished(result, job) or failed(message, job) on the GUI thread.
+    Jobs may write their results into buffers.take() arrays; results
+    overtaken by newer jobs are given back here.
+    """
+    finished = pyqtSignal(object, object)
+    failed = pyqtSignal(str, object)
+    _job_done = pyqtSignal(object, object, object)
+
+    def __init__(self, max_workers=None, parent=None):
+        super().__init__(parent)
+        if max_workers is None:
+            # OpenCV releases the GIL, leave one core for the GUI and capture
+            max_workers = max(1, min(4, (os.cpu_count() or 2) - 1))
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix="processing")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        # source -> waiting job
+        self._pending = {}
+        # source -> jobs running on the pool
+        self._running = {}
+        # source -> id of the last job it started, to serve the least recent first
+        self._served = {}
+        self._next_id = 0
+        self._last_delivered = {}
+        self._sources = {}
+        self._closed = False
+        self.buffers = OutputBuffers()
+
+        # Counters exposed through stats()
+        self.completed = 0
+        self.coalesced = 0
+        self.stale = 0
+        self.last_latency = 0.0
+
+        self._job_done.connect(self._on_job_done)
+
+    def submit(self, func, image, tag=None, coalesce=True, source=None, context=None):
+        """
+        Schedule func(image) on the pool.
+        Coalescing jobs (live frames) never queue behind busy workers; the
+        newest one of each source waits in that source's pending slot and
+        older ones are dropped. Non-coalescing jobs (explicit Process)
+        always run. context is stored on the job for the result handlers.
+        """
+        with self._lock:
+            if self._closed:
+                return None
+            job = ProcessingJob(self._next_id, func, image, tag, coalesce, source,
+                                context)
+            self._next_id += 1
+            if coalesce:
+                if source in self._pending:
+                    self.coalesced += 1
+                    self._counters(source).coalesced += 1
+                self._pending[source] = job
+                # Sources served least recently start first
+                started = []
+                while True:
+                    next_job = self._next_pending(self._in_flight)
+                    if next_job is None:
+                        break
+                    self._start(next_job)
+                    started.append(next_job)
+            else:
+                self._start(job)
+                started = [job]
+        for next_job in started:
+            self.executor.submit(self._run, next_job)
+        return job
+
+    def _start(self, job):
+        """Count job as running (lock held)"""
+        self._in_flight += 1
+        self._running[job.source] = self._running.get(job.source, 0) + 1
+        self._served[job.source] = job.id
+
+    def _has_capacity(self, source, in_flight):
+        """True when the pending job of source may start now (called with the lock held)"""
+        if in_flight >= self.max_workers:
+            return False
+        # The workers not held by sources with nothing waiting are split
+        # evenly between the sources with a pending frame; the remainder
+        # goes to the ones served least recently
+        waiting = self._waiting()
+        held = sum(count for s, count in self._running.items() if s not in self._pending)
+        share, remainder = divmod(self.max_workers - held, len(waiting))
+        if waiting.index(source) < remainder:
+            share += 1
+        return self._running.get(source, 0) < share
+
+    def _counters(self, source):
+        counters = self._sources.get(source)
+        if counters is None:
+            counters = self._sources[source] = SourceCounters()
+        return counters
+
+    def busy(self):
+        """True while any job is running or pending"""
+        with self._lock:
+            return self._in_flight > 0 or bool(self._pending)
+
+    def _run(self, job):
+        while job is not None:
+            job.started = time.perf_counter()
+            PROFILER.record("engine.queue", job.submitted, job.started)
+            result, error = None, None
+            try:
+                result = job.func(job.image)
+            except Exception as e:
+                error = e
+            job.completed = time.perf_counter()
+            PROFILER.record("engine.process", job.started, job.completed)
+            job.image = None
+
+            with self._lock:
+                # Keep this worker busy with the pending frame of the source
+                # served least recently, if any
+                running = self._running[job.source] - 1
+                if running:
+                    self._running[job.source] = running
+                else:
+                    del self._running[job.source]
+                self._in_flight -= 1
+                next_job = None if self._closed else self._next_pending(self._in_flight)
+                if next_job is not None:
+                    self._start(next_job)
+            self._job_done.emit(job, result, error)
+            job = next_job
+
+    def _waiting(self):
+        """Sources with a pending job, the one served least recently first (lock held)"""
+        return sorted(self._pending, key=lambda source: self._served.get(source, -1))
+
+    def _next_pending(self, in_flight):
+        """Take the pending job of the least recently served source below its share (lock held)"""
+        for source in self._waiting():
+            if self._has_capacity(source, in_flight):
+                return self._pending.pop(source)
+        return None
+
+    def _on_job_done(self, job, result, error):
+        """Runs on the GUI thread; drops results overtaken by newer jobs"""
+        if self._closed:
+            return
+        if error is not None:
+            self.failed.emit(str(error), job)
+            return
+        counters = self._counters(job.source)
+        if job.coalesce and job.id < self._last_delivered.get(job.source, -1):
+            self.stale += 1
+            counters.stale += 1
+            self.buffers.give_back(result)
+            return
+        self._last_delivered[job.source] = max(self._last_delivered.get(job.source, -1), job.id)
+        self.completed += 1
+        self.last_latency = job.latency
+        counters.delivered(job)
+        self.finished.emit(result, job)
+
+    def cancel_pending(self, source=None):
+        """Forget the job of source waiting for a free worker"""
+        with self._lock:
+            if self._pending.pop(source, None) is not None:
+                self.coalesced += 1
+                self._counters(source).coalesced += 1
+
+    def forget(self, source):
+        """Drop the pending job and the counters of a source that was closed"""
+        with self._lock:
+            self._pending.pop(source, None)
+            self._served.pop(source, None)
+            self._sources.pop(source, None)
+            self._last_delivered.pop(source, None)
+
+    def stats(self):
+        """Scheduling counters for display in the status bar"""
+        return {
+            "completed": self.completed,
+            "coalesced": self.coalesced,
+            "stale": self.stale,
+            "latency_ms": self.last_latency * 1000.0,
+            "buffers_allocated": self.buffers.allocated,
+            "buffers_reused": self.buffers.reused,
+        }
+
+    def source_stats(self, source):
+        """Frame rate, latency and drop counters of the jobs of one source"""
+        with self._lock:
+            return self._counters(source).stats()
+
+    def shutdown(self):
+        """Stop accepting jobs and discard queued work"""
+        with self._lock:
+            self._closed = True
+            self._pending.clear()
+        self.buffers.clear()
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,167 @@
+"""
+Lightweight performance instrumentation.
+Hot paths wrap their work in PROFILER.span(name). While the profiler is
+disabled span() returns a shared no-op context manager, so instrumented code
+pays one attribute test per call. When enabled, every span feeds a rolling
+window of durations (for p50/p95/p99) and a bounded event log that can be
+exported as CSV or as a Chrome trace (chrome://tracing, Perfetto).
+"""
+import csv
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.start, time.perf_counter())
+        return False
+
+
+class Profiler:
+    """
+    Collects span durations and event rates from any thread.
+    window is the number of recent samples per span used for percentiles;
+    max_events bounds the event log kept for export.
+    """
+    def __init__(self, window=512, max_events=200000):
+        self.enabled = False
+        self.window = window
+        self.max_events = max_events
+        self.origin = time.perf_counter()
+        self._durations = {}
+        self._totals = {}
+        self._ticks = {}
+        self._threads = {}
+        # Guards the dicts; threads that are recording keep using this lock
+        # and these containers across reset(), which only empties them
+        self._lock = threading.Lock()
+        # deque.append is atomic, so worker threads can log without the lock
+        self.events = deque(maxlen=max_events)
+
+    def reset(self):
+        """Forget every sample, while other threads may be recording"""
+        with self._lock:
+            self.origin = time.perf_counter()
+            self._durations.clear()
+            self._totals.clear()
+            self._ticks.clear()
+            self._threads.clear()
+            self.events.clear()
+
+    def set_enabled(self, enabled):
+        self.enabled = bool(enabled)
+
+    def span(self, name):
+        """Context manager timing the enclosed block"""
+        if not self.enabled:
+            return NULL_SPAN
+        return _Span(self, name)
+
+    def record(self, name, start, end):
+        """Record a span measured with time.perf_counter()"""
+        if not self.enabled:
+            return
+        with self._lock:
+            durations = self._durations.get(name)
+            if durations is None:
+                durations = self._durations[name] = deque(maxlen=self.window)
+            durations.append(end - start)
+            self._totals[name] = self._totals.get(name, 0) + 1
+        thread = threading.get_ident()
+        if thread not in self._threads:
+            self._threads[thread] = threading.current_thread().name
+        self.events.append((name, thread, start, end))
+
+    def tick(self, name):
+        """Count one occurrence of a periodic event, e.g. a displayed frame"""
+        if not self.enabled:
+            return
+        ticks = self._ticks.get(name)
+        if ticks is None:
+            with self._lock:
+                ticks = self._ticks.setdefault(name, deque(maxlen=self.window))
+        ticks.append(time.perf_counter())
+
+    def rate(self, name, horizon=2.0):
+        """Events per second over the last `horizon` seconds"""
+        ticks = self._ticks.get(name)
+        if not ticks:
+            return 0.0
+        now = time.perf_counter()
+        recent = [t for t in list(ticks) if now - t <= horizon]
+        if len(recent) < 2:
+            return 0.0
+        return (len(recent) - 1) / (recent[-1] - recent[0])
+
+    def rates(self):
+        return {name: self.rate(name) for name in list(self._ticks)}
+
+    def stage_stats(self):
+        """name -> count, mean and p50/p95/p99/max in milliseconds"""
+        with self._lock:
+            samples_by_name = {name: list(durations) for name, durations in self._durations.items()}
+            totals = dict(self._totals)
+        stats = {}
+        for name, samples in samples_by_name.items():
+            samples = np.array(samples) * 1000.0
+            if samples.size == 0:
+                continue
+            p50, p95, p99 = np.percentile(samples, (50, 95, 99))
+            stats[name] = {"count": totals.get(name, 0), "mean_ms": samples.mean(),
+                           "p50_ms": p50, "p95_ms": p95, "p99_ms": p99,
+                           "max_ms": samples.max()}
+        return stats
+
+    def export_csv(self, file_name):
+        """Write every logged span as name, thread, start_ms, duration_ms"""
+        threads = dict(self._threads)
+        with open(file_name, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["name", "thread", "start_ms", "duration_ms"])
+            for name, thread, start, end in list(self.events):
+                writer.writerow([name, threads.get(thread, thread),
+                                 f"{(start - self.origin) * 1000:.3f}",
+                                 f"{(end - start) * 1000:.3f}"])
+
+    def export_chrome_trace(self, file_name):
+        """Write the event log in the Chrome trace event format"""
+        pid = os.getpid()
+        trace = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": thread,
+                  "args": {"name": name}} for thread, name in dict(self._threads).items()]
+        for name, thread, start, end in list(self.events):
+            trace.append({"name": name, "ph": "X", "pid": pid, "tid": thread,
+                          "ts": (start - self.origin) * 1e6, "dur": (end - start) * 1e6})
+        with open(file_name, "w") as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+
+
+# Shared by the capture, processing and display code
+PROFILER = Profiler()
@@ -0,0 +1,178 @@
+"""
+Fast K-means colour segmentation.
+Instead of clustering every pixel with cv2.kmeans, the centres are fitted
+with a weighted Lloyd iteration on a colour histogram (5 bits per channel,
+built from at most FIT_SAMPLE_PIXELS pixels), which has a few thousand
+occupied bins whatever the image size. Every pixel is then labelled with an
+exact, vectorized nearest-centre pass: gray images through a lookup table,
+colour images through a table over the histogram cells, where only pixels
+in cells that straddle a cluster boundary are compared with the centres. On
+video the fit starts from the previous frame's centres, so it converges in
+an iteration or two and the clusters keep their colours from frame to frame.
+"""
+import math
+
+import cv2
+import numpy as np
+
+HISTOGRAM_BITS = 5
+
+# The histogram is built from a strided sample of at most this many pixels
+FIT_SAMPLE_PIXELS = 1 << 20
+
+# Pixels labelled per block of the nearest-centre pass
+ASSIGN_CHUNK = 1 << 16
+
+# Label of histogram cells that contain pixels of more than one cluster
+MIXED = 255
+
+_cell_corners = None
+
+
+def colour_histogram(image, bits=HISTOGRAM_BITS):
+    """
+    Occupied bins of the colour histogram of an 8-bit image as
+    (bin colours float32 (M, channels), pixel counts float32 (M,)).
+    Gray images use all 256 levels, colour images `bits` bits per channel.
+    """
+    step = max(1, math.ceil(math.sqrt(image.shape[0] * image.shape[1] / FIT_SAMPLE_PIXELS)))
+    sample = image[::step, ::step]
+    if sample.ndim == 2:
+        counts = cv2.calcHist([np.ascontiguousarray(sample)], [0], None, [256], [0, 256]).ravel()
+        occupied = np.flatnonzero(counts)
+        return occupied.astype(np.float32)[:, None], counts[occupied]
+    shift = 8 - bits
+    channels = sample.shape[2]
+    index = np.zeros(sample.shape[:2], np.int64)
+    for c in range(channels):
+        index <<= bits
+        index |= sample[:, :, c] >> shift
+    counts = np.bincount(index.ravel(), minlength=1 << (bits * channels)).astype(np.float32)
+    occupied = np.flatnonzero(counts)
+    colours = np.empty((len(occupied), channels), np.float32)
+    mask = (1 << bits) - 1
+    for c in range(channels):
+        # Bin centres, channel 0 in the most significant bits
+        colours[:, c] = ((occupied >> (bits * (channels - 1 - c))) & mask) * (1 << shift)
+    colours += (1 << shift) / 2.0
+    return colours, counts[occupied]
+
+
+def init_centres(colours, weights, k, seed=0):
+    """Weighted k-means++ seeding over the histogram bins"""
+    rng = np.random.default_rng(seed)
+    centres = [colours[int(np.argmax(weights))]]
+    nearest = ((colours - centres[0]) ** 2).sum(axis=1)
+    for _ in range(1, min(k, len(colours))):
+        p = weights * nearest
+        total = p.sum()
+        if total <= 0:
+            break
+        choice = int(np.searchsorted(np.cumsum(p), rng.random() * total))
+        centres.append(colours[min(choice, len(colours) - 1)])
+        nearest = np.minimum(nearest, ((colours - centres[-1]) ** 2).sum(axis=1))
+    while len(centres) < k:
+        # Fewer distinct colours than clusters
+        centres.append(centres[-1])
+    return np.array(centres, np.float32)
+
+
+def nearest_centre(points, centres):
+    """Index of the nearest centre of every row of points"""
+    # |x - c|^2 = |x|^2 - 2 x.c + |c|^2, and |x|^2 does not change the argmin
+    scores = points @ (-2.0 * centres.T) + (centres * centres).sum(axis=1)
+    return scores.argmin(axis=1)
+
+
+def fit(colours, weights, centres, iterations, eps=0.5):
+    """
+    Weighted Lloyd iterations from the given centres; stops early when no
+    centre moves by more than eps. Returns (centres, iterations run).
+    """
+    centres = centres.copy()
+    k = len(centres)
+    for iteration in range(1, iterations + 1):
+        labels = nearest_centre(colours, centres)
+        mass = np.bincount(labels, weights=weights, minlength=k)
+        updated = np.empty_like(centres)
+        for c in range(centres.shape[1]):
+            updated[:, c] = np.bincount(labels, weights=weights * colours[:, c], minlength=k)
+        empty = mass == 0
+        updated[~empty] /= mass[~empty, None]
+        if empty.any():
+            # Re-seed empty clusters at the worst represented colours
+            error = weights * ((colours - centres[labels]) ** 2).sum(axis=1)
+            worst = np.argsort(error)[::-1][:int(empty.sum())]
+            updated[empty] = colours[worst]
+        shift = np.abs(updated - centres).max()
+        centres = updated
+        if shift <= eps:
+            break
+    return centres, iteration
+
+
+def cell_corners(bits=HISTOGRAM_BITS):
+    """The 8 corner colours of every 3-channel histogram cell, (cells * 8, 3)"""
+    global _cell_corners
+    if _cell_corners is None or _cell_corners[0] != bits:
+        size = 1 << (8 - bits)
+        low = np.arange(1 << bits, dtype=np.float32) * size
+        edges = np.stack([low, low + size - 1], axis=1).ravel()
+        grid = np.stack(np.meshgrid(edges, edges, edges, indexing="ij"), axis=-1)
+        n = 1 << bits
+        # (cell b, corner b, cell g, corner g, cell r, corner r) -> cell-major order
+        grid = grid.reshape(n, 2, n, 2, n, 2, 3).transpose(0, 2, 4, 1, 3, 5, 6)
+        _cell_corners = (bits, np.ascontiguousarray(grid.reshape(-1, 3)))
+    return _cell_corners[1]
+
+
+def cell_labels(centres, bits=HISTOGRAM_BITS):
+    """
+    Label of every histogram cell, or MIXED where the corners of the cell
+    have different nearest centres. Clusters are convex, so a cell whose
+    corners agree lies entirely in one of them.
+    """
+    corners = nearest_centre(cell_corners(bits), centres).reshape(-1, 8)
+    uniform = (corners == corners[:, :1]).all(axis=1)
+    return np.where(uniform, corners[:, 0], MIXED).astype(np.uint8)
+
+
+def assign(image, centres, labels):
+    """Label every pixel of image with its nearest centre into labels (uint8, H x W)"""
+    if image.ndim == 2:
+        table = nearest_centre(np.arange(256, dtype=np.float32)[:, None], centres)
+        return cv2.LUT(image, table.astype(np.uint8), dst=labels)
+    pixels = image.reshape(-1, image.shape[2])
+    flat = labels.reshape(-1)
+    if image.shape[2] == 3:
+        shift = 8 - HISTOGRAM_BITS
+        quantized = image >> shift
+        index = quantized[:, :, 0].astype(np.uint16) << (2 * HISTOGRAM_BITS)
+        index |= quantized[:, :, 1].astype(np.uint16) << HISTOGRAM_BITS
+        index |= quantized[:, :, 2]
+        np.take(cell_labels(centres), index.reshape(-1), out=flat)
+        mixed = np.flatnonzero(flat == MIXED)
+    else:
+        mixed = None
+    for start in range(0, len(pixels) if mixed is None else len(mixed), ASSIGN_CHUNK):
+        if mixed is None:
+            rows = slice(start, start + ASSIGN_CHUNK)
+        else:
+            rows = mixed[start:start + ASSIGN_CHUNK]
+        flat[rows] = nearest_centre(pixels[rows].astype(np.float32), centres)
+    return labels
+
+
+def segment(image, k, iterations, labels, centres=None):
+    """
+    Cluster the colours of an 8-bit image into k groups. centres from the
+    previous frame warm-start the fit. Returns (labels, centres, iterations).
+    Raises ValueError for other depths, whose colours the histogram cannot hold.
+    """
+    if image.dtype != np.uint8:
+        raise ValueError(f"K-means segmentation needs an 8-bit image, got {image.dtype}")
+    colours, weights = colour_histogram(image)
+    if centres is None or centres.shape != (k, colours.shape[1]):
+        centres = init_centres(colours, weights, k)
+    centres, iterations = fit(colours, weights, centres, iterations)
+    return assign(image, centres, labels), centres, iterations
@@ -0,0 +1,57 @@
+"""
+Grid of video panes for watching several sources at once.
+Each pane renders one source through its own ImageDisplay and shows a
+caption with that source's frame rates and latency. Panes are laid out in
+the squarest grid that holds every source.
+"""
+import math
+
+from PyQt6.QtCore import Qt
+from PyQt6.QtWidgets import QGridLayout, QGroupBox, QLabel, QSizePolicy, QVBoxLayout, QWidget
+
+from display import ImageDisplay
+
+
+class SourcePane(QGroupBox):
+    """One source: its frames and a status line"""
+    def __init__(self, title, parent=None):
+        super().__init__(title, parent)
+        layout = QVBoxLayout(self)
+        self.image_label = QLabel()
+        self.image_label.setMinimumSize(160, 120)
+        self.image_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        # Frames are scaled to the label, so it must not grow to fit them
+        self.image_label.setSizePolicy(QSizePolicy.Policy.Ignored, QSizePolicy.Policy.Ignored)
+        self.status_label = QLabel()
+        layout.addWidget(self.image_label, 1)
+        layout.addWidget(self.status_label)
+        self.display = ImageDisplay(self.image_label)
+
+    def show_frame(self, image, key=None):
+        self.display.show(image, key)
+
+    def set_status(self, text):
+        self.status_label.setText(text)
+
+
+class SourceGrid(QWidget):
+    """Panes of every open source in rows and columns"""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.grid = QGridLayout(self)
+        self.panes = []
+
+    def set_sources(self, titles):
+        """Replace the panes with one per title"""
+        self.clear()
+        columns = max(1, math.ceil(math.sqrt(len(titles))))
+        for i, title in enumerate(titles):
+            pane = SourcePane(title)
+            self.grid.addWidget(pane, i // columns, i % columns)
+            self.panes.append(pane)
+
+    def clear(self):
+        for pane in self.panes:
+            self.grid.removeWidget(pane)
+            pane.deleteLater()
+        self.panes = []
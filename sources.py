@@ -0,0 +1,169 @@
+"""
+Capture sources for monitoring several cameras and files at once.
+open_capture() turns a source spec into a cv2.VideoCapture-like object: a
+webcam index, a video file, or an image sequence (a directory or a glob
+pattern of image files). A Source owns one capture, its FrameGrabber thread
+and, for files, a FramePacer, so every source costs one thread and one ring
+of frame buffers and sources can be added without slowing the others down.
+"""
+import glob
+import os
+import re
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from capture import FrameGrabber
+from pacing import DEFAULT_FPS, FramePacer, source_fps
+
+SEQUENCE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp")
+
+
+def _natural_key(path):
+    """Sort key putting frame_2.png before frame_10.png"""
+    return [int(part) if part.isdigit() else part.lower()
+            for part in re.split(r"(\d+)", path)]
+
+
+def sequence_files(spec):
+    """Image files of a directory or a glob pattern, in natural order"""
+    if os.path.isdir(spec):
+        files = [os.path.join(spec, name) for name in os.listdir(spec)]
+    else:
+        files = glob.glob(spec)
+    return sorted((f for f in files if f.lower().endswith(SEQUENCE_EXTENSIONS)),
+                  key=_natural_key)
+
+
+class ImageSequenceCapture:
+    """A list of image files read through the cv2.VideoCapture interface"""
+    def __init__(self, files, fps=DEFAULT_FPS):
+        self.files = list(files)
+        self.fps = fps
+        self.position = 0
+
+    def isOpened(self):
+        return bool(self.files)
+
+    def grab(self):
+        if self.position >= len(self.files):
+            return False
+        self.position += 1
+        return True
+
+    def read(self, image=None):
+        """Decode the next file, into image when it has the right shape"""
+        while self.position < len(self.files):
+            frame = cv2.imread(self.files[self.position])
+            self.position += 1
+            if frame is None:
+                # Skip files that are not images instead of ending the sequence
+                continue
+            if image is not None and image.shape == frame.shape and image.dtype == frame.dtype:
+                np.copyto(image, frame)
+                return True, image
+            return True, frame
+        return False, None
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(len(self.files))
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.position)
+        return 0.0
+
+    def set(self, prop, value):
+        return False
+
+    def release(self):
+        self.files = []
+
+
+def open_capture(spec):
+    """
+    Open a source spec as (capture, live). Digits select a webcam, a
+    directory or a pattern with * ? [ an image sequence, anything else is
+    opened as a video file. Raises ValueError when nothing can be read.
+    """
+    spec = spec.strip()
+    if spec.isdigit():
+        capture, live = cv2.VideoCapture(int(spec)), True
+    elif os.path.isdir(spec) or glob.has_magic(spec):
+        capture, live = ImageSequenceCapture(sequence_files(spec)), False
+    else:
+        capture, live = cv2.VideoCapture(spec), False
+    if not capture.isOpened():
+        capture.release()
+        raise ValueError(f"Could not open source: {spec}")
+    return capture, live
+
+
+class RateMeter:
+    """Events per second over a sliding time window"""
+    def __init__(self, window=128):
+        self._ticks = deque(maxlen=window)
+
+    def tick(self):
+        self._ticks.append(time.perf_counter())
+
+    def rate(self, horizon=2.0):
+        since = time.perf_counter() - horizon
+        return sum(1 for t in self._ticks if t >= since) / horizon
+
+
+class Source:
+    """
+    One capture source running on its own grabber thread.
+    Files and image sequences play at their own frame rate; webcams deliver
+    their newest frame. plan is the CompiledPipeline the owner runs on this
+    source's frames, so temporal operations keep per-source state.
+    """
+    def __init__(self, spec):
+        self.spec = spec.strip()
+        self.name = os.path.basename(self.spec.rstrip("/\\")) or self.spec
+        if self.spec.isdigit():
+            self.name = f"Webcam {self.spec}"
+        self.capture, self.live = open_capture(self.spec)
+        fps = source_fps(self.capture)
+        self.pacer = None if self.live else FramePacer(fps)
+        self.grabber = FrameGrabber(self.capture, live=self.live,
+                                    late_after=2.0 / fps if self.live else None,
+                                    pacer=self.pacer)
+        self.plan = None
+        self.ended = False
+        self.input_rate = RateMeter()
+
+    @property
+    def fps(self):
+        return source_fps(self.capture)
+
+    def start(self):
+        self.grabber.start()
+
+    def latest(self):
+        """(frame, FrameInfo) of the frame to show now, or None"""
+        pacer = self.pacer
+        due = pacer.due_index() if pacer is not None and pacer.started else None
+        latest = self.grabber.latest(due)
+        if latest is not None:
+            if pacer is not None and not pacer.started:
+                pacer.start(latest[1].index)
+            self.input_rate.tick()
+        return latest
+
+    def exhausted(self):
+        return self.grabber.exhausted()
+
+    def stats(self):
+        """Capture counters and the rate at which frames were taken"""
+        stats = self.grabber.stats()
+        stats["input_fps"] = self.input_rate.rate()
+        return stats
+
+    def stop(self):
+        """Stop the grabber thread and release the capture"""
+        self.grabber.stop()
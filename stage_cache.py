@@ -0,0 +1,62 @@
+"""
+Memoization of intermediate pipeline results.
+CompiledPipeline.run(..., cache=, key=) stores the output of every stage
+under (input key, signatures of the stages up to it), so when a parameter of
+stage k changes only stages k..n run again. Entries are evicted least
+recently used first once the memory budget is exceeded.
+"""
+import threading
+from collections import OrderedDict
+
+from history import MB
+
+
+class StageCache:
+    """LRU cache of stage outputs bounded by budget_bytes"""
+    def __init__(self, budget_bytes=512 * MB):
+        self.budget_bytes = budget_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Cached array for key, or None"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, array):
+        """
+        Store an array that nobody will modify in place any more.
+        Arrays larger than the whole budget are not cached.
+        """
+        if array.nbytes > self.budget_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._entries[key] = array
+            self._bytes += array.nbytes
+            while self._bytes > self.budget_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def usage(self):
+        """Bytes held by cached results"""
+        return self._bytes
@@ -0,0 +1,19 @@
+import os
+
+import pytest
+
+from batch import output_paths
+
+
+def test_outputs_mirror_the_input_directories(tmp_path):
+    files = [str(tmp_path / "a" / "img.png"), str(tmp_path / "b" / "img.png")]
+    outputs = output_paths(files, "out")
+    assert outputs[files[0]] == os.path.join("out", "a", "img.png")
+    assert outputs[files[1]] == os.path.join("out", "b", "img.png")
+
+
+def test_colliding_outputs_are_rejected(tmp_path):
+    files = [str(tmp_path / "img.png"), str(tmp_path / "img.tif")]
+    assert len(set(output_paths(files, "out").values())) == 2
+    with pytest.raises(ValueError, match="both be written"):
+        output_paths(files, "out", ".png")
@@ -0,0 +1,47 @@
+import numpy as np
+
+from history import HistoryStore
+
+
+def frames(count, shape=(64, 64, 3)):
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, shape, dtype=np.uint8) for _ in range(count)]
+
+
+def spilling_store():
+    # Room for about two compressed snapshots in RAM, the rest spills to disk
+    return HistoryStore(budget_bytes=40000, keyframe_interval=3, spill_budget_bytes=60000)
+
+
+def test_iterator_survives_clear():
+    store = spilling_store()
+    images = frames(6)
+    for image in images:
+        store.append(image)
+    assert store.usage()[1] > 0
+    iterator = iter(store)
+    first = next(iterator)
+    store.clear()
+    rest = list(iterator)
+    for expected, image in zip(images, [first] + rest):
+        np.testing.assert_array_equal(expected, image)
+    assert len(rest) == 5
+    assert not store._retired
+
+
+def test_iterator_survives_eviction_and_compaction():
+    store = spilling_store()
+    images = frames(30)
+    for image in images[:6]:
+        store.append(image)
+    iterator = iter(store)
+    first = next(iterator)
+    # Spills, evicts and compacts the spill file while the iterator is open
+    for image in images[6:]:
+        store.append(image)
+    store.pop()
+    assert store.evicted > 0
+    snapshot = [first] + list(iterator)
+    assert len(snapshot) == 6
+    for expected, image in zip(images, snapshot):
+        np.testing.assert_array_equal(expected, image)
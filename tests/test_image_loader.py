@@ -0,0 +1,34 @@
+import cv2
+import numpy as np
+import pytest
+
+from image_loader import is_mapped, load_image
+from pipeline import OPERATIONS, Pipeline, get_operation
+
+
+def write_tiff(path, dtype):
+    rng = np.random.default_rng(0)
+    top = np.iinfo(dtype).max
+    coarse = rng.integers(0, top, (12, 16, 3), dtype=np.uint64).astype(dtype)
+    image = cv2.resize(coarse, (320, 240), interpolation=cv2.INTER_LINEAR)
+    # Uncompressed, so the file is memory-mapped rather than decoded
+    assert cv2.imwrite(str(path), image, [cv2.IMWRITE_TIFF_COMPRESSION, 1])
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.uint16])
+def test_tiff_loads_as_8bit_bgr_and_runs_every_operation(tmp_path, dtype):
+    path = tmp_path / f"image_{np.dtype(dtype).name}.tif"
+    write_tiff(path, dtype)
+
+    image = load_image(str(path))
+    assert is_mapped(image)
+    assert image.dtype == np.uint8 and image.shape == (240, 320, 3)
+    decoded = cv2.imread(str(path))
+    assert np.abs(image.astype(int) - decoded).max() <= 1
+
+    get_operation("Gaussian Blur")  # loads the built-in operations
+    for name, op in OPERATIONS.items():
+        if not op.available():
+            continue
+        result = Pipeline([(name, {})]).compile().run(image)
+        assert result.dtype == np.uint8, name
@@ -0,0 +1,155 @@
+import random
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+import operations
+from features import FeatureTracker
+from pipeline import Pipeline
+from segmentation import segment
+
+
+def moving_frames(count, shape=(120, 160, 3)):
+    rng = np.random.default_rng(0)
+    scene = rng.integers(0, 256, (shape[0], shape[1] + count, 3), dtype=np.uint8)
+    return [np.ascontiguousarray(scene[:, i:i + shape[1]]) for i in range(count)]
+
+
+def run_on_workers(plan, frames, workers=3, jitter=0.0):
+    """Run frames on worker threads; tickets are taken in frame order"""
+    frames = iter(frames)
+    lock = threading.Lock()
+    rng = random.Random(0)
+
+    def worker():
+        while True:
+            with lock:
+                frame = next(frames, None)
+                ticket = plan.ticket()
+                delay = rng.uniform(0, jitter)
+            if frame is None:
+                plan.release(ticket)
+                return
+            # Workers reach the plan in any order
+            time.sleep(delay)
+            plan.run(frame, ticket=ticket)
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_temporal_stages_see_frames_in_ticket_order(monkeypatch):
+    trackers = []
+
+    class RecordingTracker(FeatureTracker):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.seen = []
+            trackers.append(self)
+
+        def update(self, gray):
+            self.seen.append(int(gray[0, 0]))
+            return super().update(gray)
+
+    monkeypatch.setattr(operations, "FeatureTracker", RecordingTracker)
+    frames = moving_frames(24)
+    for i, frame in enumerate(frames):
+        frame[0, 0] = i
+    pipeline = Pipeline([("Gaussian Blur", {"ksize": 1}), ("ORB", {})])
+    pipeline.set_keyframe_interval(10)
+    run_on_workers(pipeline.compile(), frames, workers=4, jitter=0.005)
+    assert len(trackers) == 1
+    assert trackers[0].seen == list(range(24))
+
+
+def test_released_and_failed_tickets_do_not_block_later_runs():
+    pipeline = Pipeline([("ORB", {})])
+    pipeline.set_keyframe_interval(10)
+    plan = pipeline.compile()
+    dropped, failed = plan.ticket(), plan.ticket()
+    plan.release(dropped)
+    with pytest.raises(Exception):
+        plan.run(np.zeros((8, 8, 3), np.uint16), ticket=failed)
+    done = threading.Event()
+    thread = threading.Thread(target=lambda: (plan.run(moving_frames(1)[0]), done.set()))
+    thread.start()
+    assert done.wait(5)
+
+
+def test_tracker_measures_tracking_again_after_a_slow_frame():
+    tracker = FeatureTracker(cv2.ORB_create(), keyframe_interval=5)
+    frames = [cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for frame in moving_frames(16)]
+    for gray in frames[:3]:
+        tracker.update(gray)
+    # One tracked frame far slower than detection switches to detecting...
+    tracker._track_cost = 1e9
+    assert not tracker.stats()["tracking"]
+    # ...until the next probe measures tracking afresh
+    for gray in frames[3:]:
+        tracker.update(gray)
+    assert tracker._track_cost < 1e9
+
+
+def test_kmeans_centres_are_kept_on_the_plan():
+    pipeline = Pipeline([("K-means", {"k": 3})])
+    pipeline.set_keyframe_interval(10)
+    plan = pipeline.compile()
+    run_on_workers(plan, moving_frames(6))
+    centres = plan.stages[0].state["centres"]
+    assert centres.shape == (3, 3)
+
+
+def test_segment_rejects_16_bit_images():
+    image = np.zeros((8, 8, 3), np.uint16)
+    with pytest.raises(ValueError, match="8-bit"):
+        segment(image, 3, 5, np.empty((8, 8), np.uint8))
+
+
+def test_fused_adaptive_tables_match_unfused_stages_on_stills():
+    rng = np.random.default_rng(1)
+    image = rng.integers(40, 200, (600, 700, 3), dtype=np.uint8)
+    steps = [("Histogram Equalization", {}), ("Contrast Stretching", {})]
+    plan = Pipeline(steps).compile()
+    assert plan.names() == ["LUT(Histogram Equalization + Contrast Stretching)"]
+    expected = image
+    for step in steps:
+        expected = Pipeline([step]).compile().run(expected).copy()
+    np.testing.assert_array_equal(plan.run(image), expected)
+
+
+def test_lone_adaptive_stage_refreshes_its_table_on_the_interval():
+    pipeline = Pipeline([("Histogram Equalization", {})])
+    assert pipeline.compile().names() == ["Histogram Equalization"]
+    pipeline.set_lut_refresh_interval(5)
+    plan = pipeline.compile()
+    assert plan.names() == ["LUT(Histogram Equalization)"]
+    dark, bright = np.full((8, 8), 10, np.uint8), np.full((8, 8), 200, np.uint8)
+    dark[0, 0] = 20
+    plan.run(dark)
+    # The table built on the first frame is reused for the next four
+    np.testing.assert_array_equal(plan.run(bright), np.full((8, 8), 255, np.uint8))
+
+
+@pytest.mark.parametrize("level", [0, 77, 255])
+def test_equalization_keeps_a_constant_image_like_opencv(level):
+    image = np.full((16, 16), level, np.uint8)
+    expected = cv2.equalizeHist(image)
+    np.testing.assert_array_equal(expected, image)
+    result = Pipeline([("Histogram Equalization", {})]).compile().run(image)
+    np.testing.assert_array_equal(result, expected)
+
+
+@pytest.mark.parametrize("params", [
+    {"ksize": 5.7},
+    {"ksize": "5"},
+    {"ksize": True},
+])
+def test_loaded_parameters_are_not_coerced(params):
+    with pytest.raises(ValueError, match="expected int"):
+        Pipeline.from_dict({"steps": [{"op": "Gaussian Blur", "params": params}]})
@@ -0,0 +1,33 @@
+import numpy as np
+
+from processing_engine import OutputBuffers
+
+
+def test_buffers_are_reused_only_after_they_are_given_back():
+    buffers = OutputBuffers(size=2)
+    first = buffers.take((4, 4, 3))
+    second = buffers.take((4, 4, 3))
+    assert second is not first
+    buffers.give_back(first)
+    assert buffers.take((4, 4, 3)) is first
+    assert buffers.take((4, 4)) is not second
+    assert (buffers.allocated, buffers.reused) == (3, 1)
+
+
+def test_kept_and_foreign_arrays_are_never_reused():
+    buffers = OutputBuffers()
+    kept = buffers.take((4, 4))
+    buffers.keep(kept)
+    buffers.give_back(kept)
+    buffers.give_back(np.empty((4, 4), np.uint8))
+    assert buffers.take((4, 4)) is not kept
+    assert buffers.reused == 0
+
+
+def test_buffers_of_other_shapes_stay_free():
+    buffers = OutputBuffers()
+    small, large = buffers.take((2, 2)), buffers.take((4, 4))
+    buffers.give_back(small)
+    buffers.give_back(large)
+    assert buffers.take((4, 4)) is large
+    assert buffers.take((2, 2)) is small
@@ -0,0 +1,30 @@
+import threading
+
+from profiling import Profiler
+
+
+def test_counts_from_many_threads_are_exact():
+    profiler = Profiler()
+    profiler.set_enabled(True)
+
+    def work():
+        for _ in range(5000):
+            profiler.record("stage", 0.0, 0.001)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert profiler.stage_stats()["stage"]["count"] == 20000
+
+
+def test_reset_empties_in_place():
+    profiler = Profiler()
+    profiler.set_enabled(True)
+    lock, events = profiler._lock, profiler.events
+    profiler.record("stage", 0.0, 0.001)
+    profiler.tick("frame")
+    profiler.reset()
+    assert profiler._lock is lock and profiler.events is events
+    assert not events and profiler.stage_stats() == {} and profiler.rates() == {}
@@ -0,0 +1,60 @@
+import inspect
+
+import numpy as np
+import pytest
+
+from pipeline import OPERATIONS, CompiledPipeline, Pipeline, StageContext, get_operation
+from tiling import TiledExecutor
+
+get_operation("Gaussian Blur")  # loads the built-in operations
+
+
+def halo_cases():
+    """(operation name, params) at the smallest and largest sizes of every halo operation"""
+    for name, op in sorted(OPERATIONS.items()):
+        if op.halo is None or not op.available():
+            continue
+        sizes = [p for p in inspect.signature(op.halo).parameters
+                 if p in op.params and op.params[p].kind is int]
+        for end in ("minimum", "maximum"):
+            params = op.defaults()
+            for size in sizes:
+                params[size] = getattr(op.params[size], end)
+            yield pytest.param(name, params, id=f"{name}-{end}")
+
+
+def noise(height, width, seed=0):
+    return np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+
+@pytest.mark.parametrize("name,params", list(halo_cases()))
+def test_tiled_output_is_identical_to_untiled(name, params):
+    op = get_operation(name)
+    stage = CompiledPipeline([(op, op.resolve_params(params))]).stages[0]
+    halo = op.halo(**stage.params)
+    tile_size = 2 * halo + 32
+    # Three tiles across each way, the last ones cut short
+    image = noise(2 * tile_size + 21, 2 * tile_size + 13)
+
+    def func(tile):
+        return stage.func(tile, StageContext(), **stage.params)
+
+    executor = TiledExecutor(tile_size, workers=2, min_pixels=0)
+    try:
+        assert executor.accepts(image, halo)
+        tiled = executor.run(func, image, lambda shape, dtype: np.empty(shape, dtype), halo)
+    finally:
+        executor.shutdown()
+    np.testing.assert_array_equal(tiled, func(image))
+
+
+@pytest.mark.parametrize("steps", [
+    [("Bilateral Filter", {"diameter": 1})],
+    [("Gaussian Blur", {"ksize": 3}), ("Bilateral Filter", {"diameter": 1}),
+     ("Erosion", {"ksize": 3})],
+])
+def test_strips_match_whole_image_processing(steps):
+    plan = Pipeline(steps).compile()
+    image = noise(600, 200)
+    np.testing.assert_array_equal(plan.run_strips(image, rows=64),
+                                  plan.process(image))
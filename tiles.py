@@ -0,0 +1,149 @@
+"""
+Tiled multi-resolution viewer for large images.
+A TilePyramid cuts tiles lazily at power-of-two levels of detail straight
+from the base image, and a TiledImageView paints only the tiles that
+intersect the exposed part of the widget, keeping recently used tiles in an
+LRU cache, so zooming and panning cost the same whatever the image size.
+"""
+import math
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+from PyQt6.QtCore import QRectF, QSize
+from PyQt6.QtGui import QImage, QPainter, QPixmap
+from PyQt6.QtWidgets import QSizePolicy, QWidget
+
+from display import QIMAGE_FORMATS, to_uint8
+
+
+class TilePyramid:
+    """
+    Lazily evaluated image pyramid.
+    Level L has 1/2**L of the base resolution; a tile of level L is produced
+    from the matching base region with one integer-factor INTER_AREA resize,
+    so no level is ever built for the whole image.
+    """
+    def __init__(self, image, tile_size=256):
+        self.image = image
+        self.tile_size = tile_size
+        self.height, self.width = image.shape[:2]
+        self.max_level = max(0, math.ceil(math.log2(max(self.width, self.height) / tile_size)))
+
+    def level_for_zoom(self, zoom):
+        """Coarsest level whose resolution is still at least the zoom factor"""
+        if zoom >= 1.0:
+            return 0
+        return min(self.max_level, int(math.floor(math.log2(1.0 / zoom))))
+
+    def level_size(self, level):
+        scale = 1 << level
+        return -(-self.width // scale), -(-self.height // scale)
+
+    def tile_range(self, level):
+        width, height = self.level_size(level)
+        return -(-width // self.tile_size), -(-height // self.tile_size)
+
+    def tile(self, level, tx, ty):
+        """Tile (tx, ty) of a level as a contiguous 8-bit array"""
+        scale = 1 << level
+        span = self.tile_size * scale
+        x0, y0 = tx * span, ty * span
+        region = self.image[y0:min(y0 + span, self.height), x0:min(x0 + span, self.width)]
+        region = to_uint8(region)
+        if scale == 1:
+            return np.ascontiguousarray(region)
+        height, width = region.shape[:2]
+        # Crop to a multiple of the scale so OpenCV takes the integer fast path
+        out_w, out_h = max(1, width // scale), max(1, height // scale)
+        region = region[:out_h * scale, :out_w * scale]
+        return cv2.resize(region, (out_w, out_h), interpolation=cv2.INTER_AREA)
+
+
+class TiledImageView(QWidget):
+    """Zoomable image widget meant to live inside a QScrollArea"""
+    def __init__(self, tile_size=256, cache_tiles=256, parent=None):
+        super().__init__(parent)
+        self.tile_size = tile_size
+        self.cache_tiles = cache_tiles
+        self.pyramid = None
+        self.zoom = 1.0
+        self._key = None
+        self._cache = OrderedDict()
+        self.tiles_rendered = 0
+        self.setSizePolicy(QSizePolicy.Policy.Fixed, QSizePolicy.Policy.Fixed)
+
+    def set_image(self, image, key=None, copy=False):
+        """
+        Show a new image; key=None or a new key invalidates cached tiles.
+        Tiles are cut from the image later, while painting, so pass copy=True
+        when it is only valid during the call (a capture ring buffer slot).
+        """
+        if image is None:
+            return
+        if key is not None and key == self._key and self.pyramid is not None:
+            return
+        self._key = key
+        self._cache.clear()
+        self.pyramid = TilePyramid(image.copy() if copy else image, self.tile_size)
+        self._update_size()
+        self.update()
+
+    def set_zoom(self, zoom):
+        self.zoom = zoom
+        self._update_size()
+        self.update()
+
+    def content_size(self):
+        if self.pyramid is None:
+            return QSize(0, 0)
+        return QSize(max(1, round(self.pyramid.width * self.zoom)),
+                     max(1, round(self.pyramid.height * self.zoom)))
+
+    def sizeHint(self):
+        return self.content_size()
+
+    def _update_size(self):
+        self.resize(self.content_size())
+
+    def _tile_pixmap(self, level, tx, ty):
+        key = (level, tx, ty)
+        pixmap = self._cache.get(key)
+        if pixmap is not None:
+            self._cache.move_to_end(key)
+            return pixmap
+        tile = self.pyramid.tile(level, tx, ty)
+        channels = 1 if tile.ndim == 2 else tile.shape[2]
+        qt_image = QImage(tile.data, tile.shape[1], tile.shape[0], tile.strides[0],
+                          QIMAGE_FORMATS[channels])
+        pixmap = QPixmap.fromImage(qt_image)
+        self._cache[key] = pixmap
+        if len(self._cache) > self.cache_tiles:
+            self._cache.popitem(last=False)
+        self.tiles_rendered += 1
+        return pixmap
+
+    def paintEvent(self, event):
+        if self.pyramid is None:
+            return
+        pyramid = self.pyramid
+        level = pyramid.level_for_zoom(self.zoom)
+        # Widget pixels per pixel of the chosen level
+        scale = self.zoom * (1 << level)
+        step = pyramid.tile_size * scale
+        cols, rows = pyramid.tile_range(level)
+        exposed = event.rect()
+        tx0 = max(0, int(exposed.left() // step))
+        ty0 = max(0, int(exposed.top() // step))
+        tx1 = min(cols - 1, int(exposed.right() // step))
+        ty1 = min(rows - 1, int(exposed.bottom() // step))
+
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform, scale < 1.0)
+        for ty in range(ty0, ty1 + 1):
+            for tx in range(tx0, tx1 + 1):
+                pixmap = self._tile_pixmap(level, tx, ty)
+                target = QRectF(tx * step, ty * step,
+                                pixmap.width() * scale, pixmap.height() * scale)
+                painter.drawPixmap(target, pixmap, QRectF(pixmap.rect()))
+        painter.end()
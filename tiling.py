@@ -0,0 +1,131 @@
+"""
+Tiled multi-core execution of neighbourhood filters.
+The image is cut into tiles, each extended by a halo as wide as the reach of
+the filter, and the tiles are filtered on a thread pool (OpenCV releases the
+GIL). Only the core of each filtered tile is copied into the preallocated
+output, so the result is bit-identical to filtering the whole image: pixels
+near a tile seam see the same neighbours, and tiles touching the image edge
+get the same border handling.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_TILE_SIZE = 512
+
+# Rows per strip when a whole pipeline streams over a large image
+DEFAULT_STRIP_ROWS = 256
+
+def spans(length, size, halo):
+    """Yield (start, end, halo start, halo end) cutting length into pieces of size"""
+    for start in range(0, length, size):
+        end = min(start + size, length)
+        yield start, end, max(0, start - halo), min(length, end + halo)
+
+
+def strips(height, rows, halo):
+    """Yield (core, region) row ranges as (y0, y1) of strips of the given height"""
+    for y0, y1, r0, r1 in spans(height, rows, halo):
+        yield (y0, y1), (r0, r1)
+
+
+# Below this many pixels the per-tile overhead outweighs the parallelism
+MIN_TILED_PIXELS = 1 << 20
+
+
+class TiledExecutor:
+    """
+    Thread pool running a filter over halo-extended tiles.
+    workers=None uses every core; with a single worker tiling is disabled.
+    """
+    def __init__(self, tile_size=DEFAULT_TILE_SIZE, workers=None, min_pixels=MIN_TILED_PIXELS):
+        self._pool = None
+        self._lock = threading.Lock()
+        self.workers = 0
+        self.configure(tile_size, workers or 0, min_pixels)
+
+    def configure(self, tile_size=None, workers=None, min_pixels=None):
+        """
+        Change the tile size, the worker count (0 = every core) or the size
+        threshold; settings passed as None are kept.
+        """
+        with self._lock:
+            if tile_size is not None:
+                self.tile_size = max(16, int(tile_size))
+            if min_pixels is not None:
+                self.min_pixels = min_pixels
+            if workers is not None:
+                workers = workers or os.cpu_count() or 1
+                if workers != self.workers:
+                    if self._pool is not None:
+                        self._pool.shutdown(wait=False)
+                    self.workers = workers
+                    self._pool = (ThreadPoolExecutor(workers, thread_name_prefix="tile")
+                                  if workers > 1 else None)
+
+    @property
+    def enabled(self):
+        return self._pool is not None
+
+    def accepts(self, image, halo):
+        """True when tiling image with this halo is worthwhile"""
+        return (self._pool is not None and halo is not None
+                and image.shape[0] * image.shape[1] >= self.min_pixels
+                and 2 * halo < self.tile_size)
+
+    def tiles(self, height, width, halo):
+        """Yield (core, region) rectangles as (y0, y1, x0, x1)"""
+        columns = list(spans(width, self.tile_size, halo))
+        for y0, y1, ry0, ry1 in spans(height, self.tile_size, halo):
+            for x0, x1, rx0, rx1 in columns:
+                yield (y0, y1, x0, x1), (ry0, ry1, rx0, rx1)
+
+    def run(self, func, src, dst, halo):
+        """
+        Fill dst with func(src) computed tile by tile.
+        func maps an image to a filtered image of the same height and width
+        and must only look at pixels within `halo` of each output pixel. dst
+        is an array or a function (shape, dtype) -> array called once the
+        first tile shows the channels and type of the output.
+        """
+        height, width = src.shape[:2]
+        tiles = self.tiles(height, width, halo)
+        core, region = next(tiles)
+        out = func(self._crop(src, region))
+        if callable(dst):
+            dst = dst((height, width) + out.shape[2:], out.dtype)
+        self._store(dst, out, core, region)
+        futures = [self._pool.submit(self._run_tile, func, src, dst, core, region)
+                   for core, region in tiles]
+        for future in futures:
+            future.result()
+        return dst
+
+    @staticmethod
+    def _crop(image, region):
+        ry0, ry1, rx0, rx1 = region
+        return image[ry0:ry1, rx0:rx1]
+
+    @staticmethod
+    def _store(dst, out, core, region):
+        y0, y1, x0, x1 = core
+        ry0, _, rx0, _ = region
+        dst[y0:y1, x0:x1] = out[y0 - ry0:y1 - ry0, x0 - rx0:x1 - rx0]
+
+    @classmethod
+    def _run_tile(cls, func, src, dst, core, region):
+        cls._store(dst, func(cls._crop(src, region)), core, region)
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self._pool = None
+            # A later configure() with any worker count starts a new pool
+            self.workers = 0
+
+
+# Used by CompiledPipeline for operations registered with a halo. It starts
+# without a pool, so processes that never enable it (batch workers, which get
+# their parallelism from the process pool) do not start a thread per core
+TILED = TiledExecutor(workers=1)
@@ -0,0 +1,178 @@
+"""
+Pipelined video-to-video export.
+Decoding, processing and encoding run concurrently: a decode thread feeds
+frames to a worker pool, and an encode thread writes the results in their
+original order with cv2.VideoWriter. The stages are linked by bounded
+buffer pools, so memory stays constant however long the video is. Frames
+take plan tickets as they are decoded, so temporal stages (feature
+tracking, K-means warm starts) still see them in order.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+FOURCC_BY_EXTENSION = {".avi": "MJPG", ".mp4": "mp4v", ".mov": "mp4v", ".mkv": "mp4v"}
+
+
+class VideoExportJob:
+    """
+    Run a CompiledPipeline over every frame of a video file.
+    start() returns immediately; poll progress() and finished, or wait().
+    The plan should not be shared with other streams while the job runs,
+    see Pipeline.compile(shared=False).
+    """
+    def __init__(self, source_path, output_path, plan, workers=None,
+                 queue_size=8, fourcc=None):
+        self.source_path = source_path
+        self.output_path = output_path
+        self.plan = plan
+        self.workers = workers or max(1, os.cpu_count() or 1)
+        self.queue_size = queue_size
+        ext = os.path.splitext(output_path)[1].lower()
+        self.fourcc = fourcc or FOURCC_BY_EXTENSION.get(ext, "mp4v")
+
+        self.total_frames = 0
+        self.fps = 0.0
+        self.frames_done = 0
+        self.error = None
+        self.finished = threading.Event()
+        self._cancel = threading.Event()
+        self._started = None
+        self._threads = []
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def start(self):
+        capture = cv2.VideoCapture(self.source_path)
+        if not capture.isOpened():
+            raise ValueError(f"Could not open video file: {self.source_path}")
+        self.total_frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT)) or 0
+        self.fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+
+        # Every in-flight frame owns one input and one output buffer; the
+        # pools bound the pipeline depth and let buffers be reused
+        depth = self.queue_size + self.workers
+        self._free_inputs = queue.Queue()
+        self._free_outputs = queue.Queue()
+        for _ in range(depth):
+            self._free_inputs.put(None)
+            self._free_outputs.put(None)
+        self._ordered = queue.Queue(depth)
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="export")
+
+        self._started = time.perf_counter()
+        self._threads = [
+            threading.Thread(target=self._guard, args=(self._decode, capture), daemon=True),
+            threading.Thread(target=self._encode, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def cancel(self):
+        """Stop decoding; the output file is removed once the stages drain"""
+        self._cancel.set()
+
+    def wait(self, timeout=None):
+        return self.finished.wait(timeout)
+
+    def progress(self):
+        """(frames done, total frames, processing fps, seconds remaining or None)"""
+        if self._started is None:
+            return 0, self.total_frames, 0.0, None
+        elapsed = time.perf_counter() - self._started
+        rate = self.frames_done / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if rate > 0 and self.total_frames:
+            eta = max(0.0, (self.total_frames - self.frames_done) / rate)
+        return self.frames_done, self.total_frames, rate, eta
+
+    def _guard(self, stage, *args):
+        try:
+            stage(*args)
+        except Exception as e:
+            if self.error is None:
+                self.error = e
+            self._cancel.set()
+
+    def _decode(self, capture):
+        try:
+            while not self._cancel.is_set():
+                buf = self._free_inputs.get()
+                ret, frame = capture.read() if buf is None else capture.read(buf)
+                if not ret:
+                    break
+                ticket = self.plan.ticket()
+                try:
+                    future = self._executor.submit(self._process, frame, ticket)
+                except BaseException:
+                    self.plan.release(ticket)
+                    raise
+                self._ordered.put((future, ticket))
+        finally:
+            capture.release()
+            self._ordered.put(None)
+
+    def _process(self, frame, ticket):
+        try:
+            out = self._free_outputs.get()
+            if out is None or out is frame:
+                out = np.empty_like(frame)
+            return frame, self.plan.run(frame, out=out, ticket=ticket)
+        finally:
+            # run() releases the ticket too; this covers failures before it
+            self.plan.release(ticket)
+
+    def _encode(self):
+        writer = None
+        try:
+            while True:
+                item = self._ordered.get()
+                if item is None:
+                    break
+                future, ticket = item
+                if not self._cancel.is_set():
+                    try:
+                        frame, result = future.result()
+                        if writer is None:
+                            writer = self._open_writer(result)
+                        if result.dtype != np.uint8:
+                            result = cv2.convertScaleAbs(result)
+                        writer.write(result)
+                    except Exception as e:
+                        if self.error is None:
+                            self.error = e
+                        self._cancel.set()
+                    else:
+                        self.frames_done += 1
+                        self._free_inputs.put(frame)
+                        self._free_outputs.put(result)
+                        continue
+                # Cancelled or failed: drain the queue and keep the decoder
+                # from blocking on an empty buffer pool
+                if future.cancel():
+                    # Never run, so later frames must not wait for it
+                    self.plan.release(ticket)
+                self._free_inputs.put(None)
+                self._free_outputs.put(None)
+        finally:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            if writer is not None:
+                writer.release()
+            if self._cancel.is_set() and os.path.exists(self.output_path):
+                os.remove(self.output_path)
+            self.finished.set()
+
+    def _open_writer(self, first):
+        height, width = first.shape[:2]
+        writer = cv2.VideoWriter(self.output_path, cv2.VideoWriter_fourcc(*self.fourcc),
+                                 self.fps, (width, height), first.ndim == 3)
+        if not writer.isOpened():
+            raise ValueError(f"Could not open video writer for: {self.output_path}")
+        return writer